@@ -1,8 +1,14 @@
 from flask import Flask
 from flask_cors import CORS
 from .extensions import init_db, init_jwt, init_cloudinary
+from .search import init_search
+from .revocation import init_revocation
+from .cache import init_cache
+from .commands import register_commands
+from .routes.metrics import bp as metrics_bp
 from .routes.auth import bp as auth_bp
 from .routes.products import bp as products_bp
+from .routes.uploads import bp as uploads_bp
 import os
 from dotenv import load_dotenv
 
@@ -22,10 +28,16 @@ def create_app(config_object=None):
 
     init_db(app)
     init_jwt(app)
+    init_revocation(app)
     init_cloudinary(app)
+    init_search(app)
+    init_cache(app)
+    register_commands(app)
 
     # registrando blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(products_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(uploads_bp)
 
     return app
@@ -0,0 +1,73 @@
+from datetime import datetime
+from .models import User, Product, ImageJob
+from .cache import get_product_cache, invalidate_product_listings
+from .facets import record_change
+from .search import get_search_backend
+from .identity import invalidate_user
+from .extensions import get_pymongo_db
+
+# Contas com mais produtos que isso são removidas em segundo plano (ver delete_me)
+DEFAULT_SYNC_LIMIT = 500
+DEFAULT_CHUNK_SIZE = 500
+
+
+def purge_products(rows):
+    """
+    Remove em lote os produtos de rows (dicts do as_pymongo com _id, category
+    e estado_de_conservacao): um $pullAll nos favoritos de todos os usuários e
+    um delete_many nos produtos. Como o delete_many não dispara os sinais nem as
+    regras de remoção do mongoengine, os jobs de imagem (CASCADE), a busca, os
+    facets e o cache são atualizados aqui.
+    """
+    ids = [row["_id"] for row in rows]
+    if not ids:
+        return
+    db = get_pymongo_db()
+    db[User._get_collection_name()].update_many(
+        {"favorites": {"$in": ids}}, {"$pullAll": {"favorites": ids}}
+    )
+    db[Product._get_collection_name()].delete_many({"_id": {"$in": ids}})
+    # jobs pendentes guardam os bytes da imagem; sem o produto não têm onde gravar
+    db[ImageJob._get_collection_name()].delete_many({"product": {"$in": ids}})
+
+    backend = get_search_backend()
+    for product_id in ids:
+        backend.remove(product_id)
+
+    pairs = [(row.get("category"), row.get("estado_de_conservacao")) for row in rows]
+    record_change(removed=pairs)
+    invalidate_product_listings(*pairs)
+
+
+def delete_account(user_id, chunk_size=None):
+    """
+    Remove a conta e seus produtos não vendidos.
+    Com chunk_size os produtos são removidos em lotes desse tamanho (contas
+    grandes, em segundo plano); sem ele, todos em uma única chamada.
+    """
+    user = User.objects.get(id=user_id)
+
+    # Produtos não vendidos do usuário, lote a lote (cada lote some da consulta)
+    unsold = Product.objects(owner=user, buyer=None).only("category", "estado_de_conservacao").as_pymongo()
+    while True:
+        rows = list(unsold.limit(chunk_size) if chunk_size else unsold)
+        purge_products(rows)
+        if not chunk_size or len(rows) < chunk_size:
+            break
+
+    # Os favoritos do usuário deixam de contar em favorites_count
+    favorite_ids = [ref.id for ref in User.objects.no_dereference().only("favorites").get(id=user.id).favorites]
+    if favorite_ids:
+        Product.objects(id__in=favorite_ids, favorites_count__gt=0).update(
+            __raw__={"$inc": {"favorites_count": -1}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+
+    # Compras do usuário voltam a ficar disponíveis (buyer é anulado - NULLIFY)
+    purchased = [(p.category, p.estado_de_conservacao) for p in Product.objects(buyer=user).only("category", "estado_de_conservacao")]
+    Product.objects(buyer=user).update(set__updated_at=datetime.utcnow())
+
+    # Deleta usuário (produtos criados durante a remoção saem pelo CASCADE)
+    user.delete()
+    invalidate_user(user.id)
+    record_change(added=purchased)
+    get_product_cache().clear()
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+
+def config_bool(value, default=False):
+    # Variáveis do .env chegam como string ("true", "0", ...)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+class QueryCache:
+    """
+    Cache LRU com TTL para respostas de listagem de produtos.
+    Cada entrada guarda a categoria e o estado filtrados para que uma escrita
+    invalide apenas as listagens que poderiam conter o produto alterado.
+    """
+
+    def __init__(self, max_size=256, ttl=30, enabled=True, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = enabled
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(**params):
+        # Parâmetros vazios são equivalentes a ausentes
+        return tuple(sorted((k, v) for k, v in params.items() if v not in (None, "")))
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, _, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, category=None, estado=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, (category, estado), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, products):
+        """
+        Remove as entradas afetadas por produtos com os pares (category, estado)
+        informados. Entradas sem filtro de categoria/estado são sempre afetadas.
+        """
+        categories = {category for category, _ in products}
+        estados = {estado for _, estado in products}
+        with self._lock:
+            stale = [
+                key for key, (_, (category, estado), _) in self._entries.items()
+                if (category is None or category in categories)
+                and (estado is None or estado in estados)
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+def init_cache(app):
+    # PRODUCT_CACHE_ENABLED, PRODUCT_CACHE_MAX_SIZE e PRODUCT_CACHE_TTL (segundos)
+    app.extensions["product_cache"] = QueryCache(
+        max_size=int(app.config.get("PRODUCT_CACHE_MAX_SIZE", 256)),
+        ttl=float(app.config.get("PRODUCT_CACHE_TTL", 30)),
+        enabled=config_bool(app.config.get("PRODUCT_CACHE_ENABLED"), default=True),
+    )
+
+
+def get_product_cache():
+    return current_app.extensions["product_cache"]
+
+
+def invalidate_product_listings(*products):
+    # Aceita documentos Product ou tuplas (category, estado_de_conservacao)
+    pairs = [
+        p if isinstance(p, tuple) else (p.category, p.estado_de_conservacao)
+        for p in products
+    ]
+    get_product_cache().invalidate(pairs)
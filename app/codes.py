@@ -0,0 +1,47 @@
+import math
+import secrets
+import string
+from flask import current_app
+
+# Códigos de confirmação: maiúsculas e dígitos, já que confirm-with-code
+# converte o código digitado para maiúsculas
+DEFAULT_LENGTH = 8
+DEFAULT_ALPHABET = string.ascii_uppercase + string.digits
+
+# Tentativas antes de desistir (colisões seguidas são praticamente impossíveis)
+MAX_ATTEMPTS = 5
+
+
+def code_settings():
+    """
+    Lê CONFIRMATION_CODE_LENGTH e CONFIRMATION_CODE_ALPHABET da configuração.
+    Levanta RuntimeError se o alfabeto não puder ser digitado de volta.
+    """
+    length = int(current_app.config.get("CONFIRMATION_CODE_LENGTH", DEFAULT_LENGTH))
+    alphabet = current_app.config.get("CONFIRMATION_CODE_ALPHABET", DEFAULT_ALPHABET)
+    if length < 4 or len(set(alphabet)) < 2 or alphabet != alphabet.upper() or len(set(alphabet)) != len(alphabet):
+        raise RuntimeError("CONFIRMATION_CODE_LENGTH/ALPHABET inválidos")
+    return length, alphabet
+
+
+def new_code(length=DEFAULT_LENGTH, alphabet=DEFAULT_ALPHABET):
+    # Código aleatório com secrets (não previsível por quem viu outros códigos)
+    return "".join(secrets.choice(alphabet) for _ in range(length))
+
+
+def collision_rate(existing, length=DEFAULT_LENGTH, alphabet_size=len(DEFAULT_ALPHABET)):
+    # Chance de um código novo colidir com um dos `existing` já gravados
+    return existing / alphabet_size ** length
+
+
+def expected_collisions(total, length=DEFAULT_LENGTH, alphabet_size=len(DEFAULT_ALPHABET)):
+    """
+    Número esperado de colisões (retries) ao gerar `total` códigos, um após o outro:
+    soma de i / N para i = 0..total-1, ou seja total * (total - 1) / (2N).
+    """
+    return total * (total - 1) / (2 * alphabet_size ** length)
+
+
+def any_collision_probability(total, length=DEFAULT_LENGTH, alphabet_size=len(DEFAULT_ALPHABET)):
+    # Problema do aniversário: chance de pelo menos uma colisão entre `total` códigos
+    return -math.expm1(-expected_collisions(total, length, alphabet_size))
@@ -0,0 +1,35 @@
+import click
+from .facets import rebuild_counts
+from .favorites import reconcile_counts
+from .images import process_pending, get_worker_pool
+
+
+def register_commands(app):
+
+    @app.cli.command("rebuild-facets")
+    def rebuild_facets():
+        """Recalcula os contadores de GET /products/facets a partir dos produtos."""
+        counts = rebuild_counts()
+        for facet, values in counts.items():
+            click.echo(f"{facet}: " + ", ".join(f"{k}={v}" for k, v in values.items()))
+
+    @app.cli.command("reconcile-favorites")
+    def reconcile_favorites():
+        """Recalcula favorites_count dos produtos a partir dos favoritos dos usuários."""
+        repaired = reconcile_counts()
+        click.echo(f"produtos corrigidos: {repaired}")
+
+    @app.cli.command("image-worker")
+    @click.option("--once", is_flag=True, help="Processa os jobs pendentes e termina.")
+    def image_worker(once):
+        """Processa a fila de uploads de imagem (ImageJob) em um processo dedicado."""
+        if once:
+            click.echo(f"jobs processados: {process_pending()}")
+            return
+        pool = get_worker_pool()
+        pool.start()
+        click.echo(f"{pool.size} workers de imagem em execução (Ctrl+C para sair)")
+        try:
+            pool.join()
+        except KeyboardInterrupt:
+            pool.stop()
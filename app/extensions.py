@@ -1,20 +1,174 @@
+import threading
 from mongoengine import connect, get_db
+from pymongo.monitoring import ConnectionPoolListener
 from flask_jwt_extended import JWTManager
 import cloudinary
+from .cache import config_bool
 
 _db = None
 _jwt = None
+_pool_stats = None
+
+MOCK_SCHEME = "mongomock://"
+
+
+def _write_concern(value):
+    # "majority" ou número de nós
+    value = str(value).strip()
+    return int(value) if value.isdigit() else value
+
+
+# variável de configuração -> (opção do MongoClient, conversão do valor do .env)
+MONGO_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "MONGO_COMPRESSORS": ("compressors", str),
+    "MONGO_READ_PREFERENCE": ("readPreference", str),
+    "MONGO_READ_CONCERN": ("readConcernLevel", str),
+    "MONGO_WRITE_CONCERN": ("w", _write_concern),
+    "MONGO_WRITE_TIMEOUT_MS": ("wTimeoutMS", int),
+    "MONGO_JOURNAL": ("journal", config_bool),
+}
+
+
+def mongo_settings(config):
+    """
+    Opções do MongoClient a partir da configuração. Só entram as variáveis
+    definidas (e não vazias); as demais ficam com o padrão do pymongo.
+    """
+    settings = {}
+    for key, (option, convert) in MONGO_OPTIONS.items():
+        value = config.get(key)
+        if value is None or value == "":
+            continue
+        settings[option] = convert(value)
+    return settings
+
+
+class PoolStats(ConnectionPoolListener):
+    """
+    Contadores do pool de conexões do pymongo (eventos do ConnectionPoolListener):
+    conexões em uso, abertas e a espera para obter uma conexão do pool.
+    Os eventos chegam das threads que usam o banco; os contadores usam um lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pools = 0
+        self.open = 0
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.cleared = 0
+
+    def _waited(self, event):
+        duration = getattr(event, "duration", None) or 0.0
+        self.wait_total += duration
+        self.wait_max = max(self.wait_max, duration)
+
+    def pool_created(self, event):
+        with self._lock:
+            self.pools += 1
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.cleared += 1
+
+    def pool_closed(self, event):
+        with self._lock:
+            self.pools -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+            self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+            self.open -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+            self._waited(event)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+            self._waited(event)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def stats(self):
+        with self._lock:
+            attempts = self.checkouts + self.checkout_failures
+            return {
+                "pools": self.pools,
+                "open": self.open,
+                "created": self.created,
+                "closed": self.closed,
+                "checked_out": self.checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "cleared": self.cleared,
+                "wait_ms_avg": round(self.wait_total / attempts * 1000, 3) if attempts else 0.0,
+                "wait_ms_max": round(self.wait_max * 1000, 3),
+            }
+
 
 def init_db(app):
-    # Inicializa a conexão mongoengine e guarda a instancia do pymongo Database global _db
-    connect(host=app.config["MONGO_URI"], alias="default")
+    """
+    Inicializa a conexão mongoengine e guarda a instancia do pymongo Database
+    em _db (get_pymongo_db), para operações em lote e consultas cruas.
+    O pool é configurado pelas variáveis MONGO_* (mongo_settings).
+    """
+    global _db, _pool_stats
+    uri = app.config["MONGO_URI"]
+    _pool_stats = PoolStats()
+    if uri.startswith(MOCK_SCHEME):
+        # mongoengine >= 0.27 não aceita mais mongomock:// (testes); sem pool de verdade
+        import mongomock
+        connect(host="mongodb://" + uri[len(MOCK_SCHEME):], alias="default", mongo_client_class=mongomock.MongoClient)
+    else:
+        connect(host=uri, alias="default", event_listeners=[_pool_stats], **mongo_settings(app.config))
     _db = get_db()  # retorna objeto pymongo.database.Database
 
+
 def get_pymongo_db():
     if _db is None:
         raise RuntimeError("DB não inicializado. Chame init_db(app) primeiro.")
     return _db
 
+
+def get_pool_stats():
+    if _pool_stats is None:
+        raise RuntimeError("DB não inicializado. Chame init_db(app) primeiro.")
+    return _pool_stats
+
+
 def init_jwt(app):
     global _jwt
     _jwt = JWTManager(app)
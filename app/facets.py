@@ -0,0 +1,77 @@
+from collections import Counter
+from .models import Product, FacetCounts
+
+FACETS = ("category", "estado_de_conservacao")
+
+# _id do documento com os contadores dos produtos disponíveis
+AVAILABLE = "available"
+
+
+def _facet_values(product):
+    # Aceita documentos Product ou tuplas (category, estado_de_conservacao)
+    if isinstance(product, tuple):
+        return product
+    return product.category, product.estado_de_conservacao
+
+
+def _empty_counts():
+    # Todas as opções aparecem, mesmo com zero produtos
+    return {facet: {choice: 0 for choice in Product._fields[facet].choices} for facet in FACETS}
+
+
+def record_change(removed=(), added=()):
+    """
+    Atualiza os contadores quando produtos deixam de estar disponíveis
+    (removed) ou passam a estar (added), com um único $inc atômico.
+    Chamado depois da escrita: sem o documento de contadores (primeira escrita
+    com um catálogo já existente), recalcula tudo a partir dos produtos, o que
+    já inclui a mudança, em vez de começar do zero.
+    """
+    increments = Counter()
+    for delta, products in ((-1, removed), (1, added)):
+        for product in products:
+            for facet, value in zip(FACETS, _facet_values(product)):
+                increments[f"{facet}.{value}"] += delta
+
+    increments = {key: value for key, value in increments.items() if value}
+    if increments:
+        result = FacetCounts._get_collection().update_one(
+            {"_id": AVAILABLE}, {"$inc": increments}
+        )
+        if result.matched_count == 0:
+            rebuild_counts()
+
+
+def aggregate_facets(queryset):
+    # Contagem sob demanda ($group) para consultas com filtros
+    pipeline = [{"$facet": {
+        facet: [{"$group": {"_id": f"${facet}", "count": {"$sum": 1}}}]
+        for facet in FACETS
+    }}]
+    counts = _empty_counts()
+    for row in queryset.aggregate(pipeline):
+        for facet in FACETS:
+            for group in row.get(facet, []):
+                counts[facet][group["_id"]] = group["count"]
+    return counts
+
+
+def rebuild_counts():
+    # Recalcula os contadores a partir dos produtos (corrige divergências)
+    counts = aggregate_facets(Product.objects(buyer=None))
+    FacetCounts._get_collection().replace_one(
+        {"_id": AVAILABLE}, {"_id": AVAILABLE, **counts}, upsert=True
+    )
+    return counts
+
+
+def available_counts():
+    # Contagem sem filtros: uma leitura do documento de contadores
+    document = FacetCounts._get_collection().find_one({"_id": AVAILABLE})
+    if document is None:
+        return rebuild_counts()
+
+    counts = _empty_counts()
+    for facet in FACETS:
+        counts[facet].update(document.get(facet, {}))
+    return counts
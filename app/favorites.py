@@ -0,0 +1,39 @@
+from collections import defaultdict
+from pymongo import UpdateMany
+from .models import User, Product
+from .extensions import get_pymongo_db
+
+
+def favorite_counts():
+    # Contagem real de favoritos por produto, agregando as listas dos usuários
+    pipeline = [
+        {"$unwind": "$favorites"},
+        {"$group": {"_id": "$favorites", "count": {"$sum": 1}}},
+    ]
+    return {row["_id"]: row["count"] for row in User.objects.aggregate(pipeline)}
+
+
+def reconcile_counts():
+    """
+    Recalcula Product.favorites_count a partir de User.favorites e corrige
+    apenas os produtos divergentes. Produtos com o mesmo valor correto são
+    atualizados juntos (um UpdateMany por valor, todos em um único bulk_write).
+    Produtos gravados antes do campo existir também recebem o valor: sem ele o
+    cursor de sort=popular (favorites_count <= v) não os encontra.
+    Retorna o número de produtos corrigidos.
+    """
+    counts = favorite_counts()
+    stored = Product.objects.only("favorites_count").as_pymongo()
+
+    drifted = defaultdict(list)
+    for row in stored:
+        expected = counts.get(row["_id"], 0)
+        if "favorites_count" not in row or row["favorites_count"] != expected:
+            drifted[expected].append(row["_id"])
+
+    if drifted:
+        get_pymongo_db()[Product._get_collection_name()].bulk_write([
+            UpdateMany({"_id": {"$in": ids}}, {"$set": {"favorites_count": expected}})
+            for expected, ids in drifted.items()
+        ], ordered=False)
+    return sum(len(ids) for ids in drifted.values())
@@ -0,0 +1,42 @@
+import hashlib
+from flask import Response, current_app, request
+
+
+def product_etag(product):
+    # ETag forte: id do produto + carimbo de modificação (updated_at)
+    stamp = product.updated_at or product.created_at
+    return f"{product.id}-{int(stamp.timestamp() * 1000)}"
+
+
+def body_etag(data):
+    # ETag forte a partir do corpo já serializado
+    return hashlib.sha1(data).hexdigest()
+
+
+def _cache_control(response):
+    # HTTP_CACHE_MAX_AGE=0 (padrão): o cliente sempre revalida com If-None-Match
+    max_age = int(current_app.config.get("HTTP_CACHE_MAX_AGE", 0))
+    response.headers["Cache-Control"] = f"public, max-age={max_age}" if max_age > 0 else "no-cache"
+    return response
+
+
+def not_modified(etag):
+    """
+    Retorna uma resposta 304 se o If-None-Match do cliente bate com o etag,
+    ou None se o recurso precisa ser enviado.
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    return _cache_control(response)
+
+
+def conditional_response(data, etag, status=200):
+    # Resposta JSON já serializada, com ETag e Cache-Control (ou 304)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    response = Response(data, status=status, mimetype="application/json")
+    response.set_etag(etag)
+    return _cache_control(response)
@@ -0,0 +1,154 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from bson import ObjectId
+from flask import current_app
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from mongoengine.errors import ValidationError
+from .cache import config_bool
+from .models import User
+
+DEFAULT_TTL = 60  # segundos
+DEFAULT_MAX_SIZE = 1024
+
+# Campos do perfil carregados para o usuário autenticado (sem a lista de
+# favoritos nem o hash da senha, que só as rotas de escrita leem)
+PROFILE_FIELDS = ("email", "name", "cellphone", "created_at")
+
+_cache_lock = threading.Lock()
+
+
+class UserCache:
+    """
+    Cache LRU com TTL dos perfis de usuário (documento cru, por id), local ao processo.
+    Cada requisição recebe um User novo: o cache nunca compartilha Documents entre threads.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL, enabled=True, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = enabled
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= self._clock():
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user_id, son):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[user_id] = (self._clock() + self.ttl, son)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            if self._entries.pop(str(user_id), None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+
+def get_user_cache():
+    # USER_CACHE_ENABLED, USER_CACHE_MAX_SIZE e USER_CACHE_TTL (segundos)
+    with _cache_lock:
+        cache = current_app.extensions.get("user_cache")
+        if cache is None:
+            config = current_app.config
+            cache = UserCache(
+                max_size=int(config.get("USER_CACHE_MAX_SIZE", DEFAULT_MAX_SIZE)),
+                ttl=float(config.get("USER_CACHE_TTL", DEFAULT_TTL)),
+                enabled=config_bool(config.get("USER_CACHE_ENABLED"), default=True),
+            )
+            current_app.extensions["user_cache"] = cache
+        return cache
+
+
+def invalidate_user(user_id):
+    # Chamado quando o usuário muda ou é removido (só afeta este processo)
+    get_user_cache().invalidate(user_id)
+
+
+def current_user():
+    """
+    Usuário autenticado (somente os campos do perfil), ou None se não existe mais.
+    Lido do UserCache, para que a maioria das rotas protegidas não vá ao banco
+    só para carregar quem fez a requisição.
+    """
+    user_id = get_jwt_identity()
+    cache = get_user_cache()
+    son = cache.get(user_id)
+    if son is None:
+        try:
+            son = User.objects(id=user_id).only(*PROFILE_FIELDS).as_pymongo().first()
+        except ValidationError:
+            # identidade que não é um ObjectId válido
+            son = None
+        if son is not None:
+            cache.set(user_id, son)
+
+    return User._from_son(son) if son is not None else None
+
+
+def profile_claims_enabled():
+    return config_bool(current_app.config.get("JWT_PROFILE_CLAIMS"))
+
+
+def profile_claims(user):
+    # Claims adicionais do token com o perfil do usuário (JWT_PROFILE_CLAIMS)
+    if not profile_claims_enabled():
+        return None
+    return {"profile": {
+        "email": user.email,
+        "name": user.name,
+        "cellphone": user.cellphone,
+        "created_at": user.created_at.isoformat(),
+    }}
+
+
+def current_profile():
+    """
+    Perfil do usuário autenticado para rotas somente leitura.
+    Com JWT_PROFILE_CLAIMS e um token que traz o perfil, monta o User a partir
+    das claims, sem consultar o banco; senão, usa current_user().
+    """
+    profile = get_jwt().get("profile") if profile_claims_enabled() else None
+    if not isinstance(profile, dict):
+        return current_user()
+    try:
+        return User(
+            id=ObjectId(get_jwt_identity()),
+            email=profile["email"],
+            name=profile["name"],
+            cellphone=profile["cellphone"],
+            created_at=datetime.fromisoformat(profile["created_at"]),
+        )
+    except (KeyError, TypeError, ValueError):
+        return current_user()
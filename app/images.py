@@ -0,0 +1,336 @@
+import base64
+import binascii
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from mongoengine.errors import NotUniqueError
+from mongoengine.queryset.visitor import Q
+from .cache import config_bool, invalidate_product_listings
+from .models import Product, ImageJob, ImageBlob
+from .resilience import get_storage_guard, CircuitOpenError, BulkheadFullError
+from .storage import get_storage
+
+PENDING, PROCESSING, DONE, FAILED = ImageJob.STATUSES
+
+_pool_lock = threading.Lock()
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_JOB_TIMEOUT = 300  # segundos até um job "processing" ser considerado abandonado
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_MAX_IMAGES = 10  # imagens por produto (MAX_IMAGES_PER_PRODUCT)
+DEFAULT_UPLOAD_CONCURRENCY = 4  # uploads simultâneos do envio em lote
+DEFAULT_SIGNATURE_TTL = 600  # validade (segundos) das URLs de upload direto
+
+
+class ImageLimitError(Exception):
+    # O produto atingiria mais de MAX_IMAGES_PER_PRODUCT imagens
+    pass
+
+
+def max_images():
+    return int(current_app.config.get("MAX_IMAGES_PER_PRODUCT", DEFAULT_MAX_IMAGES))
+
+
+def decode_image(image_data):
+    """
+    Decodifica a imagem enviada em base64 (aceita data URI "data:image/...;base64,...").
+    Levanta ValueError se o conteúdo não for base64 válido.
+    """
+    if image_data.startswith("data:"):
+        image_data = image_data.partition(",")[2]
+    try:
+        data = base64.b64decode(image_data, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("image deve ser uma string base64 válida")
+    if not data:
+        raise ValueError("image deve ser uma string base64 válida")
+    return data
+
+
+def image_folder(product_id):
+    return f"marketplace/products/{product_id}"
+
+
+# Imagens deduplicadas ficam em uma pasta única, com o hash como nome
+BLOB_FOLDER = "marketplace/images"
+
+
+class DedupStats:
+    """
+    Contadores da deduplicação de imagens (expostos em GET /metrics).
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit, size):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.bytes_saved += size
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "bytes_saved": self.bytes_saved,
+            }
+
+
+def get_dedup_stats():
+    with _pool_lock:
+        return current_app.extensions.setdefault("image_dedup", DedupStats())
+
+
+def image_store():
+    """
+    Retorna a função que grava uma imagem (bytes) e devolve sua URL.
+    Capturada no contexto da requisição para rodar também nas threads do pool.
+    Com IMAGE_DEDUP (padrão) a imagem é endereçada pelo SHA-256 dos bytes:
+    se já foi armazenada, a URL é reaproveitada sem acessar a rede.
+    Os uploads passam pelo StorageGuard (timeout, disjuntor e bulkhead).
+    """
+    storage = get_storage()
+    guard = get_storage_guard()
+    if not config_bool(current_app.config.get("IMAGE_DEDUP"), default=True):
+        return lambda data, product_id: guard.call(storage.upload, data, folder=image_folder(product_id))
+
+    stats = get_dedup_stats()
+
+    def store(data, product_id):
+        digest = hashlib.sha256(data).hexdigest()
+        blob = ImageBlob.objects(sha256=digest, storage=storage.name).only("url").first()
+        if blob is not None:
+            stats.record(True, len(data))
+            return blob.url
+
+        url = guard.call(storage.upload, data, folder=BLOB_FOLDER, name=digest)
+        try:
+            ImageBlob(sha256=digest, storage=storage.name, url=url, size=len(data)).save()
+        except NotUniqueError:
+            # outro upload da mesma imagem terminou antes: usa a URL registrada
+            url = ImageBlob.objects.get(sha256=digest, storage=storage.name).url
+        stats.record(False, len(data))
+        return url
+
+    return store
+
+
+def append_images(product_id, urls):
+    """
+    Acrescenta urls a Product.images com um único $push atômico ($each).
+    O filtro "images.<limite - n> não existe" garante o limite de imagens
+    mesmo com envios simultâneos.
+    Retorna o produto atualizado, ou None se ele não existe mais;
+    levanta ImageLimitError se o limite seria ultrapassado.
+    """
+    urls = list(urls)
+    free_slot = f"images.{max_images() - len(urls)}"
+    product = Product.objects(id=product_id, __raw__={free_slot: {"$exists": False}}).modify(
+        new=True, push_all__images=urls, set__updated_at=datetime.utcnow()
+    )
+    if product is None:
+        if Product.objects(id=product_id).count():
+            raise ImageLimitError(f"limite de {max_images()} imagens por produto atingido")
+        return None
+    invalidate_product_listings(product)
+    return product
+
+
+def get_upload_executor():
+    # Pool limitado (IMAGE_UPLOAD_CONCURRENCY) compartilhado pelos envios em lote
+    with _pool_lock:
+        executor = current_app.extensions.get("image_upload_executor")
+        if executor is None:
+            size = int(current_app.config.get("IMAGE_UPLOAD_CONCURRENCY", DEFAULT_UPLOAD_CONCURRENCY))
+            executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="image-upload")
+            current_app.extensions["image_upload_executor"] = executor
+        return executor
+
+
+def upload_many(product_id, images):
+    """
+    Envia várias imagens (bytes) em paralelo pelo pool limitado.
+    Retorna, na ordem recebida, (url, None) para cada sucesso ou (None, erro).
+    """
+    store = image_store()
+    executor = get_upload_executor()
+    futures = [executor.submit(store, data, product_id) for data in images]
+
+    results = []
+    for future in futures:
+        try:
+            results.append((future.result(), None))
+        except Exception as e:
+            current_app.logger.warning("falha no upload em lote do produto %s: %s", product_id, e)
+            results.append((None, f"erro ao fazer upload da imagem: {e}"))
+    return results
+
+
+def enqueue_image(product, owner_id, data):
+    # Persiste o job e acorda os workers; com BACKGROUND_TASKS_EAGER processa na hora
+    job = ImageJob(product=product, owner=owner_id, data=data).save()
+    if config_bool(current_app.config.get("BACKGROUND_TASKS_EAGER")):
+        claimed = claim_job(job.id)
+        if claimed is not None:
+            process_job(claimed)
+        return ImageJob.objects.exclude("data").get(id=job.id)
+    get_worker_pool().notify()
+    return job
+
+
+def claim_job(job_id=None):
+    """
+    Marca atomicamente o próximo job pendente (ou job_id) como "processing" e o retorna.
+    Jobs em "processing" há mais de IMAGE_JOB_TIMEOUT segundos (worker que morreu)
+    voltam a ser elegíveis.
+    """
+    now = datetime.utcnow()
+    timeout = float(current_app.config.get("IMAGE_JOB_TIMEOUT", DEFAULT_JOB_TIMEOUT))
+    query = ImageJob.objects(Q(status=PENDING) | Q(status=PROCESSING, started_at__lt=now - timedelta(seconds=timeout)))
+    if job_id is not None:
+        query = query.filter(id=job_id)
+    return query.order_by("created_at").modify(
+        new=True, set__status=PROCESSING, set__started_at=now, set__updated_at=now, inc__attempts=1
+    )
+
+
+def process_job(job):
+    """
+    Envia a imagem ao armazenamento e acrescenta a URL ao produto.
+    Falhas voltam o job para a fila até IMAGE_JOB_MAX_ATTEMPTS tentativas.
+    Retorna False se o armazenamento recusou a chamada (circuito aberto ou
+    bulkhead cheio): o job volta à fila sem gastar tentativa.
+    """
+    product_id = job._data["product"].id
+    try:
+        url = image_store()(job.data, product_id)
+    except (CircuitOpenError, BulkheadFullError) as e:
+        ImageJob.objects(id=job.id).update_one(
+            set__status=PENDING, set__updated_at=datetime.utcnow(), set__error=str(e),
+            __raw__={"$inc": {"attempts": -1}},
+        )
+        return False
+    except Exception as e:
+        max_attempts = int(current_app.config.get("IMAGE_JOB_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+        status = FAILED if job.attempts >= max_attempts else PENDING
+        current_app.logger.warning("falha no upload do job %s (tentativa %s): %s", job.id, job.attempts, e)
+        _finish(job, status, error=f"erro ao fazer upload da imagem: {e}", keep_data=status == PENDING)
+        return True
+
+    try:
+        product = append_images(product_id, [url])
+    except ImageLimitError as e:
+        _finish(job, FAILED, error=str(e))
+        return True
+    if product is None:
+        _finish(job, FAILED, error="produto não encontrado")
+    else:
+        _finish(job, DONE, image_url=url)
+    return True
+
+
+def _finish(job, status, image_url=None, error=None, keep_data=False):
+    update = {"set__status": status, "set__updated_at": datetime.utcnow(), "set__error": error}
+    if image_url:
+        update["set__image_url"] = image_url
+    if not keep_data:
+        update["unset__data"] = True
+    ImageJob.objects(id=job.id).update_one(**update)
+
+
+def process_pending(limit=None):
+    # Processa jobs pendentes até esvaziar a fila, atingir limit ou o armazenamento
+    # recusar chamadas; retorna quantos processou
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_job()
+        if job is None or not process_job(job):
+            break
+        processed += 1
+    return processed
+
+
+class ImageWorkerPool:
+    """
+    Threads que consomem a fila de ImageJob. Iniciadas na primeira imagem recebida;
+    entre um job e outro esperam um aviso (notify) ou IMAGE_JOB_POLL_INTERVAL
+    segundos, para pegar também jobs criados por outros processos.
+    """
+
+    def __init__(self, app, size=DEFAULT_WORKERS, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.app = app
+        self.size = size
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self.size):
+                thread = threading.Thread(target=self._run, name=f"image-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def notify(self):
+        self.start()
+        self._wakeup.set()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._wakeup.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def join(self):
+        # Bloqueia até os workers pararem (comando flask image-worker)
+        for thread in list(self._threads):
+            thread.join()
+
+    def _run(self):
+        with self.app.app_context():
+            while not self._stopping.is_set():
+                try:
+                    job = claim_job()
+                    # armazenamento recusando chamadas: espera antes de tentar de novo
+                    if job is not None and process_job(job):
+                        continue
+                except Exception:
+                    self.app.logger.exception("erro no worker de imagens")
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+
+def get_worker_pool():
+    with _pool_lock:
+        return _get_or_create_pool()
+
+
+def _get_or_create_pool():
+    pool = current_app.extensions.get("image_workers")
+    if pool is None:
+        pool = ImageWorkerPool(
+            current_app._get_current_object(),
+            size=int(current_app.config.get("IMAGE_WORKERS", DEFAULT_WORKERS)),
+            poll_interval=float(current_app.config.get("IMAGE_JOB_POLL_INTERVAL", DEFAULT_POLL_INTERVAL)),
+        )
+        current_app.extensions["image_workers"] = pool
+    return pool
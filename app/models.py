@@ -1,14 +1,16 @@
 from datetime import datetime
 from mongoengine import (
     Document, StringField, EmailField, DateTimeField,
-    ReferenceField, FloatField, BooleanField, ListField, NULLIFY, CASCADE
+    ReferenceField, FloatField, IntField, BooleanField, ListField, DictField, BinaryField,
+    NULLIFY, CASCADE, PULL
 )
-from werkzeug.security import generate_password_hash, check_password_hash
+from .passwords import get_password_hasher
 
 class User(Document):
     meta = {
         "collection": "users",
-        "indexes": ["email"]
+        # favorites: índice multikey usado para achar quem favoritou um produto
+        "indexes": ["email", "favorites"]
     }
     email = EmailField(required=True, unique=True)
     name = StringField(required=True, max_length=120)
@@ -18,10 +20,27 @@ class User(Document):
     created_at = DateTimeField(default=datetime.utcnow)
 
     def set_password(self, password: str):
-        self.password_hash = generate_password_hash(password)
+        # Levanta ValueError se o esquema configurado não aceitar a senha
+        self.password_hash = get_password_hasher().hash(password)
 
     def check_password(self, password: str) -> bool:
-        return check_password_hash(self.password_hash, password)
+        return get_password_hasher().verify(password, self.password_hash)
+
+    def upgrade_password_hash(self, password: str) -> bool:
+        """
+        Regrava o hash com o esquema/custo atuais, se mudaram desde que foi gerado.
+        Chamar só depois de check_password; a escrita é condicional ao hash antigo,
+        para não desfazer uma troca de senha simultânea.
+        """
+        hasher = get_password_hasher()
+        if not hasher.needs_rehash(self.password_hash):
+            return False
+        old_hash = self.password_hash
+        new_hash = hasher.hash(password)
+        if not User.objects(id=self.id, password_hash=old_hash).update_one(set__password_hash=new_hash):
+            return False
+        self.password_hash = new_hash
+        return True
 
     def to_dict(self):
         return {"id": str(self.id), "email": self.email, "name": self.name, "cellphone": self.cellphone, "created_at": self.created_at.isoformat()}
@@ -29,7 +48,29 @@ class User(Document):
 class Product(Document):
     meta = {
         "collection": "products",
-        "indexes": ["owner", "buyer", "confirmation_code", "category", "em_destaque"]
+        "indexes": [
+            "owner", "buyer", "confirmation_code", "category", "em_destaque",
+            # listagem paginada por cursor: para cada ordenação de pagination.SORTS,
+            # (buyer, [category | estado_de_conservacao], chaves da ordenação, _id)
+            {"fields": ["buyer", "-created_at", "-id"]},
+            {"fields": ["buyer", "category", "-created_at", "-id"]},
+            {"fields": ["buyer", "estado_de_conservacao", "-created_at", "-id"]},
+            {"fields": ["buyer", "price", "id"]},
+            {"fields": ["buyer", "category", "price", "id"]},
+            {"fields": ["buyer", "estado_de_conservacao", "price", "id"]},
+            {"fields": ["buyer", "-em_destaque", "-created_at", "-id"]},
+            {"fields": ["buyer", "category", "-em_destaque", "-created_at", "-id"]},
+            {"fields": ["buyer", "estado_de_conservacao", "-em_destaque", "-created_at", "-id"]},
+            {"fields": ["buyer", "-favorites_count", "-created_at", "-id"]},
+            {"fields": ["buyer", "category", "-favorites_count", "-created_at", "-id"]},
+            {"fields": ["buyer", "estado_de_conservacao", "-favorites_count", "-created_at", "-id"]},
+            # índice de texto usado pelo backend de busca "mongo"
+            {
+                "fields": ["$title", "$description"],
+                "default_language": "portuguese",
+                "weights": {"title": 3, "description": 1},
+            },
+        ]
     }
     title = StringField(required=True, max_length=200)
     description = StringField()
@@ -41,20 +82,145 @@ class Product(Document):
     buyer = ReferenceField(User, required=False, null=True, reverse_delete_rule=NULLIFY)  # comprador (null até confirmar com código)
     confirmation_code = StringField(unique=True, sparse=True)  # código gerado pelo owner (se existe, owner confirmou)
     images = ListField(StringField(), default=list)  # lista de URLs das imagens no Cloudinary
+    favorites_count = IntField(default=0, min_value=0)  # usuários que favoritaram ($inc em add/remove_favorite)
+    created_at = DateTimeField(default=datetime.utcnow)
+    # carimbo de modificação (ETag); sem default: produtos antigos sem o campo usam created_at
+    updated_at = DateTimeField()
+
+    def save(self, *args, **kwargs):
+        # Todo save() atualiza o carimbo usado no ETag de GET /products/<id>
+        self.updated_at = datetime.utcnow()
+        return super().save(*args, **kwargs)
+
+    def related_user(self, field, users=None):
+        # Usa o mapa de usuários pré-carregado (serialize_products) quando houver
+        if users is None:
+            user = getattr(self, field)
+        else:
+            value = self._data.get(field)
+            user = users.get(getattr(value, "id", value)) if value is not None else None
+        return user.to_dict() if user else None
+
+    def to_dict(self, users=None, fields=None):
+        # fields limita as chaves geradas (ver serializers.PRODUCT_FIELDS)
+        getters = {
+            "id": lambda: str(self.id),
+            "title": lambda: self.title,
+            "description": lambda: self.description,
+            "price": lambda: self.price,
+            "category": lambda: self.category,
+            "estado_de_conservacao": lambda: self.estado_de_conservacao,
+            "em_destaque": lambda: self.em_destaque,
+            "owner": lambda: self.related_user("owner", users),
+            "buyer": lambda: self.related_user("buyer", users),
+            "images": lambda: self.images,
+            "thumbnail": lambda: self.images[0] if self.images else None,
+            "favorites_count": lambda: self.favorites_count,
+            "created_at": lambda: self.created_at.isoformat(),
+        }
+        return {name: getters[name]() for name in (fields or getters)}
+
+# Ao deletar um produto, ele sai dos favoritos com um único $pull em users
+Product.register_delete_rule(User, "favorites", PULL)
+
+class FacetCounts(Document):
+    # Contadores de produtos disponíveis (buyer=None) por categoria e estado,
+    # mantidos com $inc a cada escrita (ver app/facets.py)
+    meta = {"collection": "product_facets"}
+    id = StringField(primary_key=True)
+    category = DictField()
+    estado_de_conservacao = DictField()
+
+class ImageBlob(Document):
+    # Imagem já armazenada, endereçada pelo SHA-256 dos bytes (deduplicação).
+    # Uma mesma imagem enviada de novo reaproveita a URL, sem novo upload.
+    meta = {
+        "collection": "image_blobs",
+        "indexes": [
+            {"fields": ["sha256", "storage"], "unique": True},
+        ]
+    }
+    sha256 = StringField(required=True)
+    storage = StringField(required=True)  # backend que guardou a imagem (IMAGE_STORAGE)
+    url = StringField(required=True)
+    size = IntField()
+    created_at = DateTimeField(default=datetime.utcnow)
+
+class ImageJob(Document):
+    # Fila de processamento de imagens (ver app/images.py). Fica no MongoDB para
+    # sobreviver a reinícios e ser compartilhada entre os processos da API.
+    meta = {
+        "collection": "image_jobs",
+        "indexes": [
+            # claim do próximo job pendente, na ordem de chegada
+            {"fields": ["status", "created_at"]},
+            "product",
+        ]
+    }
+    STATUSES = ("pending", "processing", "done", "failed")
+
+    product = ReferenceField(Product, required=True, reverse_delete_rule=CASCADE)
+    owner = ReferenceField(User, required=True)
+    status = StringField(required=True, choices=STATUSES, default="pending")
+    data = BinaryField()  # bytes da imagem; removidos quando o job termina
+    image_url = StringField()
+    error = StringField()
+    attempts = IntField(default=0)
+    started_at = DateTimeField()
     created_at = DateTimeField(default=datetime.utcnow)
+    updated_at = DateTimeField(default=datetime.utcnow)
 
     def to_dict(self):
         return {
             "id": str(self.id),
-            "title": self.title,
-            "description": self.description,
-            "price": self.price,
-            "category": self.category,
-            "estado_de_conservacao": self.estado_de_conservacao,
-            "em_destaque": self.em_destaque,
-            "owner": self.owner.to_dict() if self.owner else None,
-            "buyer": self.buyer.to_dict() if self.buyer else None,
-            "images": self.images,
-            "thumbnail": self.images[0] if self.images else None,
-            "created_at": self.created_at.isoformat()
+            "product_id": str(self._data["product"].id),
+            "status": self.status,
+            "image_url": self.image_url,
+            "error": self.error,
+            "attempts": self.attempts,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
         }
+
+class RefreshToken(Document):
+    # Refresh tokens emitidos (ver app/sessions.py). Cada renovação gasta o token
+    # e emite outro da mesma família; reusar um token gasto revoga a família.
+    meta = {
+        "collection": "refresh_tokens",
+        "indexes": [
+            {"fields": ["jti"], "unique": True},
+            "family",
+            "user",
+            # o MongoDB apaga os tokens vencidos
+            {"fields": ["expires_at"], "expireAfterSeconds": 0},
+        ]
+    }
+
+    jti = StringField(required=True)
+    family = StringField(required=True)
+    user = ReferenceField(User, required=True, reverse_delete_rule=CASCADE)
+    used_at = DateTimeField()
+    revoked = BooleanField(default=False)
+    expires_at = DateTimeField(required=True)
+    created_at = DateTimeField(default=datetime.utcnow)
+
+class RevokedToken(Document):
+    # Revogações de JWT (ver app/revocation.py): um jti específico, todos os tokens
+    # de uma sessão (família "fam") ou, por usuário, os emitidos antes de not_before
+    meta = {
+        "collection": "revoked_tokens",
+        "indexes": [
+            {"fields": ["kind", "key"], "unique": True},
+            # carga incremental do filtro de Bloom
+            "created_at",
+            # depois que os tokens afetados vencem a revogação não é mais necessária
+            {"fields": ["expires_at"], "expireAfterSeconds": 0},
+        ]
+    }
+    KINDS = ("jti", "user", "family")
+
+    kind = StringField(required=True, choices=KINDS)
+    key = StringField(required=True)  # jti, id do usuário ou família
+    not_before = DateTimeField()  # kind="user": tokens com iat anterior são recusados
+    expires_at = DateTimeField(required=True)
+    created_at = DateTimeField(default=datetime.utcnow)
@@ -0,0 +1,128 @@
+import base64
+import operator
+from functools import reduce
+from bson import json_util
+from bson.errors import BSONError
+from bson.json_util import JSONOptions
+from mongoengine.queryset.visitor import Q
+from .serializers import read_products
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Ordenações aceitas em ?sort=, como tuplas (campo, direção).
+# O _id entra sempre como desempate, na direção da última chave.
+# Cada ordenação tem índices (buyer, [category|estado], chaves..., _id) em Product.meta.
+SORTS = {
+    "-created_at": (("created_at", -1),),
+    "created_at": (("created_at", 1),),
+    "-price": (("price", -1),),
+    "price": (("price", 1),),
+    "featured": (("em_destaque", -1), ("created_at", -1)),
+    "popular": (("favorites_count", -1), ("created_at", -1)),
+}
+DEFAULT_SORT = "-created_at"
+
+_CURSOR_JSON = JSONOptions(tz_aware=False)
+
+
+def parse_limit(raw, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    # Converte o parametro limit, levantando ValueError se estiver fora do intervalo
+    if raw is None or raw == "":
+        return default
+    error = f"limit deve ser um inteiro entre 1 e {maximum}"
+    try:
+        limit = int(raw)
+    except (TypeError, ValueError):
+        raise ValueError(error)
+    if limit < 1 or limit > maximum:
+        raise ValueError(error)
+    return limit
+
+
+def sort_keys(sort=DEFAULT_SORT):
+    # Chaves de ordenação completas, incluindo o desempate por _id
+    keys = SORTS[sort]
+    return keys + (("id", keys[-1][1]),)
+
+
+def encode_cursor(item, sort=DEFAULT_SORT):
+    # Cursor opaco com os valores das chaves de ordenação do último item da página
+    values = [getattr(item, name) for name, _ in sort_keys(sort)]
+    payload = json_util.dumps({"s": sort, "v": values})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort=DEFAULT_SORT):
+    # Retorna os valores das chaves; levanta ValueError se o cursor for inválido
+    # ou tiver sido gerado para outra ordenação
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode()), json_options=_CURSOR_JSON)
+        values = payload["v"]
+        valid = payload["s"] == sort and len(values) == len(sort_keys(sort))
+    except (ValueError, TypeError, KeyError, BSONError):
+        raise ValueError("cursor inválido")
+    if not valid:
+        raise ValueError("cursor inválido")
+    return values
+
+
+def encode_offset_cursor(offset):
+    # Cursor opaco por posição, para listas embutidas (ex.: User.favorites)
+    payload = json_util.dumps({"o": offset})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_offset_cursor(cursor):
+    # Retorna a posição; levanta ValueError se o cursor for inválido
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        offset = json_util.loads(base64.urlsafe_b64decode(padded.encode()))["o"]
+    except (ValueError, TypeError, KeyError, BSONError):
+        raise ValueError("cursor inválido")
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        raise ValueError("cursor inválido")
+    return offset
+
+
+def _after(keys, values):
+    """
+    Condição "vem depois de values" na ordem de keys (comparação lexicográfica):
+    k1 > v1 OR (k1 = v1 AND k2 > v2) OR ... (ou < nas chaves decrescentes).
+    """
+    clauses = []
+    for i, (name, direction) in enumerate(keys):
+        condition = {prev: value for (prev, _), value in zip(keys[:i], values[:i])}
+        condition[f"{name}__{'gt' if direction > 0 else 'lt'}"] = values[i]
+        clauses.append(Q(**condition))
+
+    # limita o range da primeira chave no índice; o OR desempata as demais
+    first, direction = keys[0]
+    bound = Q(**{f"{first}__{'gte' if direction > 0 else 'lte'}": values[0]})
+    return bound & reduce(operator.or_, clauses)
+
+
+def page_query(query, cursor=None, limit=DEFAULT_PAGE_SIZE, sort=DEFAULT_SORT):
+    """
+    Consulta de uma página por keyset na ordem de sort, sem skip/offset.
+    Traz limit + 1 itens: o item extra indica que existe uma próxima página.
+    """
+    keys = sort_keys(sort)
+    if cursor:
+        query = query.filter(_after(keys, decode_cursor(cursor, sort)))
+    order = [("-" if direction < 0 else "") + name for name, direction in keys]
+    return query.order_by(*order).limit(limit + 1)
+
+
+def paginate(query, cursor=None, limit=DEFAULT_PAGE_SIZE, raw=False, sort=DEFAULT_SORT):
+    """
+    Retorna (itens, next_cursor) da página; next_cursor é None na última página.
+    Com raw=True os itens são ProductRow (leitura sem Documents).
+    """
+    items = read_products(page_query(query, cursor, limit, sort), raw=raw)
+    if len(items) <= limit:
+        return items, None
+
+    items = items[:limit]
+    return items, encode_cursor(items[-1], sort)
@@ -0,0 +1,125 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Custo padrão de cada esquema: iterações (pbkdf2), N (scrypt) ou rounds (bcrypt)
+SCHEMES = {
+    "scrypt": 2 ** 15,
+    "pbkdf2": 1_000_000,
+    "bcrypt": 12,
+}
+DEFAULT_SCHEME = "scrypt"  # o padrão do werkzeug, usado nos hashes já gravados
+# Processos do pool por processo da API: cada worker do gunicorn cria o seu,
+# então o total na máquina é workers do gunicorn x PASSWORD_HASH_WORKERS
+DEFAULT_WORKERS = 1
+
+BCRYPT_MAX_BYTES = 72  # o bcrypt ignora (e o pacote bcrypt recusa) o que passar disso
+
+_hasher_lock = threading.Lock()
+
+
+def hash_password(password, scheme, cost):
+    # Gera o hash no esquema/custo informados (roda nos processos do pool)
+    if scheme == "bcrypt":
+        encoded = password.encode()
+        if len(encoded) > BCRYPT_MAX_BYTES:
+            raise ValueError(f"password deve ter no máximo {BCRYPT_MAX_BYTES} bytes")
+        return bcrypt.hashpw(encoded, bcrypt.gensalt(rounds=cost)).decode()
+    if scheme == "scrypt":
+        return generate_password_hash(password, method=f"scrypt:{cost}:8:1")
+    return generate_password_hash(password, method=f"pbkdf2:sha256:{cost}")
+
+
+def verify_password(password, password_hash):
+    # Confere a senha contra um hash de qualquer esquema suportado
+    if password_hash.startswith("$2"):
+        encoded = password.encode()
+        if len(encoded) > BCRYPT_MAX_BYTES:
+            return False
+        return bcrypt.checkpw(encoded, password_hash.encode())
+    return check_password_hash(password_hash, password)
+
+
+def hash_parameters(password_hash):
+    """
+    (esquema, custo) de um hash gravado, ou (None, None) se não reconhecido.
+    bcrypt: "$2b$12$..."; werkzeug: "scrypt:32768:8:1$..." ou "pbkdf2:sha256:600000$...".
+    """
+    try:
+        if password_hash.startswith("$2"):
+            return "bcrypt", int(password_hash.split("$")[2])
+        method = password_hash.split("$", 1)[0].split(":")
+        if method[0] == "scrypt":
+            return "scrypt", int(method[1])
+        if method[0] == "pbkdf2":
+            return "pbkdf2", int(method[2])
+    except (IndexError, ValueError):
+        pass
+    return None, None
+
+
+class PasswordHasher:
+    """
+    Gera e confere hashes de senha em um pool limitado de processos, para que
+    o custo de CPU do hash não prenda as threads que atendem requisições
+    (a thread só espera o resultado, sem segurar o GIL).
+    Com workers=0 o hash roda na própria thread.
+    """
+
+    def __init__(self, scheme=DEFAULT_SCHEME, cost=None, workers=0):
+        if scheme not in SCHEMES:
+            raise RuntimeError(f"PASSWORD_HASH_SCHEME inválido: {scheme}")
+        self.scheme = scheme
+        self.cost = int(cost) if cost else SCHEMES[scheme]
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        with self._lock:
+            if self._executor is None:
+                # spawn: os processos não herdam threads/conexões do processo da API
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+        return self._executor.submit(func, *args).result()
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.scheme, self.cost)
+
+    def verify(self, password, password_hash):
+        return self._run(verify_password, password, password_hash)
+
+    def needs_rehash(self, password_hash):
+        # O hash foi gerado com outro esquema ou custo que o configurado
+        return hash_parameters(password_hash) != (self.scheme, self.cost)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+def get_password_hasher():
+    """
+    Retorna o PasswordHasher da aplicação, criado na primeira utilização a partir de
+    PASSWORD_HASH_SCHEME, PASSWORD_HASH_COST e PASSWORD_HASH_WORKERS
+    (processos por processo da API; padrão DEFAULT_WORKERS, 0 = sem pool).
+    """
+    with _hasher_lock:
+        hasher = current_app.extensions.get("password_hasher")
+        if hasher is None:
+            config = current_app.config
+            hasher = PasswordHasher(
+                scheme=config.get("PASSWORD_HASH_SCHEME", DEFAULT_SCHEME),
+                cost=config.get("PASSWORD_HASH_COST"),
+                workers=int(config.get("PASSWORD_HASH_WORKERS", DEFAULT_WORKERS)),
+            )
+            current_app.extensions["password_hasher"] = hasher
+        return hasher
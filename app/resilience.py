@@ -0,0 +1,243 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from flask import current_app
+
+DEFAULT_TIMEOUT = 10.0  # segundos por chamada ao armazenamento
+DEFAULT_MAX_CONCURRENT = 8  # chamadas simultâneas ao armazenamento (bulkhead)
+DEFAULT_BULKHEAD_WAIT = 0.5  # segundos esperando uma vaga antes de rejeitar
+DEFAULT_FAILURE_THRESHOLD = 5  # falhas seguidas que abrem o circuito
+DEFAULT_RESET_TIMEOUT = 30.0  # segundos com o circuito aberto até a próxima sonda
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class StorageUnavailableError(Exception):
+    # A chamada ao armazenamento não foi feita ou não terminou a tempo
+    pass
+
+
+class CircuitOpenError(StorageUnavailableError):
+    pass
+
+
+class BulkheadFullError(StorageUnavailableError):
+    pass
+
+
+class CallTimeoutError(StorageUnavailableError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Disjuntor: depois de failure_threshold falhas seguidas o circuito abre e as
+    chamadas falham na hora. Passados reset_timeout segundos ele fica meio aberto
+    e deixa passar uma única chamada de sonda: sucesso fecha, falha reabre.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.opened = 0
+        self.rejections = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def allow(self):
+        # Reserva a passagem de uma chamada; levanta CircuitOpenError se não puder
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejections += 1
+        raise CircuitOpenError("armazenamento de imagens indisponível (circuito aberto)")
+
+    def cancel(self):
+        # A chamada autorizada por allow() não chegou a ser feita
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opened += 1
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self._probing = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "opened": self.opened,
+                "rejections": self.rejections,
+            }
+
+
+class Bulkhead:
+    """
+    Limita quantas threads ficam dentro do I/O de imagens ao mesmo tempo.
+    Quem não consegue vaga em max_wait segundos é rejeitado, em vez de ficar
+    preso esperando um armazenamento lento.
+    """
+
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT, max_wait=DEFAULT_BULKHEAD_WAIT):
+        self.max_concurrent = max_concurrent
+        self.max_wait = max_wait
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.rejections = 0
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.max_wait):
+            with self._lock:
+                self.rejections += 1
+            raise BulkheadFullError("armazenamento de imagens ocupado, tente novamente")
+        with self._lock:
+            self.active += 1
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "active": self.active,
+                "rejections": self.rejections,
+            }
+
+
+class StorageGuard:
+    """
+    Envolve as chamadas ao armazenamento com disjuntor, bulkhead e timeout.
+    A chamada roda em um pool do tamanho do bulkhead; quem chamou espera no
+    máximo timeout segundos. Uma thread não pode ser interrompida, então a vaga
+    do bulkhead só é devolvida quando a chamada de fato termina: um armazenamento
+    travado esgota as vagas e as próximas chamadas são rejeitadas na hora.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, breaker=None, bulkhead=None):
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.bulkhead = bulkhead or Bulkhead()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.bulkhead.max_concurrent, thread_name_prefix="storage-call"
+        )
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    def call(self, func, *args, **kwargs):
+        self.breaker.allow()
+        try:
+            self.bulkhead.acquire()
+        except BulkheadFullError:
+            # lotação não é falha do armazenamento; libera a sonda, se era uma
+            self.breaker.cancel()
+            raise
+        with self._lock:
+            self.calls += 1
+
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+        except Exception:
+            self.bulkhead.release()
+            raise
+        future.add_done_callback(lambda _: self.bulkhead.release())
+
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self.timeouts += 1
+                self.failures += 1
+            self.breaker.record_failure()
+            raise CallTimeoutError(f"armazenamento de imagens não respondeu em {self.timeout:g}s")
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        with self._lock:
+            counters = {"calls": self.calls, "failures": self.failures, "timeouts": self.timeouts}
+        return {
+            "timeout": self.timeout,
+            **counters,
+            "breaker": self.breaker.stats(),
+            "bulkhead": self.bulkhead.stats(),
+        }
+
+
+_guard_lock = threading.Lock()
+
+
+def storage_timeout():
+    return float(current_app.config.get("STORAGE_TIMEOUT", DEFAULT_TIMEOUT))
+
+
+def get_storage_guard():
+    """
+    Retorna o StorageGuard da aplicação, criado na primeira utilização a partir de
+    STORAGE_TIMEOUT, STORAGE_MAX_CONCURRENT, STORAGE_BULKHEAD_WAIT,
+    STORAGE_BREAKER_THRESHOLD e STORAGE_BREAKER_RESET.
+    """
+    with _guard_lock:
+        guard = current_app.extensions.get("storage_guard")
+        if guard is None:
+            config = current_app.config
+            guard = StorageGuard(
+                timeout=storage_timeout(),
+                breaker=CircuitBreaker(
+                    failure_threshold=int(config.get("STORAGE_BREAKER_THRESHOLD", DEFAULT_FAILURE_THRESHOLD)),
+                    reset_timeout=float(config.get("STORAGE_BREAKER_RESET", DEFAULT_RESET_TIMEOUT)),
+                ),
+                bulkhead=Bulkhead(
+                    max_concurrent=int(config.get("STORAGE_MAX_CONCURRENT", DEFAULT_MAX_CONCURRENT)),
+                    max_wait=float(config.get("STORAGE_BULKHEAD_WAIT", DEFAULT_BULKHEAD_WAIT)),
+                ),
+            )
+            current_app.extensions["storage_guard"] = guard
+        return guard
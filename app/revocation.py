@@ -0,0 +1,269 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from .models import RevokedToken
+from .sessions import refresh_expires, revoke_family_tokens
+
+DEFAULT_CAPACITY = 100_000  # revogações previstas antes de o filtro crescer
+DEFAULT_ERROR_RATE = 0.01
+DEFAULT_LRU_SIZE = 1024
+DEFAULT_SYNC_INTERVAL = 5.0  # segundos entre as cargas incrementais
+SYNC_OVERLAP = timedelta(seconds=5)  # relógios de outros processos podem atrasar um pouco
+
+JTI, USER, FAMILY = RevokedToken.KINDS
+
+_revocation_lock = threading.Lock()
+
+
+def _epoch_ms(value):
+    # datetimes do banco são UTC sem fuso; o MongoDB guarda milissegundos
+    return int(value.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def issued_ms(jwt_payload):
+    # Emissão do token em ms (claim iat_ms de sessions.py); iat tem só segundos
+    return jwt_payload.get("iat_ms", jwt_payload.get("iat", 0) * 1000)
+
+
+class BloomFilter:
+    """
+    Filtro de Bloom: "não contém" é sempre exato; "contém" pode ser falso positivo
+    com probabilidade error_rate enquanto houver até capacity itens.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Hash duplo (Kirsch-Mitzenmacher) a partir de um único blake2b
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    """
+    Consulta de revogação para o token_in_blocklist_loader do flask-jwt-extended.
+    Um filtro de Bloom com as chaves revogadas ("jti:<jti>", "user:<id>",
+    "family:<fam>") responde
+    o caso comum (token não revogado) sem ir ao banco; só um "talvez" consulta a
+    coleção revoked_tokens, com o resultado guardado em um LRU pequeno.
+    O filtro é carregado da coleção na primeira utilização e depois recebe apenas
+    as revogações novas (created_at), a cada sync_interval segundos.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE,
+                 lru_size=DEFAULT_LRU_SIZE, sync_interval=DEFAULT_SYNC_INTERVAL, clock=time.monotonic):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.lru_size = lru_size
+        self.sync_interval = sync_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        self._bloom = None
+        self._synced_at = None  # created_at (UTC) da última carga
+        self._next_sync = 0.0
+        self.bloom_negatives = 0
+        self.lru_hits = 0
+        self.db_lookups = 0
+        self.false_positives = 0
+
+    # --- carga do filtro ---
+
+    def _load(self, since=None):
+        # Acrescenta ao filtro as revogações criadas desde since (todas, se None)
+        started = datetime.utcnow()
+        query = RevokedToken.objects(created_at__gte=since) if since else RevokedToken.objects
+        for row in query.only("kind", "key").as_pymongo().batch_size(1000):
+            key = f"{row['kind']}:{row['key']}"
+            # a janela de sobreposição traz de novo revogações já carregadas
+            if key not in self._bloom:
+                self._bloom.add(key)
+            # uma revogação nova pode contradizer um "não revogado" guardado no LRU
+            self._lru.pop(key, None)
+        self._synced_at = started
+
+    def _rebuild(self):
+        self._bloom = BloomFilter(self.capacity, self.error_rate)
+        self._lru.clear()
+        self._load()
+
+    def sync(self, force=False):
+        with self._lock:
+            if self._bloom is None:
+                self._rebuild()
+            elif force or self._clock() >= self._next_sync:
+                self._load(self._synced_at - SYNC_OVERLAP)
+                if self._bloom.count > self._bloom.capacity:
+                    # cheio demais: a taxa de falsos positivos subiria
+                    self.capacity = max(self.capacity, self._bloom.count) * 2
+                    self._rebuild()
+            else:
+                return
+            self._next_sync = self._clock() + self.sync_interval
+
+    # --- consulta ---
+
+    def _lookup(self, key, kind, value):
+        # Consulta exata (filtro disse "talvez"): LRU e depois o banco
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.lru_hits += 1
+                return self._lru[key]
+
+        row = RevokedToken.objects(kind=kind, key=value).only("not_before").as_pymongo().first()
+        # jti/family: True se revogado; user: o not_before (ou None)
+        result = (row is not None) if kind != USER else (row or {}).get("not_before")
+        with self._lock:
+            self.db_lookups += 1
+            if not result:
+                self.false_positives += 1
+            self._lru[key] = result
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+        return result
+
+    def is_revoked(self, jwt_payload):
+        self.sync()
+        jti_key = f"{JTI}:{jwt_payload['jti']}"
+        user_key = f"{USER}:{jwt_payload['sub']}"
+        family = jwt_payload.get("fam")
+        family_key = f"{FAMILY}:{family}" if family else None
+
+        with self._lock:
+            maybe_jti = jti_key in self._bloom
+            maybe_user = user_key in self._bloom
+            maybe_family = family_key is not None and family_key in self._bloom
+            if not (maybe_jti or maybe_user or maybe_family):
+                self.bloom_negatives += 1
+                return False
+
+        if maybe_jti and self._lookup(jti_key, JTI, jwt_payload["jti"]):
+            return True
+        if maybe_family and self._lookup(family_key, FAMILY, family):
+            return True
+        if maybe_user:
+            not_before = self._lookup(user_key, USER, jwt_payload["sub"])
+            if not_before is not None and issued_ms(jwt_payload) < _epoch_ms(not_before):
+                return True
+        return False
+
+    # --- revogação ---
+
+    def _added(self, key):
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(key)
+            self._lru.pop(key, None)
+
+    def revoke_token(self, jwt_payload):
+        # Revoga um token específico até ele vencer
+        expires_at = datetime.utcfromtimestamp(jwt_payload["exp"])
+        RevokedToken.objects(kind=JTI, key=jwt_payload["jti"]).update_one(
+            upsert=True, set__expires_at=expires_at, set__created_at=datetime.utcnow()
+        )
+        self._added(f"{JTI}:{jwt_payload['jti']}")
+
+    def revoke_family(self, family, lifetime):
+        # Revoga todos os tokens (access e refresh) de uma sessão; lifetime como em revoke_user
+        now = datetime.utcnow()
+        RevokedToken.objects(kind=FAMILY, key=family).update_one(
+            upsert=True, set__expires_at=now + lifetime, set__created_at=now,
+        )
+        self._added(f"{FAMILY}:{family}")
+
+    def revoke_user(self, user_id, lifetime):
+        """
+        Revoga todos os tokens do usuário emitidos antes de agora. lifetime é a
+        validade do token mais longo (refresh): depois disso o carimbo é apagado.
+        """
+        now = datetime.utcnow()
+        RevokedToken.objects(kind=USER, key=str(user_id)).update_one(
+            upsert=True, set__not_before=now, set__expires_at=now + lifetime, set__created_at=now,
+        )
+        self._added(f"{USER}:{user_id}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": self._bloom is not None,
+                "entries": self._bloom.count if self._bloom else 0,
+                "capacity": self.capacity,
+                "bloom_negatives": self.bloom_negatives,
+                "lru_size": len(self._lru),
+                "lru_hits": self.lru_hits,
+                "db_lookups": self.db_lookups,
+                "false_positives": self.false_positives,
+            }
+
+
+def get_revocation_list():
+    # REVOCATION_BLOOM_CAPACITY, REVOCATION_LRU_SIZE e REVOCATION_SYNC_INTERVAL (segundos)
+    with _revocation_lock:
+        revocations = current_app.extensions.get("revocation_list")
+        if revocations is None:
+            config = current_app.config
+            revocations = RevocationList(
+                capacity=int(config.get("REVOCATION_BLOOM_CAPACITY", DEFAULT_CAPACITY)),
+                lru_size=int(config.get("REVOCATION_LRU_SIZE", DEFAULT_LRU_SIZE)),
+                sync_interval=float(config.get("REVOCATION_SYNC_INTERVAL", DEFAULT_SYNC_INTERVAL)),
+            )
+            current_app.extensions["revocation_list"] = revocations
+        return revocations
+
+
+def revoke_token(jwt_payload):
+    get_revocation_list().revoke_token(jwt_payload)
+
+
+def revoke_session(jwt_payload):
+    """
+    Logout: encerra a sessão do token. Com a claim fam, revoga a família inteira
+    (este access token, os emitidos por renovações e os refresh tokens); tokens
+    sem fam (emitidos antes da claim) revogam apenas o próprio jti.
+    """
+    family = jwt_payload.get("fam")
+    if not family:
+        revoke_token(jwt_payload)
+        return
+    revoke_family(family)
+
+
+def revoke_family(family):
+    # Revoga a sessão inteira: access tokens com a claim fam e os refresh tokens da família
+    get_revocation_list().revoke_family(family, refresh_expires())
+    revoke_family_tokens(family)
+
+
+def revoke_user(user_id):
+    # Invalida access e refresh tokens já emitidos para o usuário
+    get_revocation_list().revoke_user(user_id, refresh_expires())
+
+
+def init_revocation(app):
+    # Liga a lista de revogação ao flask-jwt-extended (init_jwt precisa ter rodado)
+    jwt = app.extensions["flask-jwt-extended"]
+
+    @jwt.token_in_blocklist_loader
+    def _is_revoked(jwt_header, jwt_payload):
+        return get_revocation_list().is_revoked(jwt_payload)
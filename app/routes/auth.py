@@ -1,9 +1,22 @@
-from flask import request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask import request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from mongoengine.errors import NotUniqueError, ValidationError, DoesNotExist
 from ..models import User, Product
+from ..streaming import wants_stream, stream_response
+from ..cache import get_product_cache
+from ..accounts import delete_account, DEFAULT_SYNC_LIMIT, DEFAULT_CHUNK_SIZE
+from ..tasks import run_in_background
+from ..identity import current_profile, invalidate_user, profile_claims
+from ..sessions import issue_tokens, rotate, revoke_user_tokens, access_token_for, RefreshTokenError, RefreshTokenReusedError
+from ..revocation import revoke_session, revoke_family, revoke_user
+from ..pagination import parse_limit, encode_offset_cursor, decode_offset_cursor
+from ..serializers import (
+    load_related_users, serialize_products, parse_fields, apply_projection,
+    read_products, raw_reads_enabled, ProductRow, iter_serialized,
+)
 from flask import Blueprint
-from datetime import timedelta
+from mongoengine.queryset.visitor import Q
+from datetime import datetime
 
 bp = Blueprint("auth", __name__, url_prefix="/auth")
 
@@ -28,7 +41,7 @@ def register():
         return jsonify({"message": "usuário criado", "user": u.to_dict()}), 201
     except NotUniqueError:
         return jsonify({"error": "email já cadastrado"}), 409
-    except ValidationError as e:
+    except (ValidationError, ValueError) as e:
         return jsonify({"error": str(e)}), 400
 
 @bp.route("/login", methods=["POST"])
@@ -43,20 +56,45 @@ def login():
         u = User.objects.get(email=email)
         if not u.check_password(password):
             return jsonify({"error": "credenciais inválidas"}), 401
-        access_token = create_access_token(identity=str(u.id), expires_delta= timedelta(hours=4))
-        return jsonify({"access_token": access_token}), 200
+        # hash gerado com esquema/custo antigos: regrava com os parâmetros atuais
+        u.upgrade_password_hash(password)
+        # o refresh_token renova a sessão em /auth/refresh, sem reenviar a senha
+        return jsonify(issue_tokens(u)), 200
     except DoesNotExist:
         return jsonify({"error": "credenciais inválidas"}), 401
 
+@bp.route("/refresh", methods=["POST"])
+@jwt_required(refresh=True)
+def refresh():
+    """
+    Renova a sessão: troca o refresh token (Authorization: Bearer <refresh_token>)
+    por um novo access token e um novo refresh token. Cada refresh token vale
+    uma única vez; reapresentar um token já usado revoga a sessão inteira.
+    """
+    try:
+        return jsonify(rotate(get_jwt())), 200
+    except RefreshTokenReusedError as e:
+        # sessão vazada: os access tokens já emitidos para ela também caem
+        revoke_family(e.family)
+        return jsonify({"error": str(e)}), 401
+    except RefreshTokenError as e:
+        return jsonify({"error": str(e)}), 401
+
+@bp.route("/logout", methods=["POST"])
+@jwt_required()
+def logout():
+    """Encerra a sessão do token: access e refresh tokens do mesmo login são revogados"""
+    revoke_session(get_jwt())
+    return jsonify({"message": "logout realizado"}), 200
+
 @bp.route("/me", methods=["GET"])
 @jwt_required()
 def me():
-    user_id = get_jwt_identity()
-    try:
-        u = User.objects.get(id=user_id)
-        return jsonify(u.to_dict()), 200
-    except DoesNotExist:
+    # Perfil do cache de identidade (ou das claims do token, com JWT_PROFILE_CLAIMS)
+    u = current_profile()
+    if u is None:
         return jsonify({"error": "usuário não encontrado"}), 404
+    return jsonify(u.to_dict()), 200
 
 @bp.route("/me", methods=["PUT", "PATCH"])
 @jwt_required()
@@ -103,17 +141,32 @@ def update_me():
             user.set_password(password)
 
         user.save()
-
-        return jsonify({
+        invalidate_user(user_id)
+        if password:
+            # a troca de senha derruba os tokens já emitidos (access e refresh)
+            revoke_user(user.id)
+            revoke_user_tokens(user.id)
+        # Produtos embutem os dados do owner/buyer: muda o ETag e limpa o cache de listagens
+        Product.objects(Q(owner=user) | Q(buyer=user)).update(set__updated_at=datetime.utcnow())
+        get_product_cache().clear()
+
+        response = {
             "message": "dados atualizados com sucesso",
             "user": user.to_dict()
-        }), 200
+        }
+        # Tokens antigos revogados ou com o perfil desatualizado nas claims: envia novos
+        claims = profile_claims(user)
+        if password:
+            response.update(issue_tokens(user))
+        elif claims:
+            response["access_token"] = access_token_for(user_id, claims, get_jwt().get("fam"))
+        return jsonify(response), 200
 
     except DoesNotExist:
         return jsonify({"error": "usuário não encontrado"}), 404
     except NotUniqueError:
         return jsonify({"error": "email já está em uso"}), 409
-    except ValidationError as e:
+    except (ValidationError, ValueError) as e:
         return jsonify({"error": str(e)}), 400
 
 @bp.route("/me", methods=["DELETE"])
@@ -143,18 +196,19 @@ def delete_me():
                 "error": "não é possível deletar conta com produtos já vendidos. Entre em contato com o suporte."
             }), 400
 
-        # Deleta produtos não vendidos do usuário
-        Product.objects(owner=user, buyer=None).delete()
+        # Os tokens do usuário deixam de valer já, mesmo com a remoção em segundo plano
+        revoke_user(user.id)
 
-        # Remove usuário dos favoritos de outros usuários
-        users_with_favorite = User.objects(favorites=user)
-        for u in users_with_favorite:
-            if user in u.favorites:
-                u.favorites.remove(user)
-                u.save()
+        # Contas grandes: a remoção em lotes roda em segundo plano e a resposta é imediata
+        sync_limit = int(current_app.config.get("ACCOUNT_DELETE_SYNC_LIMIT", DEFAULT_SYNC_LIMIT))
+        if Product.objects(owner=user, buyer=None).count() > sync_limit:
+            chunk_size = int(current_app.config.get("ACCOUNT_DELETE_CHUNK_SIZE", DEFAULT_CHUNK_SIZE))
+            run_in_background(delete_account, user.id, chunk_size=chunk_size)
+            return jsonify({
+                "message": "exclusão da conta em andamento"
+            }), 202
 
-        # Deleta usuário
-        user.delete()
+        delete_account(user.id)
 
         return jsonify({
             "message": "conta deletada com sucesso"
@@ -165,24 +219,64 @@ def delete_me():
     except ValidationError as e:
         return jsonify({"error": str(e)}), 400
 
+def _sale_info(product, users):
+    # Informações da venda, a partir do mapa de usuários já carregado
+    return {"sale_info": {
+        'buyer': product.related_user("buyer", users),
+        'sold_at': product.created_at.isoformat()  # Pode adicionar um campo de data de venda se quiser
+    }}
+
+def _purchase_info(product, users):
+    # Informações da compra, a partir do mapa de usuários já carregado
+    return {"purchase_info": {
+        'seller': product.related_user("owner", users),
+        'purchased_at': product.created_at.isoformat()
+    }}
+
+def _stream_list(key, query, fields, extra):
+    # Resposta em streaming; o total só é conhecido ao fim do cursor
+    trailer = {"total": 0}
+
+    def items():
+        for _, data in iter_serialized(query, fields=fields, raw=raw_reads_enabled(), extra=extra):
+            trailer["total"] += 1
+            yield data
+
+    return stream_response(key, items(), trailer=lambda: trailer)
+
 @bp.route("/me/sales", methods=["GET"])
 @jwt_required()
 def my_sales():
-    """Retorna todos os produtos que o usuário vendeu (onde ele é owner e tem buyer)"""
-    user_id = get_jwt_identity()
+    """
+    Retorna todos os produtos que o usuário vendeu (onde ele é owner e tem buyer)
+    Query params:
+        - fields: lista de campos separados por vírgula (ex.: title,price)
+        - view: summary (id, title, price, thumbnail, category) ou full
+        - stream: true para enviar a resposta em chunks (também com Accept: application/x-ndjson)
+    """
     try:
-        user = User.objects.get(id=user_id)
+        fields = parse_fields(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        user = current_profile()
+        if user is None:
+            raise DoesNotExist
         # Busca produtos onde o usuário é owner e já tem um buyer (foi vendido)
-        sales = Product.objects(owner=user, buyer__ne=None)
+        query = apply_projection(Product.objects(owner=user, buyer__ne=None), fields, extra=("buyer", "created_at"))
+        if wants_stream():
+            return _stream_list("sales", query, fields, _sale_info)
+
+        sales = read_products(query, raw=raw_reads_enabled())
+        # Carrega owners e buyers de todas as vendas em uma única consulta
+        users = load_related_users(sales)
 
         sales_list = []
         for product in sales:
-            sale_data = product.to_dict()
+            sale_data = product.to_dict(users=users, fields=fields)
             # Adiciona informações da venda
-            sale_data['sale_info'] = {
-                'buyer': product.buyer.to_dict() if product.buyer else None,
-                'sold_at': product.created_at.isoformat()  # Pode adicionar um campo de data de venda se quiser
-            }
+            sale_data.update(_sale_info(product, users))
             sales_list.append(sale_data)
 
         return jsonify({
@@ -195,21 +289,36 @@ def my_sales():
 @bp.route("/me/purchases", methods=["GET"])
 @jwt_required()
 def my_purchases():
-    """Retorna todos os produtos que o usuário comprou (onde ele é buyer)"""
-    user_id = get_jwt_identity()
+    """
+    Retorna todos os produtos que o usuário comprou (onde ele é buyer)
+    Query params:
+        - fields: lista de campos separados por vírgula (ex.: title,price)
+        - view: summary (id, title, price, thumbnail, category) ou full
+        - stream: true para enviar a resposta em chunks (também com Accept: application/x-ndjson)
+    """
     try:
-        user = User.objects.get(id=user_id)
+        fields = parse_fields(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        user = current_profile()
+        if user is None:
+            raise DoesNotExist
         # Busca produtos onde o usuário é buyer
-        purchases = Product.objects(buyer=user)
+        query = apply_projection(Product.objects(buyer=user), fields, extra=("owner", "created_at"))
+        if wants_stream():
+            return _stream_list("purchases", query, fields, _purchase_info)
+
+        purchases = read_products(query, raw=raw_reads_enabled())
+        # Carrega owners e buyers de todas as compras em uma única consulta
+        users = load_related_users(purchases)
 
         purchases_list = []
         for product in purchases:
-            purchase_data = product.to_dict()
+            purchase_data = product.to_dict(users=users, fields=fields)
             # Adiciona informações da compra
-            purchase_data['purchase_info'] = {
-                'seller': product.owner.to_dict() if product.owner else None,
-                'purchased_at': product.created_at.isoformat()
-            }
+            purchase_data.update(_purchase_info(product, users))
             purchases_list.append(purchase_data)
 
         return jsonify({
@@ -222,19 +331,50 @@ def my_purchases():
 @bp.route("/me/favorites", methods=["GET"])
 @jwt_required()
 def my_favorites():
-    """Retorna todos os produtos favoritos do usuário"""
+    """
+    Retorna os produtos favoritos do usuário, paginados na ordem em que foram favoritados
+    Query params:
+        - limit: itens por página (padrão 20, máximo 100)
+        - cursor: valor de next_cursor da página anterior
+        - fields: lista de campos separados por vírgula (ex.: title,price)
+        - view: summary (id, title, price, thumbnail, category) ou full
+    """
     user_id = get_jwt_identity()
     try:
-        user = User.objects.get(id=user_id)
-        favorites_list = []
+        fields = parse_fields(request.args)
+        limit = parse_limit(request.args.get("limit"))
+        cursor = request.args.get("cursor", "").strip()
+        offset = decode_offset_cursor(cursor) if cursor else 0
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        # Converte a lista de referências em dicionários
-        if not user.favorites:
-            favorites_list += [product.to_dict() for product in user.favorites if product]
+    try:
+        # Total e ids da página em uma única ida ao banco ($size + $slice),
+        # sem trazer a lista inteira de favoritos
+        page = next(User.objects(id=user_id).aggregate([
+            {"$project": {
+                "total": {"$size": "$favorites"},
+                "ids": {"$slice": ["$favorites", offset, limit + 1]},
+            }},
+        ]), None)
+        if page is None:
+            raise DoesNotExist
+        favorite_ids = page["ids"][:limit]
+        next_cursor = encode_offset_cursor(offset + limit) if len(page["ids"]) > limit else None
+
+        # Busca os produtos da página em uma única consulta, mantendo a ordem da lista
+        query = apply_projection(Product.objects, fields)
+        if raw_reads_enabled():
+            products = {pid: ProductRow(row) for pid, row in query.as_pymongo().in_bulk(favorite_ids).items()}
+        else:
+            products = query.in_bulk(favorite_ids)
+        favorites = [products[pid] for pid in favorite_ids if pid in products]
+        favorites_list = serialize_products(favorites, fields=fields)
 
         return jsonify({
-            "total": len(favorites_list),
-            "favorites": favorites_list
+            "total": page["total"],
+            "favorites": favorites_list,
+            "next_cursor": next_cursor
         }), 200
     except DoesNotExist:
         return jsonify({"error": "usuário não encontrado"}), 404
@@ -0,0 +1,24 @@
+from flask import Blueprint, jsonify
+from ..cache import get_product_cache
+from ..images import get_dedup_stats
+from ..resilience import get_storage_guard
+from ..identity import get_user_cache
+from ..revocation import get_revocation_list
+from ..extensions import get_pool_stats
+
+bp = Blueprint("metrics", __name__, url_prefix="/metrics")
+
+
+@bp.route("", methods=["GET"])
+def metrics():
+    """
+    Contadores internos da aplicação (cache de listagens, etc).
+    """
+    return jsonify({
+        "product_cache": get_product_cache().stats(),
+        "image_dedup": get_dedup_stats().stats(),
+        "storage": get_storage_guard().stats(),
+        "user_cache": get_user_cache().stats(),
+        "revocation": get_revocation_list().stats(),
+        "mongo_pool": get_pool_stats().stats()
+    }), 200
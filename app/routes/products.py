@@ -1,49 +1,206 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, url_for, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from bson import ObjectId
+from datetime import datetime
 from mongoengine.errors import ValidationError, DoesNotExist, NotUniqueError
-from mongoengine.queryset.visitor import Q
-from ..models import Product, User
-import secrets
-import cloudinary.uploader
-import base64
+from ..models import Product, User, ImageJob
+from ..cache import get_product_cache, invalidate_product_listings
+from ..codes import code_settings, new_code, MAX_ATTEMPTS
+from ..identity import current_user
+from ..extensions import get_pymongo_db
+from ..facets import available_counts, aggregate_facets, record_change
+from ..images import (
+    decode_image, enqueue_image, upload_many, append_images, max_images, image_folder,
+    ImageLimitError, DEFAULT_SIGNATURE_TTL,
+)
+from ..storage import get_storage, UPLOAD_CONTENT_TYPES
+from ..http_cache import product_etag, body_etag, not_modified, conditional_response
+from ..pagination import paginate, parse_limit, page_query, decode_cursor, encode_cursor, SORTS, DEFAULT_SORT
+from ..search import get_search_backend, fold
+from ..serializers import serialize_products, parse_fields, apply_projection, raw_reads_enabled, iter_serialized
+from ..streaming import wants_stream, stream_response
+import math
+import uuid
 
 
 bp = Blueprint("products", __name__, url_prefix="/products")
 
 
+def _parse_price_range(args):
+    # Lê min_price/max_price; levanta ValueError com a mensagem de erro
+    bounds = []
+    for name in ("min_price", "max_price"):
+        raw = args.get(name, "").strip()
+        if not raw:
+            bounds.append(None)
+            continue
+        try:
+            value = float(raw)
+        except ValueError:
+            raise ValueError(f"{name} deve ser um número")
+        # float() aceita "nan" e "inf"; nan != nan criaria uma chave de cache por requisição
+        if not math.isfinite(value):
+            raise ValueError(f"{name} deve ser um número")
+        if value < 0:
+            raise ValueError(f"{name} deve ser maior ou igual a 0")
+        bounds.append(value)
+
+    min_price, max_price = bounds
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise ValueError("min_price deve ser menor ou igual a max_price")
+    return min_price, max_price
+
+
+def _available_products(search_query, category, estado_de_conservacao, min_price=None, max_price=None):
+    # Consulta de produtos disponíveis com os filtros de listagem
+    # Busca apenas produtos que ainda não foram "reservados" por um comprador
+    query = Product.objects(buyer=None)
+
+    # Se houver termo de busca, filtra pelo índice de busca (title e description)
+    if search_query:
+        query = get_search_backend().filter(query, search_query)
+
+    # Filtro por categoria
+    if category:
+        query = query.filter(category=category)
+
+    # Filtro por estado de conservação
+    if estado_de_conservacao:
+        query = query.filter(estado_de_conservacao=estado_de_conservacao)
+
+    # Faixa de preço (range depois das igualdades e da ordenação no índice)
+    if min_price is not None:
+        query = query.filter(price__gte=min_price)
+    if max_price is not None:
+        query = query.filter(price__lte=max_price)
+
+    return query
+
 
 @bp.route("", methods=["GET"])
 def list_products():
     """
     Lista produtos disponíveis (não comprados e não em negociação).
     Query params:
-        - q: string de busca (busca em title e description)
+        - q: string de busca (busca por palavras em title e description, sem acentos)
         - category: filtro por categoria (eletrodomésticos, eletrônicos, móveis, outros)
         - estado_de_conservacao: filtro por estado (novo, seminovo, usado)
+        - limit: itens por página (padrão 20, máximo 100)
+        - cursor: valor de next_cursor retornado pela página anterior
+        - min_price / max_price: faixa de preço
+        - sort: -created_at (padrão), created_at, price, -price ou featured
+        - fields: lista de campos separados por vírgula (ex.: title,price)
+        - view: summary (id, title, price, thumbnail, category) ou full
+        - stream: true para enviar a resposta em chunks (também com Accept: application/x-ndjson)
     """
     search_query = request.args.get("q", "").strip()
     category = request.args.get("category", "").strip()
     estado_de_conservacao = request.args.get("estado_de_conservacao", "").strip()
+    cursor = request.args.get("cursor", "").strip()
 
-    # Busca apenas produtos que ainda não foram "reservados" por um comprador
-    query = Product.objects(buyer=None)
+    try:
+        limit = parse_limit(request.args.get("limit", "").strip())
+    except ValueError:
+        return jsonify({"error": "limit deve ser um inteiro entre 1 e 100"}), 400
 
-    # Se houver termo de busca, filtra por title ou description
-    if search_query:
-        query = query.filter(
-            Q(title__icontains=search_query) | Q(description__icontains=search_query)
-        )
+    try:
+        fields = parse_fields(request.args)
+        min_price, max_price = _parse_price_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    # Filtro por categoria
-    if category:
-        query = query.filter(category=category)
+    sort = request.args.get("sort", "").strip() or DEFAULT_SORT
+    if sort not in SORTS:
+        return jsonify({"error": f"sort deve ser um dos seguintes: {', '.join(SORTS)}"}), 400
+
+    # Streaming não passa pelo cache: a página é gerada direto do cursor
+    stream = wants_stream()
+
+    # Cache de resultados, chaveado pelos parâmetros normalizados
+    cache = get_product_cache()
+    cache_key = cache.make_key(
+        q=" ".join(fold(search_query).split()),
+        category=category,
+        estado_de_conservacao=estado_de_conservacao,
+        limit=limit,
+        cursor=cursor,
+        fields=",".join(fields) if fields else None,
+        min_price=min_price,
+        max_price=max_price,
+        sort=sort,
+    )
+    # O cache guarda o corpo já serializado e seu ETag
+    cached = None if stream else cache.get(cache_key)
+    if cached is not None:
+        return conditional_response(*cached)
+
+    query = _available_products(search_query, category, estado_de_conservacao, min_price, max_price)
+
+    # Lê do banco apenas os campos pedidos (e as chaves de ordenação, usadas pelo cursor)
+    query = apply_projection(query, fields, extra=tuple(name for name, _ in SORTS[sort]))
+
+    if stream:
+        try:
+            decode_cursor(cursor, sort) if cursor else None
+        except ValueError:
+            return jsonify({"error": "cursor inválido"}), 400
+        return _stream_page(query, cursor, limit, fields, sort)
+
+    # Paginação por cursor (keyset): o custo de qualquer página é o mesmo da primeira
+    try:
+        products, next_cursor = paginate(query, cursor=cursor, limit=limit, raw=raw_reads_enabled(), sort=sort)
+    except ValueError:
+        return jsonify({"error": "cursor inválido"}), 400
+
+    data = jsonify({
+        "products": serialize_products(products, fields=fields),
+        "next_cursor": next_cursor
+    }).get_data()
+    etag = body_etag(data)
+    cache.set(cache_key, (data, etag), category=category or None, estado=estado_de_conservacao or None)
+    return conditional_response(data, etag)
+
+
+def _stream_page(query, cursor, limit, fields, sort):
+    # Gera a página item a item; next_cursor só é conhecido ao final
+    trailer = {"next_cursor": None}
+
+    def items():
+        last = None
+        rows = iter_serialized(page_query(query, cursor, limit, sort), fields=fields, raw=raw_reads_enabled())
+        for count, (product, data) in enumerate(rows):
+            if count == limit:
+                trailer["next_cursor"] = encode_cursor(last, sort)
+                break
+            last = product
+            yield data
 
-    # Filtro por estado de conservação
-    if estado_de_conservacao:
-        query = query.filter(estado_de_conservacao=estado_de_conservacao)
+    return stream_response("products", items(), trailer=lambda: trailer)
+
+
+@bp.route("/facets", methods=["GET"])
+def product_facets():
+    """
+    Contagem de produtos disponíveis por categoria e estado de conservação.
+    Aceita os mesmos filtros de GET /products (q, category, estado_de_conservacao,
+    min_price, max_price).
+    Sem filtros, lê os contadores mantidos a cada escrita; com filtros, agrega.
+    """
+    search_query = request.args.get("q", "").strip()
+    category = request.args.get("category", "").strip()
+    estado_de_conservacao = request.args.get("estado_de_conservacao", "").strip()
+
+    try:
+        min_price, max_price = _parse_price_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    products = query.order_by("-created_at")
-    return jsonify([p.to_dict() for p in products]), 200
+    filtered = search_query or category or estado_de_conservacao
+    if not filtered and min_price is None and max_price is None:
+        return jsonify(available_counts()), 200
+
+    query = _available_products(search_query, category, estado_de_conservacao, min_price, max_price)
+    return jsonify(aggregate_facets(query)), 200
 
 
 @bp.route("", methods=["POST"])
@@ -59,7 +216,6 @@ def create_product():
         - category: string (obrigatório, valores: "eletrodomésticos", "eletrônicos", "móveis", "outros")
         - estado_de_conservacao: string (obrigatório, valores: "novo", "seminovo", "usado")
     """
-    user_id = get_jwt_identity()
     data = request.json or {}
 
     title = data.get("title", "").strip()
@@ -99,7 +255,9 @@ def create_product():
         return jsonify({"error": "price deve ser maior ou igual a 0"}), 400
 
     try:
-        user = User.objects.get(id=user_id)
+        user = current_user()
+        if user is None:
+            raise DoesNotExist
         product = Product(
             title=title,
             description=description,
@@ -109,6 +267,8 @@ def create_product():
             owner=user
         )
         product.save()
+        invalidate_product_listings(product)
+        record_change(added=[product])
         return jsonify({"message": "produto criado", "product": product.to_dict()}), 201
     except DoesNotExist:
         return jsonify({"error": "usuário não encontrado"}), 404
@@ -120,10 +280,19 @@ def create_product():
 def get_product(product_id):
     """
     Retorna detalhes de um produto específico.
+    Suporta GET condicional: com If-None-Match igual ao ETag atual, retorna 304
+    lendo apenas o updated_at do produto, sem serializá-lo.
     """
     try:
+        if request.if_none_match:
+            stamp = Product.objects.only("created_at", "updated_at").get(id=product_id)
+            response = not_modified(product_etag(stamp))
+            if response is not None:
+                return response
+
         product = Product.objects.get(id=product_id)
-        return jsonify(product.to_dict()), 200
+        data = jsonify(product.to_dict()).get_data()
+        return conditional_response(data, product_etag(product))
     except DoesNotExist:
         return jsonify({"error": "produto não encontrado"}), 404
     except ValidationError:
@@ -159,6 +328,9 @@ def update_product(product_id):
         if product.buyer:
             return jsonify({"error": "produtos já vendidos não podem ser editados"}), 400
 
+        # Categoria/estado antes da edição, para invalidar as listagens antigas e novas
+        previous = (product.category, product.estado_de_conservacao)
+
         # Campos que podem ser atualizados
         title = data.get("title", "").strip()
         description = data.get("description", "").strip()
@@ -199,6 +371,8 @@ def update_product(product_id):
             product.estado_de_conservacao = estado_de_conservacao
 
         product.save()
+        invalidate_product_listings(previous, product)
+        record_change(removed=[previous], added=[product])
 
         return jsonify({
             "message": "produto atualizado com sucesso",
@@ -235,6 +409,8 @@ def delete_product(product_id):
 
         # Deleta o produto
         product.delete()
+        invalidate_product_listings(product)
+        record_change(removed=[product])
 
         return jsonify({
             "message": "produto deletado com sucesso"
@@ -250,11 +426,12 @@ def delete_product(product_id):
 @jwt_required()
 def upload_product_image(product_id):
     """
-    Adiciona uma imagem ao produto via Cloudinary.
+    Recebe uma imagem para o produto e agenda o upload em segundo plano.
     Requer autenticação.
     Apenas o owner pode adicionar imagens.
     Body (JSON):
         - image: string base64 da imagem (obrigatório)
+    Retorna 202 com o job; o andamento fica em GET /products/<id>/images/jobs/<job_id>.
     """
     user_id = get_jwt_identity()
     data = request.json or {}
@@ -265,38 +442,214 @@ def upload_product_image(product_id):
         return jsonify({"error": "image é obrigatório"}), 400
 
     try:
-        product = Product.objects.get(id=product_id)
+        image = decode_image(image_data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        product = Product.objects.only("owner", "images").get(id=product_id)
 
         # Verifica se usuário é o owner
-        if str(product.owner.id) != user_id:
+        if str(product._data["owner"].id) != user_id:
             return jsonify({"error": "apenas o proprietário pode adicionar imagens"}), 403
 
-        # Upload da imagem para o Cloudinary
-        upload_result = cloudinary.uploader.upload(
-            image_data,
-            folder=f"marketplace/products/{product_id}",
-            transformation=[
-                {"quality": "auto", "fetch_format": "auto"}
-            ]
-        )
+        if len(product.images) >= max_images():
+            return jsonify({"error": f"limite de {max_images()} imagens por produto atingido"}), 400
 
-        # Adiciona URL da imagem ao produto
-        image_url = upload_result.get("secure_url")
-        product.images.append(image_url)
-        product.save()
+        job = enqueue_image(product, ObjectId(user_id), image)
+        status_url = url_for("products.image_job_status", product_id=product_id, job_id=str(job.id))
 
         return jsonify({
-            "message": "imagem adicionada com sucesso",
-            "image_url": image_url,
-            "product": product.to_dict()
-        }), 201
+            "message": "imagem recebida, upload em andamento",
+            "job": job.to_dict(),
+            "status_url": status_url
+        }), 202, {"Location": status_url}
 
     except DoesNotExist:
         return jsonify({"error": "produto não encontrado"}), 404
     except ValidationError:
         return jsonify({"error": "ID inválido"}), 400
-    except Exception as e:
-        return jsonify({"error": f"erro ao fazer upload da imagem: {str(e)}"}), 500
+
+
+def _owned_product_images(product_id, user_id):
+    # Produto (apenas owner e images) e resposta de erro, se houver
+    try:
+        product = Product.objects.only("owner", "images").get(id=product_id)
+    except DoesNotExist:
+        return None, (jsonify({"error": "produto não encontrado"}), 404)
+    except ValidationError:
+        return None, (jsonify({"error": "ID inválido"}), 400)
+    if str(product._data["owner"].id) != user_id:
+        return None, (jsonify({"error": "apenas o proprietário pode adicionar imagens"}), 403)
+    return product, None
+
+
+@bp.route("/<product_id>/images/batch", methods=["POST"])
+@jwt_required()
+def upload_product_images_batch(product_id):
+    """
+    Adiciona várias imagens ao produto em uma requisição.
+    Requer autenticação.
+    Apenas o owner pode adicionar imagens.
+    Body (JSON):
+        - images: lista de strings base64 (obrigatório)
+    Os uploads rodam em paralelo (pool limitado) e as URLs entram no produto
+    com um único $push. Cada imagem tem seu resultado (uploaded ou failed).
+    """
+    user_id = get_jwt_identity()
+    data = request.json or {}
+    images = data.get("images")
+
+    if not isinstance(images, list) or not images:
+        return jsonify({"error": "images deve ser uma lista não vazia"}), 400
+
+    product, error = _owned_product_images(product_id, user_id)
+    if error:
+        return error
+
+    # Verifica o limite antes de gastar banda com o upload
+    available = max_images() - len(product.images)
+    if len(images) > available:
+        return jsonify({
+            "error": f"limite de {max_images()} imagens por produto: restam {max(available, 0)}"
+        }), 400
+
+    # Decodifica cada imagem; as inválidas falham sozinhas
+    results = [None] * len(images)
+    decoded = []
+    for index, image_data in enumerate(images):
+        try:
+            decoded.append((index, decode_image(str(image_data or "").strip())))
+        except ValueError as e:
+            results[index] = {"index": index, "status": "failed", "error": str(e)}
+
+    uploads = upload_many(product_id, [image for _, image in decoded])
+    urls = []
+    for (index, _), (url, error) in zip(decoded, uploads):
+        if url:
+            urls.append(url)
+            results[index] = {"index": index, "status": "uploaded", "image_url": url}
+        else:
+            results[index] = {"index": index, "status": "failed", "error": error}
+
+    if not urls:
+        return jsonify({"error": "nenhuma imagem foi enviada", "results": results}), 400 if not decoded else 502
+
+    try:
+        product = append_images(product_id, urls)
+    except ImageLimitError as e:
+        # outro envio simultâneo ocupou as vagas: nenhuma URL foi gravada
+        results = [
+            {"index": r["index"], "status": "failed", "error": str(e)} if r["status"] == "uploaded" else r
+            for r in results
+        ]
+        return jsonify({"error": str(e), "results": results}), 409
+    if product is None:
+        return jsonify({"error": "produto não encontrado"}), 404
+
+    return jsonify({
+        "message": f"{len(urls)} de {len(images)} imagens adicionadas",
+        "results": results,
+        "images": product.images,
+        "thumbnail": product.images[0] if product.images else None
+    }), 201
+
+
+@bp.route("/<product_id>/images/sign", methods=["POST"])
+@jwt_required()
+def sign_product_image_upload(product_id):
+    """
+    Gera parâmetros assinados e de curta duração para o cliente enviar a imagem
+    direto ao armazenamento, sem os bytes passarem pela API.
+    Requer autenticação. Apenas o owner pode adicionar imagens.
+    Body (JSON, opcional):
+        - content_type: image/jpeg (padrão), image/png, image/webp ou image/gif
+    Depois do upload, o cliente chama POST /products/<id>/images/commit.
+    """
+    user_id = get_jwt_identity()
+    data = request.json or {}
+    content_type = data.get("content_type", "image/jpeg")
+
+    if content_type not in UPLOAD_CONTENT_TYPES:
+        return jsonify({"error": f"content_type deve ser um dos seguintes: {', '.join(UPLOAD_CONTENT_TYPES)}"}), 400
+
+    product, error = _owned_product_images(product_id, user_id)
+    if error:
+        return error
+
+    if len(product.images) >= max_images():
+        return jsonify({"error": f"limite de {max_images()} imagens por produto atingido"}), 400
+
+    expires_in = int(current_app.config.get("IMAGE_UPLOAD_SIGNATURE_TTL", DEFAULT_SIGNATURE_TTL))
+    upload = get_storage().sign_upload(image_folder(product_id), uuid.uuid4().hex, content_type, expires_in)
+    return jsonify({"upload": upload}), 200
+
+
+@bp.route("/<product_id>/images/commit", methods=["POST"])
+@jwt_required()
+def commit_product_image_upload(product_id):
+    """
+    Registra no produto uma imagem enviada direto ao armazenamento.
+    Requer autenticação. Apenas o owner pode adicionar imagens.
+    Body (JSON): o recibo do armazenamento
+        - local: key e signature (resposta do PUT em upload_url)
+        - Cloudinary: public_id, version e signature (resposta do upload)
+    """
+    user_id = get_jwt_identity()
+    data = request.json or {}
+
+    product, error = _owned_product_images(product_id, user_id)
+    if error:
+        return error
+
+    try:
+        key, url = get_storage().verify_upload(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # A assinatura vale só para a pasta deste produto
+    if not key.startswith(image_folder(product_id) + "/"):
+        return jsonify({"error": "upload não pertence a este produto"}), 400
+
+    if url in product.images:
+        return jsonify({"message": "imagem já registrada", "image_url": url, "images": product.images}), 200
+
+    try:
+        product = append_images(product_id, [url])
+    except ImageLimitError as e:
+        return jsonify({"error": str(e)}), 409
+    if product is None:
+        return jsonify({"error": "produto não encontrado"}), 404
+
+    return jsonify({
+        "message": "imagem adicionada com sucesso",
+        "image_url": url,
+        "images": product.images,
+        "thumbnail": product.images[0]
+    }), 201
+
+
+@bp.route("/<product_id>/images/jobs/<job_id>", methods=["GET"])
+@jwt_required()
+def image_job_status(product_id, job_id):
+    """
+    Status de um upload de imagem: pending, processing, done (com image_url) ou failed (com error).
+    Requer autenticação. Apenas o owner do produto pode consultar.
+    """
+    user_id = get_jwt_identity()
+
+    if not ObjectId.is_valid(product_id) or not ObjectId.is_valid(job_id):
+        return jsonify({"error": "ID inválido"}), 400
+
+    try:
+        job = ImageJob.objects(id=job_id, product=ObjectId(product_id)).exclude("data").no_dereference().get()
+    except DoesNotExist:
+        return jsonify({"error": "job não encontrado"}), 404
+
+    if str(job.owner.id) != user_id:
+        return jsonify({"error": "apenas o proprietário pode consultar o job"}), 403
+
+    return jsonify({"job": job.to_dict()}), 200
 
 
 @bp.route("/<product_id>/generate-code", methods=["POST"])
@@ -323,21 +676,35 @@ def generate_confirmation_code(product_id):
                 "confirmation_code": product.confirmation_code
             }), 200
 
-        # Gera código único de 8 caracteres
-        while True:
-            code = secrets.token_urlsafe(6)[:8].upper()
-            # Verifica se código já existe
-            if not Product.objects(confirmation_code=code).first():
+        # Grava o código só se o produto ainda não tem um (atualização condicional).
+        # A unicidade fica com o índice único de confirmation_code: sem consulta
+        # prévia, apenas uma nova tentativa em caso de NotUniqueError.
+        length, alphabet = code_settings()
+        for _ in range(MAX_ATTEMPTS):
+            try:
+                updated = Product.objects(id=product.id, confirmation_code=None).modify(
+                    new=True, set__confirmation_code=new_code(length, alphabet),
+                    set__updated_at=datetime.utcnow()
+                )
                 break
+            except NotUniqueError:
+                continue
+        else:
+            return jsonify({"error": "não foi possível gerar um código único, tente novamente"}), 503
+
+        # Outra requisição gerou o código antes: devolve o mesmo código
+        if updated is None:
+            code = Product.objects.only("confirmation_code").get(id=product.id).confirmation_code
+            return jsonify({
+                "message": "código já existe",
+                "confirmation_code": code
+            }), 200
 
-        # Salva código (existência do código = owner confirmou)
-        product.confirmation_code = code
-        product.save()
-
+        # existência do código = owner confirmou
         return jsonify({
             "message": "código gerado com sucesso. Envie este código para o comprador pelo WhatsApp!",
-            "confirmation_code": code,
-            "product": product.to_dict()
+            "confirmation_code": updated.confirmation_code,
+            "product": serialize_products([updated])[0]
         }), 201
 
     except DoesNotExist:
@@ -362,34 +729,56 @@ def confirm_with_code():
     if not code:
         return jsonify({"error": "confirmation_code é obrigatório"}), 400
 
-    try:
-        # Busca produto pelo código
-        product = Product.objects.get(confirmation_code=code)
+    # Confirmação em uma única atualização condicional (find_one_and_update):
+    # só grava se o código existe, ainda não tem buyer e o usuário não é o owner.
+    # Duas confirmações simultâneas não passam ambas pelo filtro.
+    buyer_id = ObjectId(user_id)
+    product = Product.objects(
+        confirmation_code=code, buyer=None, owner__ne=buyer_id
+    ).modify(new=True, set__buyer=buyer_id, set__updated_at=datetime.utcnow())
+
+    if product is not None:
+        invalidate_product_listings(product)
+        record_change(removed=[product])
+        return jsonify({
+            "message": "compra confirmada com sucesso!",
+            "product": serialize_products([product])[0]
+        }), 200
 
-        # Verifica se usuário é o owner (owner não pode confirmar como buyer)
-        if str(product.owner.id) == user_id:
-            return jsonify({"error": "você não pode confirmar a compra do seu próprio produto"}), 400
+    # Nada foi gravado: descobre o motivo (caminho de erro ou reconfirmação)
+    product = Product.objects(confirmation_code=code).first()
+    if product is None:
+        return jsonify({"error": "código inválido"}), 404
 
-        # Verifica se já tem buyer e se é diferente do atual
-        if product.buyer and str(product.buyer.id) != user_id:
-            return jsonify({"error": "este produto já foi confirmado por outro comprador"}), 400
+    # Verifica se usuário é o owner (owner não pode confirmar como buyer)
+    if product._data["owner"].id == buyer_id:
+        return jsonify({"error": "você não pode confirmar a compra do seu próprio produto"}), 400
 
-        # Busca o buyer
-        buyer = User.objects.get(id=user_id)
+    # Já confirmado por outro comprador
+    if product._data["buyer"].id != buyer_id:
+        return jsonify({"error": "este produto já foi confirmado por outro comprador"}), 400
 
-        # Atualiza produto com buyer (definir buyer = confirmar compra)
-        product.buyer = buyer
-        product.save()
+    # O mesmo comprador confirmando de novo: nada muda
+    return jsonify({
+        "message": "compra confirmada com sucesso!",
+        "product": serialize_products([product])[0]
+    }), 200
 
-        return jsonify({
-            "message": "compra confirmada com sucesso!",
-            "product": product.to_dict()
-        }), 200
 
-    except DoesNotExist:
-        return jsonify({"error": "código inválido"}), 404
-    except ValidationError as e:
-        return jsonify({"error": str(e)}), 400
+@bp.route("/<product_id>/favorite", methods=["GET"])
+@jwt_required()
+def is_favorite(product_id):
+    """
+    Indica se o produto está nos favoritos do usuário.
+    Requer autenticação. Uma única consulta, sem carregar a lista de favoritos.
+    """
+    user_id = get_jwt_identity()
+
+    if not ObjectId.is_valid(product_id):
+        return jsonify({"error": "ID inválido"}), 400
+
+    favorited = User.objects(id=user_id, favorites=ObjectId(product_id)).count() > 0
+    return jsonify({"favorited": favorited}), 200
 
 
 @bp.route("/<product_id>/favorite", methods=["POST"])
@@ -398,20 +787,27 @@ def add_favorite(product_id):
     """
     Adiciona um produto aos favoritos do usuário.
     Requer autenticação.
+    A inclusão é atômica ($addToSet): não lê a lista de favoritos e toques
+    simultâneos não perdem atualizações.
     """
     user_id = get_jwt_identity()
 
     try:
         product = Product.objects.get(id=product_id)
-        user = User.objects.get(id=user_id)
 
-        # Verifica se o produto já está nos favoritos
-        if product in user.favorites:
+        result = User.objects(id=user_id).update_one(add_to_set__favorites=product.id, full_result=True)
+        if result.matched_count == 0:
+            return jsonify({"error": "produto ou usuário não encontrado"}), 404
+
+        # Nada modificado: o produto já estava nos favoritos
+        if result.modified_count == 0:
             return jsonify({"message": "produto já está nos favoritos"}), 200
 
-        # Adiciona produto aos favoritos
-        user.favorites.append(product)
-        user.save()
+        # Contador desnormalizado usado em sort=popular
+        Product.objects(id=product.id).update_one(inc__favorites_count=1, set__updated_at=datetime.utcnow())
+        product.favorites_count += 1
+        # listagens em cache trazem favorites_count (e a ordem de sort=popular)
+        invalidate_product_listings(product)
 
         return jsonify({
             "message": "produto adicionado aos favoritos",
@@ -430,26 +826,31 @@ def remove_favorite(product_id):
     """
     Remove um produto dos favoritos do usuário.
     Requer autenticação.
+    A remoção é um único $pull atômico; não precisa carregar o produto.
     """
     user_id = get_jwt_identity()
 
-    try:
-        product = Product.objects.get(id=product_id)
-        user = User.objects.get(id=user_id)
-
-        # Verifica se o produto está nos favoritos
-        if product not in user.favorites:
-            return jsonify({"error": "produto não está nos favoritos"}), 404
-
-        # Remove produto dos favoritos
-        user.favorites.remove(product)
-        user.save()
+    if not ObjectId.is_valid(product_id):
+        return jsonify({"error": "ID inválido"}), 400
 
-        return jsonify({
-            "message": "produto removido dos favoritos"
-        }), 200
+    result = User.objects(id=user_id).update_one(pull__favorites=ObjectId(product_id), full_result=True)
+    if result.matched_count == 0:
+        return jsonify({"error": "usuário não encontrado"}), 404
 
-    except DoesNotExist:
-        return jsonify({"error": "produto ou usuário não encontrado"}), 404
-    except ValidationError:
-        return jsonify({"error": "ID inválido"}), 400
+    # Nada modificado: o produto não estava nos favoritos (ou não existe)
+    if result.modified_count == 0:
+        return jsonify({"error": "produto não está nos favoritos"}), 404
+
+    # $inc negativo direto (dec__ seria validado contra min_value=0); devolve
+    # categoria e estado do produto para invalidar as listagens em cache
+    row = get_pymongo_db()[Product._get_collection_name()].find_one_and_update(
+        {"_id": ObjectId(product_id), "favorites_count": {"$gt": 0}},
+        {"$inc": {"favorites_count": -1}, "$set": {"updated_at": datetime.utcnow()}},
+        projection={"category": 1, "estado_de_conservacao": 1},
+    )
+    if row is not None:
+        invalidate_product_listings((row["category"], row["estado_de_conservacao"]))
+
+    return jsonify({
+        "message": "produto removido dos favoritos"
+    }), 200
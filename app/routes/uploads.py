@@ -0,0 +1,59 @@
+from flask import Blueprint, abort, current_app, jsonify, request, send_file
+from ..storage import get_storage, LocalStorage
+
+bp = Blueprint("uploads", __name__, url_prefix="/uploads")
+
+DEFAULT_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+
+
+def _local_storage():
+    # As rotas só existem para o armazenamento local (com o Cloudinary, 404)
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        abort(404)
+    return storage
+
+
+@bp.route("/<path:key>", methods=["GET"])
+def get_upload(key):
+    """
+    Serve as imagens gravadas pelo armazenamento local (IMAGE_STORAGE=local).
+    Com o Cloudinary as imagens são servidas pela CDN e esta rota responde 404.
+    """
+    storage = _local_storage()
+    try:
+        path = storage.path_for(key)
+    except ValueError:
+        abort(404)
+    try:
+        return send_file(path, max_age=31536000)
+    except FileNotFoundError:
+        abort(404)
+
+
+@bp.route("/<path:key>", methods=["PUT"])
+def put_upload(key):
+    """
+    Recebe um upload direto com a URL assinada de POST /products/<id>/images/sign
+    (faz o papel do Cloudinary no armazenamento local).
+    Query params: expires e signature, como vieram em upload_url.
+    Retorna o recibo (key, signature) a enviar em POST /products/<id>/images/commit.
+    """
+    storage = _local_storage()
+    if not storage.check_upload_signature(key, request.args.get("expires"), request.args.get("signature")):
+        return jsonify({"error": "assinatura inválida ou expirada"}), 403
+
+    max_bytes = int(current_app.config.get("IMAGE_UPLOAD_MAX_BYTES", DEFAULT_MAX_UPLOAD_BYTES))
+    if request.content_length is not None and request.content_length > max_bytes:
+        return jsonify({"error": f"imagem maior que {max_bytes} bytes"}), 413
+    data = request.get_data()
+    if not data:
+        return jsonify({"error": "corpo vazio"}), 400
+    if len(data) > max_bytes:
+        return jsonify({"error": f"imagem maior que {max_bytes} bytes"}), 413
+
+    try:
+        signature = storage.receive_upload(key, data)
+    except ValueError:
+        abort(404)
+    return jsonify({"key": key, "signature": signature}), 201
@@ -0,0 +1,196 @@
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from flask import current_app, has_app_context
+from mongoengine import signals
+
+# Palavras muito comuns que não ajudam a distinguir anúncios
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "uns", "umas", "e", "ou", "de", "da", "do",
+    "das", "dos", "em", "no", "na", "nos", "nas", "para", "pra", "por", "com",
+    "sem", "que", "se", "ao", "aos", "mais", "muito",
+}
+
+# Redução de plural (RSLP simplificado), aplicada sobre o texto já sem acentos
+_PLURAL_SUFFIXES = [
+    ("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"),
+    ("ois", "ol"), ("ns", "m"), ("res", "r"), ("les", "l"), ("s", ""),
+]
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold(text):
+    # Minúsculas e sem acentos: "Sofá Retrátil" -> "sofa retratil"
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def stem(token):
+    # Stemmer leve para português: remove plural e a vogal temática final
+    if len(token) <= 3 or token.isdigit():
+        return token
+    for suffix, replacement in _PLURAL_SUFFIXES:
+        if token.endswith(suffix) and not token.endswith("ss"):
+            token = token[: -len(suffix)] + replacement
+            break
+    if len(token) > 3 and token[-1] in "aeo":
+        token = token[:-1]
+    return token
+
+
+def tokenize(text):
+    # Tokens normalizados (sem duplicatas, na ordem em que aparecem)
+    tokens = []
+    for word in _TOKEN_RE.findall(fold(text or "")):
+        if word in STOPWORDS:
+            continue
+        token = stem(word)
+        if token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def product_tokens(product):
+    return set(tokenize(product.title)) | set(tokenize(product.description))
+
+
+def matches_all(tokens, title, description):
+    # Semântica comum aos backends: todos os termos da busca precisam aparecer
+    return tokens <= (set(tokenize(title)) | set(tokenize(description)))
+
+
+class MemorySearchBackend:
+    """
+    Índice invertido em memória (token -> ids de produtos).
+    Mantido pelos sinais post_save/post_delete de Product; útil em testes
+    (mongomock não implementa $text) e em deploys com um único processo.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._postings = defaultdict(set)
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def rebuild(self, products):
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+        for product in products:
+            self.index(product)
+
+    def index(self, product):
+        product_id = product.id
+        tokens = product_tokens(product)
+        with self._lock:
+            self._discard(product_id)
+            self._documents[product_id] = tokens
+            for token in tokens:
+                self._postings[token].add(product_id)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._discard(product_id)
+
+    def _discard(self, product_id):
+        for token in self._documents.pop(product_id, ()):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.discard(product_id)
+                if not postings:
+                    del self._postings[token]
+
+    def search(self, text):
+        # Interseção das listas de postings, começando pela menor
+        tokens = tokenize(text)
+        if not tokens:
+            return set()
+        with self._lock:
+            postings = sorted((self._postings.get(t, set()) for t in tokens), key=len)
+            result = set(postings[0])
+            for other in postings[1:]:
+                result &= other
+        return result
+
+    def filter(self, queryset, text):
+        return queryset.filter(id__in=list(self.search(text)))
+
+
+class MongoSearchBackend:
+    """
+    Usa o índice de texto do MongoDB (idioma português: stemming e sem acentos).
+    O próprio Mongo mantém o índice, então index/remove não fazem nada.
+    O $text junta os termos com OU; para responder como o backend em memória
+    (todos os termos), os candidatos do $text passam pelo mesmo tokenize e só
+    ficam os que têm todos os termos da busca.
+    """
+
+    name = "mongo"
+
+    def rebuild(self, products):
+        pass
+
+    def index(self, product):
+        pass
+
+    def remove(self, product_id):
+        pass
+
+    def search(self, queryset, text):
+        tokens = set(tokenize(text))
+        if not tokens:
+            return set()
+        candidates = queryset.search_text(text, language="portuguese").only("title", "description").as_pymongo()
+        return {
+            row["_id"] for row in candidates
+            if matches_all(tokens, row.get("title"), row.get("description"))
+        }
+
+    def filter(self, queryset, text):
+        return queryset.filter(id__in=list(self.search(queryset, text)))
+
+
+BACKENDS = {
+    MemorySearchBackend.name: MemorySearchBackend,
+    MongoSearchBackend.name: MongoSearchBackend,
+}
+
+
+def get_search_backend():
+    """
+    Retorna o backend configurado em SEARCH_BACKEND ("mongo" ou "memory").
+    O backend em memória é reconstruído a partir do banco na primeira utilização.
+    """
+    backend = current_app.extensions.get("search_backend")
+    if backend is None:
+        from .models import Product
+
+        name = current_app.config.get("SEARCH_BACKEND", "mongo")
+        if name not in BACKENDS:
+            raise RuntimeError(f"SEARCH_BACKEND inválido: {name}")
+        backend = BACKENDS[name]()
+        backend.rebuild(Product.objects.only("title", "description"))
+        current_app.extensions["search_backend"] = backend
+    return backend
+
+
+def _on_product_saved(sender, document, **kwargs):
+    if has_app_context():
+        get_search_backend().index(document)
+
+
+def _on_product_deleted(sender, document, **kwargs):
+    if has_app_context():
+        get_search_backend().remove(document.id)
+
+
+def init_search(app):
+    # Liga os sinais do Product ao backend de busca da aplicação
+    from .models import Product
+
+    app.config.setdefault("SEARCH_BACKEND", "mongo")
+    signals.post_save.connect(_on_product_saved, sender=Product)
+    signals.post_delete.connect(_on_product_deleted, sender=Product)
@@ -0,0 +1,206 @@
+from flask import current_app, request
+from .models import User, Product
+
+# Campos aceitos em ?fields= (mesmas chaves de Product.to_dict)
+PRODUCT_FIELDS = (
+    "id", "title", "description", "price", "category", "estado_de_conservacao",
+    "em_destaque", "owner", "buyer", "images", "thumbnail", "favorites_count", "created_at",
+)
+
+# Representação compacta usada por clientes de navegação (?view=summary)
+SUMMARY_FIELDS = ("id", "title", "price", "thumbnail", "category")
+
+# Campos do documento necessários para gerar cada chave de to_dict
+_DOCUMENT_FIELDS = {
+    "id": (),
+    "thumbnail": ("images",),
+}
+
+
+def parse_fields(args):
+    """
+    Lê ?fields=a,b,c ou ?view=summary|full dos query params.
+    Retorna uma tupla de campos, ou None para a representação completa.
+    Levanta ValueError com a mensagem de erro se houver campos inválidos.
+    """
+    raw = args.get("fields", "").strip()
+    view = args.get("view", "").strip()
+
+    if raw:
+        fields = [f.strip() for f in raw.split(",") if f.strip()]
+        invalid = [f for f in fields if f not in PRODUCT_FIELDS]
+        if invalid:
+            raise ValueError(f"fields inválidos: {', '.join(invalid)}")
+        # id sempre acompanha a resposta
+        return tuple(sorted(set(fields) | {"id"}))
+
+    if view == "summary":
+        return SUMMARY_FIELDS
+    if view and view != "full":
+        raise ValueError("view deve ser summary ou full")
+    return None
+
+
+def apply_projection(queryset, fields, extra=()):
+    """
+    Restringe a consulta aos campos do documento necessários (.only()),
+    para que o resto nunca seja lido do disco nem trafegue pela rede.
+    extra inclui campos usados pela rota (ex.: created_at para o cursor).
+    """
+    if fields is None:
+        return queryset
+
+    document_fields = set(extra)
+    for name in fields:
+        document_fields.update(_DOCUMENT_FIELDS.get(name, (name,)))
+
+    # Só a miniatura: traz apenas o primeiro elemento de images ($slice)
+    slice_images = "thumbnail" in fields and "images" not in fields
+    if slice_images:
+        document_fields.discard("images")
+
+    queryset = queryset.only(*(document_fields or {"id"}))
+    if slice_images:
+        queryset = queryset.fields(slice__images=1)
+    return queryset
+
+
+def _ref_id(value):
+    # Id de uma referência, seja DBRef, documento já carregado ou ObjectId
+    return getattr(value, "id", value)
+
+
+# Campos de User usados por User.to_dict (evita trazer password_hash e favorites)
+_USER_FIELDS = ("email", "name", "cellphone", "created_at")
+
+
+class UserRow:
+    """
+    Usuário lido direto do pymongo (as_pymongo), sem hidratar um Document.
+    Reaproveita User.to_dict para manter exatamente o mesmo JSON.
+    """
+
+    __slots__ = ("id",) + _USER_FIELDS
+
+    def __init__(self, row):
+        self.id = row["_id"]
+        for name in _USER_FIELDS:
+            setattr(self, name, row.get(name))
+
+    to_dict = User.to_dict
+
+
+class ProductRow:
+    """
+    Produto lido direto do pymongo (as_pymongo), sem validação, proxies de
+    dereference nem rastreamento de alterações do mongoengine.
+    Reaproveita Product.to_dict para manter exatamente o mesmo JSON.
+    """
+
+    __slots__ = (
+        "id", "title", "description", "price", "category", "estado_de_conservacao",
+        "em_destaque", "owner", "buyer", "images", "favorites_count", "created_at",
+    )
+
+    def __init__(self, row):
+        self.id = row["_id"]
+        self.title = row.get("title")
+        self.description = row.get("description")
+        # mesmas conversões/defaults dos campos do Document
+        self.price = float(row["price"]) if row.get("price") is not None else None
+        self.category = row.get("category")
+        self.estado_de_conservacao = row.get("estado_de_conservacao")
+        self.em_destaque = row.get("em_destaque", False)
+        self.owner = row.get("owner")
+        self.buyer = row.get("buyer")
+        self.images = row.get("images", [])
+        self.favorites_count = row.get("favorites_count", 0)
+        self.created_at = row.get("created_at")
+
+    def related_user(self, field, users=None):
+        user_id = getattr(self, field)
+        user = users.get(user_id) if users is not None and user_id is not None else None
+        return user.to_dict() if user else None
+
+    to_dict = Product.to_dict
+
+
+def raw_reads_enabled():
+    """
+    Indica se a rota atual usa a leitura crua (sem Documents).
+    Opt-in por endpoint em RAW_READ_ENDPOINTS, ex.: "products.list_products,auth.my_sales".
+    """
+    endpoints = current_app.config.get("RAW_READ_ENDPOINTS", "")
+    if isinstance(endpoints, str):
+        endpoints = [e.strip() for e in endpoints.split(",")]
+    return request.endpoint in endpoints
+
+
+def read_products(queryset, raw=False):
+    # Itera a consulta como Documents ou, no caminho rápido, como ProductRow
+    if not raw:
+        return list(queryset)
+    batch_size = int(current_app.config.get("RAW_READ_BATCH_SIZE", 500))
+    return [ProductRow(row) for row in queryset.as_pymongo().batch_size(batch_size)]
+
+
+def load_related_users(products):
+    """
+    Carrega owner e buyer de todos os produtos com uma única consulta ($in).
+    Retorna um dict {ObjectId: User} para ser passado a Product.to_dict(users=...).
+    Para ProductRow os usuários também são lidos crus (UserRow).
+    """
+    ids = set()
+    raw = False
+    for product in products:
+        raw = isinstance(product, ProductRow)
+        for field in ("owner", "buyer"):
+            value = getattr(product, field) if raw else product._data.get(field)
+            if value is not None:
+                ids.add(_ref_id(value))
+    if not ids:
+        return {}
+
+    users = User.objects(id__in=list(ids)).only(*_USER_FIELDS)
+    if raw:
+        return {row["_id"]: UserRow(row) for row in users.as_pymongo()}
+    return {user.id: user for user in users}
+
+
+def iter_serialized(queryset, fields=None, raw=False, extra=None):
+    """
+    Percorre o cursor do Mongo em lotes de STREAM_BATCH_SIZE, gerando pares
+    (produto, dict) sem manter a consulta inteira em memória. owner/buyer são
+    carregados com uma consulta por lote. extra(produto, users) pode devolver
+    chaves adicionais para o dict (ex.: sale_info).
+    """
+    batch_size = int(current_app.config.get("STREAM_BATCH_SIZE", 200))
+    # no_cache: o QuerySet padrão guardaria todos os documentos já lidos
+    source = queryset.no_cache()
+    if raw:
+        source = source.as_pymongo()
+
+    batch = []
+    for item in source.batch_size(batch_size):
+        batch.append(ProductRow(item) if raw else item)
+        if len(batch) >= batch_size:
+            yield from _serialize_batch(batch, fields, extra)
+            batch = []
+    if batch:
+        yield from _serialize_batch(batch, fields, extra)
+
+
+def _serialize_batch(batch, fields, extra):
+    users = load_related_users(batch)
+    for product in batch:
+        data = product.to_dict(users=users, fields=fields)
+        if extra is not None:
+            data.update(extra(product, users))
+        yield product, data
+
+
+def serialize_products(products, fields=None):
+    # Serializa uma página de produtos sem dereferenciar owner/buyer um a um
+    products = list(products)
+    users = load_related_users(products)
+    return [product.to_dict(users=users, fields=fields) for product in products]
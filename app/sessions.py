@@ -0,0 +1,102 @@
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from flask_jwt_extended import create_access_token, create_refresh_token
+from .identity import current_user, profile_claims, profile_claims_enabled
+from .models import RefreshToken
+
+ACCESS_TOKEN_EXPIRES = timedelta(hours=4)
+DEFAULT_REFRESH_DAYS = 30
+
+
+class RefreshTokenError(Exception):
+    # Refresh token desconhecido, já usado, revogado ou de usuário removido
+    pass
+
+
+class RefreshTokenReusedError(RefreshTokenError):
+    # Refresh token já usado apresentado de novo: a família (sessão) vazou e
+    # os access tokens dela também precisam ser revogados (revocation.revoke_family)
+    def __init__(self, message, family):
+        super().__init__(message)
+        self.family = family
+
+
+def refresh_expires():
+    return timedelta(days=float(current_app.config.get("REFRESH_TOKEN_DAYS", DEFAULT_REFRESH_DAYS)))
+
+
+def _issued_claims(claims=None):
+    # iat_ms: instante da emissão em ms (o iat do JWT tem só segundos), comparado
+    # com os carimbos "revogar tokens emitidos antes de" (app/revocation.py)
+    return {**(claims or {}), "iat_ms": int(time.time() * 1000)}
+
+
+def access_token_for(user_id, claims=None, family=None):
+    # fam: família (sessão) de refresh tokens do login; o logout revoga a sessão por ela
+    if family:
+        claims = {**(claims or {}), "fam": family}
+    return create_access_token(
+        identity=str(user_id), expires_delta=ACCESS_TOKEN_EXPIRES, additional_claims=_issued_claims(claims)
+    )
+
+
+def _issue_refresh_token(user_id, family):
+    # Emite o refresh token e registra seu jti para detectar reuso
+    expires = refresh_expires()
+    jti = str(uuid.uuid4())
+    RefreshToken(jti=jti, family=family, user=user_id, expires_at=datetime.utcnow() + expires).save()
+    return create_refresh_token(identity=str(user_id), expires_delta=expires, additional_claims=_issued_claims({"jti": jti, "fam": family}))
+
+
+def issue_tokens(user):
+    # Par de tokens do login: abre uma nova família de refresh tokens
+    family = uuid.uuid4().hex
+    return {
+        "access_token": access_token_for(user.id, profile_claims(user), family),
+        "refresh_token": _issue_refresh_token(user.id, family),
+    }
+
+
+def rotate(jwt_payload):
+    """
+    Troca um refresh token (já com a assinatura conferida) por um novo par.
+    O token é marcado como usado com uma atualização condicional: das renovações
+    simultâneas com o mesmo token só uma passa. Apresentar de novo um token já
+    usado indica que ele vazou: a família inteira é revogada.
+    Levanta RefreshTokenError se a renovação for recusada, ou
+    RefreshTokenReusedError (com a família) no caso de reuso.
+    """
+    jti = jwt_payload["jti"]
+    now = datetime.utcnow()
+    record = RefreshToken.objects(jti=jti, used_at=None, revoked=False).modify(new=True, set__used_at=now)
+    if record is None:
+        stale = RefreshToken.objects(jti=jti).only("family", "used_at", "revoked").first()
+        if stale is not None and stale.used_at is not None and not stale.revoked:
+            RefreshToken.objects(family=stale.family).update(set__revoked=True)
+            current_app.logger.warning("refresh token reutilizado; família %s revogada", stale.family)
+            raise RefreshTokenReusedError("refresh token reutilizado; faça login novamente", stale.family)
+        raise RefreshTokenError("refresh token inválido ou revogado")
+
+    user_id = record._data["user"].id
+    claims = None
+    if profile_claims_enabled():
+        user = current_user()
+        if user is None:
+            raise RefreshTokenError("usuário não encontrado")
+        claims = profile_claims(user)
+    return {
+        "access_token": access_token_for(user_id, claims, record.family),
+        "refresh_token": _issue_refresh_token(user_id, record.family),
+    }
+
+
+def revoke_family_tokens(family):
+    # Encerra uma sessão: nenhum refresh token da família renova mais (logout)
+    RefreshToken.objects(family=family, revoked=False).update(set__revoked=True)
+
+
+def revoke_user_tokens(user_id):
+    # Encerra todas as sessões renováveis do usuário (ex.: troca de senha)
+    RefreshToken.objects(user=user_id, revoked=False).update(set__revoked=True)
@@ -0,0 +1,198 @@
+import hashlib
+import hmac
+import io
+import os
+import time
+import uuid
+import cloudinary
+import cloudinary.uploader
+import cloudinary.utils
+from flask import current_app
+from .resilience import storage_timeout
+
+# Extensão do arquivo a partir dos primeiros bytes (assinatura do formato)
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+
+
+# Tipos aceitos no upload direto (assinado) e a extensão correspondente
+UPLOAD_CONTENT_TYPES = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+
+
+def guess_extension(data):
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    for signature, extension in _SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    return ".bin"
+
+
+class CloudinaryStorage:
+    """
+    Envia as imagens para o Cloudinary (otimização automática de qualidade/formato).
+    """
+
+    name = "cloudinary"
+
+    def __init__(self, timeout=None):
+        # Timeout (segundos) da conexão HTTP do SDK
+        self.timeout = timeout
+
+    def upload(self, data, folder, name=None):
+        # Retorna a URL pública (https) da imagem
+        result = cloudinary.uploader.upload(
+            io.BytesIO(data),
+            folder=folder,
+            public_id=name,
+            timeout=self.timeout,
+            transformation=[
+                {"quality": "auto", "fetch_format": "auto"}
+            ]
+        )
+        return result.get("secure_url")
+
+    def sign_upload(self, folder, name, content_type, expires_in):
+        """
+        Parâmetros assinados para o cliente enviar a imagem direto ao Cloudinary.
+        O Cloudinary aceita a assinatura por até 1 hora a partir do timestamp.
+        """
+        config = cloudinary.config()
+        timestamp = int(time.time())
+        params = {"folder": folder, "public_id": name, "timestamp": timestamp}
+        signature = cloudinary.utils.api_sign_request(params, config.api_secret)
+        return {
+            "method": "POST",
+            "upload_url": cloudinary.utils.cloudinary_api_url("upload", resource_type="image"),
+            "fields": {**params, "api_key": config.api_key, "signature": signature},
+            "key": f"{folder}/{name}",
+            "expires_at": timestamp + expires_in,
+        }
+
+    def verify_upload(self, payload):
+        """
+        Confere a assinatura da resposta do Cloudinary (public_id, version, signature)
+        e retorna (key, url). Levanta ValueError se não conferir.
+        """
+        public_id = str(payload.get("public_id", ""))
+        version = str(payload.get("version", ""))
+        signature = str(payload.get("signature", ""))
+        if not (public_id and version and signature):
+            raise ValueError("public_id, version e signature são obrigatórios")
+        if not cloudinary.utils.verify_api_response_signature(public_id, version, signature):
+            raise ValueError("assinatura do upload inválida")
+        url, _ = cloudinary.utils.cloudinary_url(public_id, version=version, secure=True)
+        return public_id, url
+
+
+class LocalStorage:
+    """
+    Grava as imagens em disco (LOCAL_STORAGE_PATH) e as serve em LOCAL_STORAGE_URL.
+    Substitui o Cloudinary em desenvolvimento e nos testes, sem rede.
+    """
+
+    name = "local"
+
+    def __init__(self, root, base_url="/uploads", secret=""):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+        self.secret = secret or ""
+
+    def _sign(self, *parts):
+        # HMAC-SHA256, no papel da assinatura do Cloudinary
+        message = "|".join(str(part) for part in parts).encode()
+        return hmac.new(self.secret.encode(), message, hashlib.sha256).hexdigest()
+
+    def path_for(self, key):
+        # Caminho em disco de uma chave ("pasta/arquivo"), sem sair de root
+        path = os.path.abspath(os.path.join(self.root, key))
+        if os.path.commonpath([path, self.root]) != self.root:
+            raise ValueError("caminho inválido")
+        return path
+
+    def upload(self, data, folder, name=None):
+        key = f"{folder}/{name or uuid.uuid4().hex}{guess_extension(data)}"
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # grava em um arquivo temporário e renomeia: leitores nunca veem metade da imagem
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return f"{self.base_url}/{key}"
+
+    def sign_upload(self, folder, name, content_type, expires_in):
+        # URL assinada para PUT /uploads/<key>, válida por expires_in segundos
+        key = f"{folder}/{name}{UPLOAD_CONTENT_TYPES[content_type]}"
+        expires = int(time.time()) + expires_in
+        signature = self._sign("put", key, expires)
+        return {
+            "method": "PUT",
+            "upload_url": f"{self.base_url}/{key}?expires={expires}&signature={signature}",
+            "fields": {},
+            "key": key,
+            "expires_at": expires,
+        }
+
+    def check_upload_signature(self, key, expires, signature):
+        # Assinatura do PUT válida e ainda não expirada
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return False
+        expected = self._sign("put", key, expires)
+        return expires >= time.time() and hmac.compare_digest(expected, str(signature or ""))
+
+    def receive_upload(self, key, data):
+        # Grava o upload direto e retorna o recibo assinado usado no commit
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return self._sign("stored", key)
+
+    def verify_upload(self, payload):
+        # Confere o recibo de receive_upload e retorna (key, url)
+        key = str(payload.get("key", ""))
+        signature = str(payload.get("signature", ""))
+        if not (key and signature):
+            raise ValueError("key e signature são obrigatórios")
+        if not hmac.compare_digest(self._sign("stored", key), signature):
+            raise ValueError("assinatura do upload inválida")
+        if not os.path.isfile(self.path_for(key)):
+            raise ValueError("upload não encontrado")
+        return key, f"{self.base_url}/{key}"
+
+
+def get_storage():
+    """
+    Retorna o armazenamento configurado em IMAGE_STORAGE ("cloudinary" ou "local").
+    Criado na primeira utilização, como o backend de busca.
+    """
+    storage = current_app.extensions.get("image_storage")
+    if storage is None:
+        name = current_app.config.get("IMAGE_STORAGE", CloudinaryStorage.name)
+        if name == CloudinaryStorage.name:
+            storage = CloudinaryStorage(timeout=storage_timeout())
+        elif name == LocalStorage.name:
+            storage = LocalStorage(
+                current_app.config.get("LOCAL_STORAGE_PATH", "uploads"),
+                current_app.config.get("LOCAL_STORAGE_URL", "/uploads"),
+                # assina as URLs de upload direto
+                current_app.config.get("LOCAL_STORAGE_SECRET") or current_app.config.get("JWT_SECRET_KEY"),
+            )
+        else:
+            raise RuntimeError(f"IMAGE_STORAGE inválido: {name}")
+        current_app.extensions["image_storage"] = storage
+    return storage
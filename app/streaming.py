@@ -0,0 +1,62 @@
+from flask import Response, current_app, request, stream_with_context
+from .cache import config_bool
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# Quantidade de itens serializados agrupados em cada chunk enviado ao cliente
+CHUNK_ITEMS = 50
+
+
+def wants_ndjson():
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def wants_stream():
+    # Streaming com ?stream=true ou sempre que o cliente pede NDJSON
+    return wants_ndjson() or config_bool(request.args.get("stream"))
+
+
+def _chunked(parts):
+    buffer = []
+    for part in parts:
+        buffer.append(part)
+        if len(buffer) >= CHUNK_ITEMS:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
+
+
+def stream_response(key, items, trailer=None):
+    """
+    Resposta gerada aos poucos a partir de um iterador de dicts, para que a
+    memória por requisição não cresça com o número de itens.
+
+    JSON: {"<key>": [item, ...], <chaves de trailer()>}
+    NDJSON: um item por linha; a última linha traz o trailer (ex.: {"total": 3}).
+    trailer é chamado depois que items termina (total, next_cursor, ...).
+    """
+    dumps = current_app.json.dumps
+    trailer = trailer or dict
+
+    if wants_ndjson():
+        def generate():
+            for item in items:
+                yield dumps(item) + "\n"
+            yield dumps(trailer()) + "\n"
+
+        mimetype = NDJSON_MIMETYPE
+    else:
+        def generate():
+            yield "{" + dumps(key) + ":["
+            for index, item in enumerate(items):
+                yield ("," if index else "") + dumps(item)
+            yield "]"
+            for name, value in trailer().items():
+                yield "," + dumps(name) + ":" + dumps(value)
+            yield "}"
+
+        mimetype = "application/json"
+
+    return Response(stream_with_context(_chunked(generate())), mimetype=mimetype)
@@ -0,0 +1,27 @@
+import threading
+from flask import current_app
+from .cache import config_bool
+
+
+def run_in_background(func, *args, **kwargs):
+    """
+    Executa func(*args, **kwargs) em uma thread com o contexto da aplicação,
+    para que a requisição responda sem esperar o trabalho pesado.
+    Com BACKGROUND_TASKS_EAGER=true (útil em testes) executa na própria requisição.
+    Retorna a thread iniciada, ou None se executou na hora.
+    """
+    app = current_app._get_current_object()
+    if config_bool(app.config.get("BACKGROUND_TASKS_EAGER")):
+        func(*args, **kwargs)
+        return None
+
+    def run():
+        with app.app_context():
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                app.logger.exception("falha na tarefa em segundo plano %s", func.__name__)
+
+    thread = threading.Thread(target=run, name=f"task-{func.__name__}", daemon=True)
+    thread.start()
+    return thread
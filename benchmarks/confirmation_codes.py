@@ -0,0 +1,64 @@
+"""
+Benchmark da geração de códigos de confirmação (app/codes.py).
+
+Sorteia `--products` códigos como o POST /products/<id>/generate-code faria
+(um novo sorteio a cada colisão com o índice único) e compara as colisões
+observadas com a estimativa analítica. Não precisa de MongoDB: um set faz o
+papel do índice único.
+
+Uso:
+    python benchmarks/confirmation_codes.py
+    python benchmarks/confirmation_codes.py --products 200000 --length 6
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.codes import (  # noqa: E402
+    DEFAULT_ALPHABET, DEFAULT_LENGTH, new_code,
+    collision_rate, expected_collisions, any_collision_probability,
+)
+
+
+def simulate(products, length, alphabet):
+    codes = set()
+    collisions = 0
+    for _ in range(products):
+        code = new_code(length, alphabet)
+        while code in codes:
+            collisions += 1
+            code = new_code(length, alphabet)
+        codes.add(code)
+    return collisions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--length", type=int, default=DEFAULT_LENGTH)
+    parser.add_argument("--alphabet", default=DEFAULT_ALPHABET)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    size = len(args.alphabet)
+    print(f"códigos possíveis: {size}^{args.length} = {size ** args.length:.3e}")
+    print(f"produtos: {args.products:,}")
+    print(f"chance de colisão do próximo código: {collision_rate(args.products, args.length, size):.3e}")
+    print(f"colisões (retries) esperadas no total: {expected_collisions(args.products, args.length, size):.4f}")
+    print(f"chance de pelo menos uma colisão: {any_collision_probability(args.products, args.length, size):.2%}")
+
+    observed = []
+    for run in range(args.runs):
+        start = time.perf_counter()
+        collisions = simulate(args.products, args.length, args.alphabet)
+        elapsed = time.perf_counter() - start
+        observed.append(collisions)
+        print(f"execução {run + 1}: {collisions} colisões, {args.products / elapsed:,.0f} códigos/s")
+    print(f"média observada: {sum(observed) / len(observed):.4f} colisões")
+
+
+if __name__ == "__main__":
+    main()
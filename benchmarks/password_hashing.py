@@ -0,0 +1,85 @@
+"""
+Benchmark do hash de senhas (app/passwords.py) no login.
+
+Simula `--threads` threads de requisição atendendo logins (conferência do hash)
+enquanto outra thread mede a latência de uma requisição leve, como um
+GET /products servido do cache. Compara o hash na própria thread (workers=0)
+com o pool de processos (`--workers`). Não precisa de MongoDB nem do Flask.
+
+Uso:
+    python benchmarks/password_hashing.py
+    python benchmarks/password_hashing.py --scheme bcrypt --cost 12 --workers 4
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.passwords import SCHEMES, DEFAULT_SCHEME, PasswordHasher, hash_password  # noqa: E402
+
+
+def light_request():
+    # Trabalho de CPU pequeno, da ordem de serializar uma página em cache
+    return sum(i * i for i in range(20000))
+
+
+def run(hasher, password_hash, logins, threads, duration_light):
+    latencies = []
+    done = threading.Event()
+
+    def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            light_request()
+            latencies.append(time.perf_counter() - start)
+            time.sleep(duration_light)
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda _: hasher.verify("senha-de-teste", password_hash), range(logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    prober.join()
+
+    assert all(results)
+    latencies.sort()
+    return {
+        "logins/s": logins / elapsed,
+        "leve p50 (ms)": statistics.median(latencies) * 1000,
+        "leve p95 (ms)": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scheme", choices=sorted(SCHEMES), default=DEFAULT_SCHEME)
+    parser.add_argument("--cost", type=int, default=None)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=8, help="threads de requisição")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processos do pool")
+    args = parser.parse_args()
+
+    cost = args.cost or SCHEMES[args.scheme]
+    password_hash = hash_password("senha-de-teste", args.scheme, cost)
+    print(f"esquema: {args.scheme}, custo: {cost}, logins: {args.logins}, threads: {args.threads}")
+
+    for label, workers in (("na thread", 0), (f"pool de {args.workers} processos", args.workers)):
+        hasher = PasswordHasher(args.scheme, cost, workers=workers)
+        # aquece o pool para não medir a criação dos processos
+        hasher.verify("senha-de-teste", password_hash)
+        try:
+            result = run(hasher, password_hash, args.logins, args.threads, duration_light=0.005)
+        finally:
+            hasher.shutdown()
+        print(f"{label}: " + ", ".join(f"{name} {value:,.1f}" for name, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
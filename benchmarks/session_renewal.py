@@ -0,0 +1,75 @@
+"""
+Benchmark do custo de CPU de renovar uma sessão (app/sessions.py).
+
+Compara os dois fluxos, lado a lado:
+- login de novo: confere a senha (hash do PASSWORD_HASH_SCHEME) e emite um access token;
+- refresh: confere a assinatura do refresh token e emite um novo par de tokens.
+Mede o tempo de CPU (time.process_time) por renovação. Não precisa de MongoDB:
+o registro do refresh token no banco fica de fora nos dois fluxos.
+
+Uso:
+    python benchmarks/session_renewal.py
+    python benchmarks/session_renewal.py --scheme bcrypt --cost 12 --renewals 20
+"""
+import argparse
+import os
+import sys
+import time
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token, decode_token
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.passwords import SCHEMES, DEFAULT_SCHEME, hash_password, verify_password  # noqa: E402
+from app.sessions import ACCESS_TOKEN_EXPIRES  # noqa: E402
+
+PASSWORD = "senha-de-teste"
+USER_ID = "65a1f0c2e4b0a1b2c3d4e5f6"
+
+
+def relogin(password_hash):
+    assert verify_password(PASSWORD, password_hash)
+    return create_access_token(identity=USER_ID, expires_delta=ACCESS_TOKEN_EXPIRES)
+
+
+def refresh(refresh_token):
+    payload = decode_token(refresh_token)
+    return (
+        create_access_token(identity=payload["sub"], expires_delta=ACCESS_TOKEN_EXPIRES),
+        create_refresh_token(identity=payload["sub"], additional_claims={"fam": payload["fam"]}),
+    )
+
+
+def measure(func, arg, renewals):
+    start = time.process_time()
+    for _ in range(renewals):
+        func(arg)
+    return (time.process_time() - start) / renewals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scheme", choices=sorted(SCHEMES), default=DEFAULT_SCHEME)
+    parser.add_argument("--cost", type=int, default=None)
+    parser.add_argument("--renewals", type=int, default=50)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = "benchmark-secret-key-com-32-bytes!!"
+    JWTManager(app)
+
+    cost = args.cost or SCHEMES[args.scheme]
+    password_hash = hash_password(PASSWORD, args.scheme, cost)
+    with app.app_context():
+        refresh_token = create_refresh_token(identity=USER_ID, additional_claims={"fam": "bench"})
+        relogin_cpu = measure(relogin, password_hash, args.renewals)
+        refresh_cpu = measure(refresh, refresh_token, args.renewals)
+
+    print(f"esquema: {args.scheme}, custo: {cost}, renovações: {args.renewals}")
+    print(f"login de novo: {relogin_cpu * 1000:8.2f} ms de CPU por renovação")
+    print(f"refresh:       {refresh_cpu * 1000:8.2f} ms de CPU por renovação")
+    print(f"refresh é {relogin_cpu / refresh_cpu:,.0f}x mais barato")
+
+
+if __name__ == "__main__":
+    main()
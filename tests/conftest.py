@@ -1,12 +1,14 @@
 import pytest
 import mongomock
+from collections import Counter
+from mongomock.collection import Collection
 from app import create_app
-from app.models import User, Product
+from app.models import User, Product, ImageJob, ImageBlob, RefreshToken, RevokedToken
 from mongoengine import disconnect
 
 
 @pytest.fixture(scope="function")
-def app():
+def app(tmp_path):
     """
     Cria uma instância da aplicação Flask para testes.
     Usa mongomock para simular o MongoDB.
@@ -17,7 +19,14 @@ def app():
     test_app.config.update({
         "TESTING": True,
         "MONGO_URI": "mongomock://localhost/test_db",
-        "JWT_SECRET_KEY": "test-secret-key-for-testing-only"
+        "JWT_SECRET_KEY": "test-secret-key-for-testing-only",
+        # mongomock não implementa $text; usa o índice invertido em memória
+        "SEARCH_BACKEND": "memory",
+        # imagens gravadas em disco, sem rede
+        "IMAGE_STORAGE": "local",
+        "LOCAL_STORAGE_PATH": str(tmp_path / "uploads"),
+        # hash de senha na própria thread: um pool de processos por teste seria lento
+        "PASSWORD_HASH_WORKERS": 0
     })
 
     # Limpa coleções antes do teste
@@ -32,6 +41,20 @@ def app():
 
     yield test_app
 
+    # Para os workers de imagem que o teste tenha iniciado
+    pool = test_app.extensions.get("image_workers")
+    if pool is not None:
+        pool.stop()
+    executor = test_app.extensions.get("image_upload_executor")
+    if executor is not None:
+        executor.shutdown()
+    guard = test_app.extensions.get("storage_guard")
+    if guard is not None:
+        guard.shutdown()
+    hasher = test_app.extensions.get("password_hasher")
+    if hasher is not None:
+        hasher.shutdown()
+
     # Cleanup após cada teste
     try:
         User.objects.delete()
@@ -41,6 +64,10 @@ def app():
         Product.objects.delete()
     except:
         pass
+    ImageJob.objects.delete()
+    ImageBlob.objects.delete()
+    RefreshToken.objects.delete()
+    RevokedToken.objects.delete()
     disconnect(alias='default')
 
 
@@ -124,3 +151,56 @@ def sample_product(client, auth_headers):
     }
     response = client.post("/products", json=product_data, headers=auth_headers)
     return response.json["product"]
+
+
+@pytest.fixture(scope="function")
+def collection_reads(monkeypatch):
+    """
+    Conta as consultas (find/find_one/dereference) feitas em cada coleção do mongomock.
+    """
+    reads = Counter()
+    original_find = Collection.find
+
+    def counting_find(self, *args, **kwargs):
+        reads[self.name] += 1
+        return original_find(self, *args, **kwargs)
+
+    monkeypatch.setattr(Collection, "find", counting_find)
+    return reads
+
+
+@pytest.fixture(scope="function")
+def create_products(client):
+    """
+    Fábrica de produtos via POST /products; retorna os ids na ordem de criação.
+    Cria count produtos ("Produto 0", "Produto 1", ...) ou um por preço de prices;
+    os demais campos (title, category, estado_de_conservacao, ...) substituem o padrão.
+    """
+    def create(headers, count=1, prices=None, **fields):
+        ids = []
+        for i, price in enumerate(prices or [10.0] * count):
+            product = {
+                "title": f"Produto {i}", "description": "Desc", "price": price,
+                "category": "outros", "estado_de_conservacao": "usado", **fields,
+            }
+            ids.append(client.post("/products", json=product, headers=headers).json["product"]["id"])
+        return ids
+
+    return create
+
+
+class FakeClock:
+    # Relógio controlado pelo teste (avança mudando now)
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(scope="function")
+def clock():
+    """
+    Relógio falso para as classes que recebem clock= (cache, disjuntor).
+    """
+    return FakeClock()
@@ -1,4 +1,8 @@
 import pytest
+from collections import Counter
+from mongomock.collection import Collection
+from app.models import User, Product, RefreshToken, ImageJob
+from app.routes import auth as auth_routes
 
 
 class TestRegister:
@@ -197,3 +201,363 @@ class TestMe:
         response = client.get("/auth/me", headers=headers)
 
         assert response.status_code == 422
+
+
+class TestRefresh:
+    """Renovação de sessão (POST /auth/refresh)"""
+
+    def _login(self, client):
+        client.post("/auth/register", json={"email": "refresh@example.com", "name": "Refresh", "password": "senha12345", "cellphone": "+5511966665555"})
+        return client.post("/auth/login", json={"email": "refresh@example.com", "password": "senha12345"}).json
+
+    def _refresh(self, client, token):
+        return client.post("/auth/refresh", headers={"Authorization": f"Bearer {token}"})
+
+    def test_login_returns_refresh_token(self, client):
+        tokens = self._login(client)
+
+        assert tokens["refresh_token"]
+        assert RefreshToken.objects.count() == 1
+
+    def test_refresh_rotates_tokens(self, client, monkeypatch):
+        """A renovação não confere a senha e emite um novo par de tokens"""
+        tokens = self._login(client)
+        monkeypatch.setattr(User, "check_password", lambda self, password: pytest.fail("senha conferida na renovação"))
+
+        response = self._refresh(client, tokens["refresh_token"])
+
+        assert response.status_code == 200
+        assert response.json["refresh_token"] != tokens["refresh_token"]
+        me = client.get("/auth/me", headers={"Authorization": f"Bearer {response.json['access_token']}"})
+        assert me.json["email"] == "refresh@example.com"
+        # o novo refresh token também renova
+        assert self._refresh(client, response.json["refresh_token"]).status_code == 200
+
+    def test_reuse_revokes_family(self, client):
+        """Reapresentar um refresh token já usado revoga toda a família"""
+        tokens = self._login(client)
+        rotated = self._refresh(client, tokens["refresh_token"]).json
+
+        reused = self._refresh(client, tokens["refresh_token"])
+
+        assert reused.status_code == 401
+        assert "reutilizado" in reused.json["error"]
+        # o token legítimo mais recente também deixa de valer
+        assert self._refresh(client, rotated["refresh_token"]).status_code == 401
+
+    def test_reuse_revokes_family_access_tokens(self, client):
+        """Access tokens já emitidos para a família vazada também são recusados"""
+        tokens = self._login(client)
+        rotated = self._refresh(client, tokens["refresh_token"]).json
+
+        assert self._refresh(client, tokens["refresh_token"]).status_code == 401
+
+        for access_token in (tokens["access_token"], rotated["access_token"]):
+            assert client.get("/auth/me", headers={"Authorization": f"Bearer {access_token}"}).status_code == 401
+
+    def test_other_sessions_survive_reuse(self, client):
+        first = self._login(client)
+        second = client.post("/auth/login", json={"email": "refresh@example.com", "password": "senha12345"}).json
+        self._refresh(client, first["refresh_token"])
+        self._refresh(client, first["refresh_token"])
+
+        assert self._refresh(client, second["refresh_token"]).status_code == 200
+
+    def test_access_token_cannot_refresh(self, client):
+        tokens = self._login(client)
+
+        assert self._refresh(client, tokens["access_token"]).status_code == 422
+
+    def test_refresh_token_cannot_access_routes(self, client):
+        tokens = self._login(client)
+
+        response = client.get("/auth/me", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+
+        assert response.status_code == 422
+
+    def test_password_change_revokes_refresh_tokens(self, client):
+        tokens = self._login(client)
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+        client.put("/auth/me", json={"password": "nova-senha-123", "current_password": "senha12345"}, headers=headers)
+
+        assert self._refresh(client, tokens["refresh_token"]).status_code == 401
+
+    def test_deleted_user_cannot_refresh(self, client):
+        tokens = self._login(client)
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+        client.delete("/auth/me", json={"password": "senha12345"}, headers=headers)
+
+        assert self._refresh(client, tokens["refresh_token"]).status_code == 401
+        assert RefreshToken.objects.count() == 0
+
+    def test_refresh_keeps_profile_claims(self, app, client, collection_reads):
+        app.config["JWT_PROFILE_CLAIMS"] = True
+        tokens = self._login(client)
+
+        access_token = self._refresh(client, tokens["refresh_token"]).json["access_token"]
+        collection_reads.clear()
+        me = client.get("/auth/me", headers={"Authorization": f"Bearer {access_token}"})
+
+        assert me.json["name"] == "Refresh"
+        assert collection_reads["users"] == 0
+
+
+class TestIdentityCache:
+    """Cache do usuário autenticado (app/identity.py)"""
+
+    def test_profile_is_cached(self, client, auth_headers, collection_reads):
+        """Depois da primeira leitura o perfil vem do cache, sem consultar users"""
+        client.get("/auth/me", headers=auth_headers)
+
+        collection_reads.clear()
+        response = client.get("/auth/me", headers=auth_headers)
+
+        assert response.json["email"] == "test@example.com"
+        assert collection_reads["users"] == 0
+        stats = client.get("/metrics").json["user_cache"]
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_update_me_invalidates(self, client, auth_headers):
+        """Alterações do perfil aparecem na hora, mesmo com o perfil em cache"""
+        client.get("/auth/me", headers=auth_headers)
+
+        client.put("/auth/me", json={"name": "Novo Nome"}, headers=auth_headers)
+
+        assert client.get("/auth/me", headers=auth_headers).json["name"] == "Novo Nome"
+
+    def test_deleted_user_is_not_served_from_cache(self, app, client, auth_headers):
+        """Depois de deletar a conta o perfil sai do cache"""
+        client.get("/auth/me", headers=auth_headers)
+
+        client.delete("/auth/me", json={"password": "testpassword123"}, headers=auth_headers)
+
+        assert app.extensions["user_cache"].stats()["size"] == 0
+        # o token também foi revogado
+        assert client.get("/auth/me", headers=auth_headers).status_code == 401
+
+    def test_cache_can_be_disabled(self, app, client, auth_headers, collection_reads):
+        app.config["USER_CACHE_ENABLED"] = False
+        client.get("/auth/me", headers=auth_headers)
+
+        collection_reads.clear()
+        client.get("/auth/me", headers=auth_headers)
+
+        assert collection_reads["users"] == 1
+
+    def test_profile_claims(self, app, client, collection_reads):
+        """Com JWT_PROFILE_CLAIMS o perfil vem do token, sem consultar users"""
+        app.config["JWT_PROFILE_CLAIMS"] = True
+        client.post("/auth/register", json={"email": "claims@example.com", "name": "Claims", "password": "senha12345", "cellphone": "+5511977776666"})
+        token = client.post("/auth/login", json={"email": "claims@example.com", "password": "senha12345"}).json["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        collection_reads.clear()
+        me = client.get("/auth/me", headers=headers)
+        sales = client.get("/auth/me/sales", headers=headers)
+
+        assert me.json["email"] == "claims@example.com"
+        assert me.json["name"] == "Claims"
+        assert sales.json["total"] == 0
+        assert collection_reads["users"] == 0
+
+    def test_update_me_returns_fresh_token_with_claims(self, app, client, auth_headers):
+        """O perfil nas claims fica desatualizado após a alteração: a resposta traz um novo token"""
+        app.config["JWT_PROFILE_CLAIMS"] = True
+
+        response = client.put("/auth/me", json={"name": "Outro Nome"}, headers=auth_headers)
+        headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+
+        assert client.get("/auth/me", headers=headers).json["name"] == "Outro Nome"
+
+    def test_token_without_claims_falls_back_to_lookup(self, app, client, auth_headers):
+        """Tokens emitidos antes de ativar JWT_PROFILE_CLAIMS continuam funcionando"""
+        app.config["JWT_PROFILE_CLAIMS"] = True
+
+        assert client.get("/auth/me", headers=auth_headers).json["email"] == "test@example.com"
+
+
+class TestDeleteMe:
+    """Testes para a remoção de conta (DELETE /auth/me)"""
+
+    def test_delete_me_requires_password(self, client, auth_headers):
+        """Sem a senha correta a conta não é removida"""
+        assert client.delete("/auth/me", json={}, headers=auth_headers).status_code == 400
+        assert client.delete("/auth/me", json={"password": "errada"}, headers=auth_headers).status_code == 401
+
+    def test_delete_me_removes_products_from_favorites(self, client, auth_headers, second_user_headers, create_products):
+        """Os produtos removidos saem dos favoritos dos outros usuários"""
+        ids = create_products(auth_headers, 3)
+        for product_id in ids:
+            client.post(f"/products/{product_id}/favorite", headers=second_user_headers)
+
+        response = client.delete("/auth/me", json={"password": "testpassword123"}, headers=auth_headers)
+
+        assert response.status_code == 200
+        assert Product.objects.count() == 0
+        buyer = User.objects.no_dereference().get(email="buyer@example.com")
+        assert buyer.favorites == []
+        assert client.get("/products/facets").json["category"]["outros"] == 0
+        assert client.get("/products?q=Produto").json["products"] == []
+
+    def test_delete_me_removes_image_jobs(self, client, auth_headers, create_products):
+        """Jobs de imagem dos produtos removidos saem da fila (CASCADE do ImageJob)"""
+        ids = create_products(auth_headers, 2)
+        owner = User.objects.get(email="test@example.com")
+        for product_id in ids:
+            ImageJob(product=product_id, owner=owner, data=b"bytes").save()
+
+        client.delete("/auth/me", json={"password": "testpassword123"}, headers=auth_headers)
+
+        assert ImageJob.objects.count() == 0
+
+    def test_delete_me_uses_bulk_writes(self, client, auth_headers, second_user_headers, monkeypatch, create_products):
+        """Favoritos e produtos são limpos com uma escrita cada, independente do tamanho"""
+        ids = create_products(auth_headers, 5)
+        for product_id in ids:
+            client.post(f"/products/{product_id}/favorite", headers=second_user_headers)
+
+        calls = Counter()
+        for method in ("update_many", "delete_many", "update_one", "delete_one"):
+            original = getattr(Collection, method)
+
+            def counting(self, *args, _method=method, _original=original, **kwargs):
+                calls[(self.name, _method)] += 1
+                return _original(self, *args, **kwargs)
+
+            monkeypatch.setattr(Collection, method, counting)
+
+        client.delete("/auth/me", json={"password": "testpassword123"}, headers=auth_headers)
+
+        assert calls[("users", "update_many")] == 1
+        assert calls[("products", "delete_many")] == 1
+        assert calls[("products", "delete_one")] == 0
+
+    def test_large_account_is_deleted_in_chunks(self, app, client, auth_headers, second_user_headers, monkeypatch, create_products):
+        """Acima de ACCOUNT_DELETE_SYNC_LIMIT a remoção roda em lotes, em segundo plano"""
+        app.config.update({"ACCOUNT_DELETE_SYNC_LIMIT": 2, "ACCOUNT_DELETE_CHUNK_SIZE": 2})
+        ids = create_products(auth_headers, 5)
+        client.post(f"/products/{ids[0]}/favorite", headers=second_user_headers)
+
+        threads = []
+        original = auth_routes.run_in_background
+        monkeypatch.setattr(auth_routes, "run_in_background", lambda *a, **kw: threads.append(original(*a, **kw)))
+
+        response = client.delete("/auth/me", json={"password": "testpassword123"}, headers=auth_headers)
+        assert response.status_code == 202
+        threads[0].join(timeout=10)
+
+        assert Product.objects.count() == 0
+        assert User.objects(email="test@example.com").count() == 0
+        assert User.objects.no_dereference().get(email="buyer@example.com").favorites == []
+        assert client.get("/products/facets").json["category"]["outros"] == 0
+
+    def test_large_account_eager_mode(self, app, client, auth_headers, create_products):
+        """Com BACKGROUND_TASKS_EAGER a remoção em lotes roda na própria requisição"""
+        app.config.update({"ACCOUNT_DELETE_SYNC_LIMIT": 1, "ACCOUNT_DELETE_CHUNK_SIZE": 2, "BACKGROUND_TASKS_EAGER": True})
+        create_products(auth_headers, 3)
+
+        response = client.delete("/auth/me", json={"password": "testpassword123"}, headers=auth_headers)
+
+        assert response.status_code == 202
+        assert Product.objects.count() == 0
+        assert User.objects(email="test@example.com").count() == 0
+
+class TestMyLists:
+    """Testes para as rotas de listagem do usuário (/auth/me/sales, purchases, favorites)"""
+
+    def _sell(self, client, seller_headers, buyer_headers, title):
+        product = {"title": title, "description": "Desc", "price": 100.0, "category": "outros", "estado_de_conservacao": "usado"}
+        product_id = client.post("/products", json=product, headers=seller_headers).json["product"]["id"]
+        code = client.post(f"/products/{product_id}/generate-code", headers=seller_headers).json["confirmation_code"]
+        client.post("/products/confirm-with-code", json={"confirmation_code": code}, headers=buyer_headers)
+        return product_id
+
+    def test_sales_and_purchases_use_constant_queries(self, client, auth_headers, second_user_headers, collection_reads):
+        """Vendas e compras carregam owner/buyer em uma única consulta"""
+        for i in range(3):
+            self._sell(client, auth_headers, second_user_headers, f"Produto {i}")
+
+        collection_reads.clear()
+        response = client.get("/auth/me/sales", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json["total"] == 3
+        assert all(s["sale_info"]["buyer"]["email"] == "buyer@example.com" for s in response.json["sales"])
+        # um $in para owners/buyers; o usuário autenticado vem do cache de identidade
+        assert collection_reads["users"] == 1
+
+        collection_reads.clear()
+        response = client.get("/auth/me/purchases", headers=second_user_headers)
+        assert response.status_code == 200
+        assert response.json["total"] == 3
+        assert all(p["purchase_info"]["seller"]["email"] == "test@example.com" for p in response.json["purchases"])
+        # primeira leitura do comprador (cache vazio) + o $in
+        assert collection_reads["users"] == 2
+
+    def test_favorites_lists_products_in_batch(self, client, auth_headers, second_user_headers, collection_reads):
+        """Favoritos são carregados com uma consulta de produtos e uma de usuários"""
+        ids = []
+        for i in range(3):
+            product = {"title": f"Produto {i}", "description": "Desc", "price": 10.0, "category": "outros", "estado_de_conservacao": "usado"}
+            ids.append(client.post("/products", json=product, headers=auth_headers).json["product"]["id"])
+        for product_id in ids:
+            client.post(f"/products/{product_id}/favorite", headers=second_user_headers)
+
+        collection_reads.clear()
+        response = client.get("/auth/me/favorites", headers=second_user_headers)
+
+        assert response.status_code == 200
+        assert response.json["total"] == 3
+        assert [f["id"] for f in response.json["favorites"]] == ids
+        assert collection_reads["products"] == 1
+        assert collection_reads["users"] == 2
+
+    def test_favorites_are_paginated(self, client, auth_headers, second_user_headers):
+        """Favoritos são paginados por cursor na ordem em que foram adicionados"""
+        ids = []
+        for i in range(5):
+            product = {"title": f"Produto {i}", "description": "Desc", "price": 10.0, "category": "outros", "estado_de_conservacao": "usado"}
+            ids.append(client.post("/products", json=product, headers=auth_headers).json["product"]["id"])
+            client.post(f"/products/{ids[-1]}/favorite", headers=second_user_headers)
+
+        first = client.get("/auth/me/favorites?limit=2", headers=second_user_headers).json
+        assert first["total"] == 5
+        assert [f["id"] for f in first["favorites"]] == ids[:2]
+
+        seen = [f["id"] for f in first["favorites"]]
+        cursor = first["next_cursor"]
+        while cursor:
+            page = client.get(f"/auth/me/favorites?limit=2&cursor={cursor}", headers=second_user_headers).json
+            seen += [f["id"] for f in page["favorites"]]
+            cursor = page["next_cursor"]
+        assert seen == ids
+
+        response = client.get("/auth/me/favorites?cursor=invalido", headers=second_user_headers)
+        assert response.status_code == 400
+
+        response = client.get("/auth/me/favorites?limit=abc", headers=second_user_headers)
+        assert response.status_code == 400
+        assert response.json["error"] == "limit deve ser um inteiro entre 1 e 100"
+
+    def test_my_lists_accept_summary_view(self, client, auth_headers, second_user_headers):
+        """As listas do usuário aceitam view=summary e fields="""
+        product_id = self._sell(client, auth_headers, second_user_headers, "Produto")
+
+        response = client.get("/auth/me/sales?view=summary", headers=auth_headers)
+        sale = response.json["sales"][0]
+        assert set(sale) == {"id", "title", "price", "thumbnail", "category", "sale_info"}
+        assert sale["sale_info"]["buyer"]["email"] == "buyer@example.com"
+
+        response = client.get("/auth/me/purchases?fields=title", headers=second_user_headers)
+        purchase = response.json["purchases"][0]
+        assert set(purchase) == {"id", "title", "purchase_info"}
+        assert purchase["purchase_info"]["seller"]["email"] == "test@example.com"
+
+        client.post(f"/products/{product_id}/favorite", headers=auth_headers)
+        response = client.get("/auth/me/favorites?view=summary", headers=auth_headers)
+        assert set(response.json["favorites"][0]) == {"id", "title", "price", "thumbnail", "category"}
+
+        response = client.get("/auth/me/favorites?fields=senha", headers=auth_headers)
+        assert response.status_code == 400
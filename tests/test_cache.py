@@ -0,0 +1,118 @@
+from app.cache import QueryCache, config_bool, get_product_cache
+
+
+class TestQueryCache:
+    # cache LRU/TTL das listagens
+
+    def test_hit_and_miss_counters(self):
+        cache = QueryCache(max_size=2, ttl=10)
+        key = cache.make_key(category="móveis", limit=20)
+
+        assert cache.get(key) is None
+        cache.set(key, {"products": []}, category="móveis")
+        assert cache.get(key) == {"products": []}
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_make_key_ignores_empty_params(self):
+        assert QueryCache.make_key(q="", category="outros") == QueryCache.make_key(category="outros", cursor=None)
+
+    def test_lru_eviction(self):
+        cache = QueryCache(max_size=2, ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats()["evictions"] == 1
+
+    def test_ttl_expiration(self, clock):
+        cache = QueryCache(ttl=5, clock=clock)
+        cache.set("a", 1)
+        clock.now = 6
+
+        assert cache.get("a") is None
+        assert cache.stats()["expirations"] == 1
+
+    def test_invalidate_only_matching_entries(self):
+        cache = QueryCache()
+        cache.set("all", 1)
+        cache.set("moveis", 2, category="móveis")
+        cache.set("eletronicos", 3, category="eletrônicos")
+        cache.set("moveis-usado", 4, category="móveis", estado="usado")
+
+        cache.invalidate([("móveis", "novo")])
+
+        assert cache.get("all") is None
+        assert cache.get("moveis") is None
+        assert cache.get("eletronicos") == 3
+        assert cache.get("moveis-usado") == 4
+
+    def test_disabled_cache_never_stores(self):
+        cache = QueryCache(enabled=False)
+        cache.set("a", 1)
+        assert cache.get("a") is None
+
+    def test_config_bool(self):
+        assert config_bool("false") is False
+        assert config_bool("1") is True
+        assert config_bool(None, default=True) is True
+
+
+class TestListProductsCache:
+    # cache na frente de GET /products
+
+    def test_repeated_listing_hits_cache(self, client, auth_headers, sample_product, collection_reads):
+        client.get("/products")
+        collection_reads.clear()
+
+        response = client.get("/products")
+
+        assert response.status_code == 200
+        assert len(response.json["products"]) == 1
+        assert collection_reads["products"] == 0
+        assert client.get("/metrics").json["product_cache"]["hits"] == 1
+
+    def test_create_invalidates_listing(self, client, auth_headers, sample_product):
+        assert len(client.get("/products").json["products"]) == 1
+
+        product = {"title": "Cadeira", "description": "Madeira", "price": 50.0, "category": "móveis", "estado_de_conservacao": "usado"}
+        client.post("/products", json=product, headers=auth_headers)
+
+        assert len(client.get("/products").json["products"]) == 2
+
+    def test_write_keeps_unrelated_category(self, client, auth_headers, sample_product):
+        client.get("/products?category=móveis")
+        client.patch(f"/products/{sample_product['id']}", json={"price": 4000.0}, headers=auth_headers)
+
+        assert client.get("/metrics").json["product_cache"]["size"] == 1
+
+    def test_update_and_delete_invalidate_listing(self, client, auth_headers, sample_product):
+        product_id = sample_product["id"]
+        client.get("/products")
+
+        client.patch(f"/products/{product_id}", json={"price": 4000.0}, headers=auth_headers)
+        assert client.get("/products").json["products"][0]["price"] == 4000.0
+
+        client.delete(f"/products/{product_id}", headers=auth_headers)
+        assert client.get("/products").json["products"] == []
+
+    def test_confirm_invalidates_listing(self, client, auth_headers, second_user_headers, sample_product):
+        client.get("/products?category=eletrônicos")
+
+        code = client.post(f"/products/{sample_product['id']}/generate-code", headers=auth_headers).json["confirmation_code"]
+        client.post("/products/confirm-with-code", json={"confirmation_code": code}, headers=second_user_headers)
+
+        assert client.get("/products?category=eletrônicos").json["products"] == []
+
+    def test_cache_can_be_disabled(self, client, auth_headers, sample_product, collection_reads):
+        with client.application.app_context():
+            get_product_cache().enabled = False
+
+        client.get("/products")
+        collection_reads.clear()
+        client.get("/products")
+
+        assert collection_reads["products"] == 1
@@ -0,0 +1,27 @@
+import pytest
+from app.codes import new_code, collision_rate, expected_collisions, any_collision_probability, code_settings
+
+
+def test_new_code_uses_alphabet():
+    code = new_code(10, "AB")
+    assert len(code) == 10
+    assert set(code) <= {"A", "B"}
+
+
+def test_collision_estimates_at_one_million_products():
+    # 36^8 ≈ 2.8e12 códigos possíveis
+    assert collision_rate(1_000_000) == pytest.approx(3.54e-7, rel=0.01)
+    assert expected_collisions(1_000_000) == pytest.approx(0.177, rel=0.01)
+    assert any_collision_probability(1_000_000) == pytest.approx(0.162, rel=0.01)
+
+
+@pytest.mark.parametrize("config", [
+    {"CONFIRMATION_CODE_ALPHABET": "abc123"},
+    {"CONFIRMATION_CODE_ALPHABET": "AAB"},
+    {"CONFIRMATION_CODE_LENGTH": "2"},
+])
+def test_invalid_settings(app, config):
+    # alfabetos com minúsculas não podem ser digitados de volta (o código é convertido para maiúsculas)
+    app.config.update(config)
+    with app.app_context(), pytest.raises(RuntimeError):
+        code_settings()
@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+from app.extensions import get_pymongo_db, mongo_settings, PoolStats
+from app.favorites import reconcile_counts
+from app.models import User, Product
+
+
+class TestMongoSettings:
+    """Opções do MongoClient a partir das variáveis MONGO_*"""
+
+    def test_only_configured_options(self):
+        assert mongo_settings({}) == {}
+        assert mongo_settings({"MONGO_MAX_POOL_SIZE": "", "MONGO_URI": "mongodb://x"}) == {}
+
+    def test_env_strings_are_converted(self):
+        settings = mongo_settings({
+            "MONGO_MAX_POOL_SIZE": "50",
+            "MONGO_MIN_POOL_SIZE": "5",
+            "MONGO_WAIT_QUEUE_TIMEOUT_MS": "2000",
+            "MONGO_SERVER_SELECTION_TIMEOUT_MS": "3000",
+            "MONGO_COMPRESSORS": "zstd,zlib",
+            "MONGO_READ_CONCERN": "majority",
+            "MONGO_WRITE_CONCERN": "majority",
+            "MONGO_JOURNAL": "true",
+        })
+
+        assert settings == {
+            "maxPoolSize": 50,
+            "minPoolSize": 5,
+            "waitQueueTimeoutMS": 2000,
+            "serverSelectionTimeoutMS": 3000,
+            "compressors": "zstd,zlib",
+            "readConcernLevel": "majority",
+            "w": "majority",
+            "journal": True,
+        }
+
+    def test_numeric_write_concern(self):
+        assert mongo_settings({"MONGO_WRITE_CONCERN": "2"}) == {"w": 2}
+
+
+class TestPoolStats:
+    """Contadores do ConnectionPoolListener"""
+
+    def test_checkout_and_wait(self):
+        stats = PoolStats()
+        stats.connection_created(None)
+        stats.connection_checked_out(SimpleNamespace(duration=0.002))
+        stats.connection_checked_out(SimpleNamespace(duration=0.004))
+        stats.connection_checked_in(None)
+        stats.connection_check_out_failed(SimpleNamespace(duration=0.006))
+
+        result = stats.stats()
+        assert result["open"] == 1
+        assert result["checked_out"] == 1
+        assert result["peak_checked_out"] == 2
+        assert result["checkouts"] == 2
+        assert result["checkout_failures"] == 1
+        assert result["wait_ms_avg"] == 4.0
+        assert result["wait_ms_max"] == 6.0
+
+    def test_closed_connections(self):
+        stats = PoolStats()
+        stats.connection_created(None)
+        stats.connection_closed(None)
+
+        assert stats.stats()["open"] == 0
+        assert stats.stats()["closed"] == 1
+
+
+class TestPymongoHandle:
+    """get_pymongo_db(): Database do pymongo compartilhado com o mongoengine"""
+
+    def test_handle_after_create_app(self, app):
+        db = get_pymongo_db()
+
+        db[User._get_collection_name()].insert_one({"email": "raw@example.com", "name": "Raw"})
+
+        assert User.objects(email="raw@example.com").count() == 1
+
+    def test_reconcile_counts_bulk_write(self, client, auth_headers):
+        owner = User.objects.get(email="test@example.com")
+        fields = {"description": "d", "price": 1, "category": "outros", "estado_de_conservacao": "novo", "owner": owner}
+        product = Product(title="P", favorites_count=7, **fields).save()
+        other = Product(title="Q", favorites_count=0, **fields).save()
+        User.objects(id=owner.id).update_one(push__favorites=other)
+
+        assert reconcile_counts() == 2
+        assert Product.objects.get(id=product.id).favorites_count == 0
+        assert Product.objects.get(id=other.id).favorites_count == 1
+
+    def test_pool_stats_in_metrics(self, client):
+        assert "checked_out" in client.get("/metrics").json["mongo_pool"]
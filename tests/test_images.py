@@ -0,0 +1,418 @@
+import base64
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+import pytest
+from app.images import process_pending, append_images, ImageLimitError
+from app.models import Product, ImageJob, ImageBlob
+from app.storage import LocalStorage
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"imagem-de-teste"
+PNG_B64 = base64.b64encode(PNG).decode()
+
+
+class FailingStorage:
+    # Armazenamento que sempre falha (Cloudinary fora do ar)
+    name = "failing"
+
+    def upload(self, data, folder, name=None):
+        raise ConnectionError("storage indisponível")
+
+
+class TestImageJobs:
+    # upload assíncrono (POST /products/<id>/images + GET .../images/jobs/<job_id>)
+
+    def test_upload_returns_202_with_job(self, client, auth_headers, sample_product):
+        response = client.post(f"/products/{sample_product['id']}/images", json={"image": PNG_B64}, headers=auth_headers)
+
+        assert response.status_code == 202
+        job = response.json["job"]
+        assert job["status"] in ("pending", "processing", "done")
+        assert response.headers["Location"] == response.json["status_url"]
+        assert response.json["status_url"].endswith(f"/images/jobs/{job['id']}")
+
+    def test_eager_mode_processes_in_request(self, app, client, auth_headers, sample_product):
+        # com BACKGROUND_TASKS_EAGER o job já volta concluído
+        app.config["BACKGROUND_TASKS_EAGER"] = True
+        response = client.post(f"/products/{sample_product['id']}/images", json={"image": "data:image/png;base64," + PNG_B64}, headers=auth_headers)
+
+        job = response.json["job"]
+        assert job["status"] == "done"
+        product = client.get(f"/products/{sample_product['id']}").json
+        assert product["images"] == [job["image_url"]]
+        assert product["thumbnail"] == job["image_url"]
+        # a imagem é servida pelo armazenamento local
+        served = client.get(job["image_url"])
+        assert served.status_code == 200
+        assert served.data == PNG
+
+    def test_worker_threads_process_jobs(self, client, auth_headers, sample_product):
+        # sem modo eager, os workers em segundo plano fazem o upload
+        response = client.post(f"/products/{sample_product['id']}/images", json={"image": PNG_B64}, headers=auth_headers)
+        status_url = response.json["status_url"]
+
+        deadline = time.monotonic() + 10
+        job = response.json["job"]
+        while job["status"] != "done" and time.monotonic() < deadline:
+            time.sleep(0.05)
+            job = client.get(status_url, headers=auth_headers).json["job"]
+
+        assert job["status"] == "done"
+        assert client.get(f"/products/{sample_product['id']}").json["images"] == [job["image_url"]]
+        # os bytes da imagem não ficam guardados no job concluído
+        assert ImageJob.objects.get(id=job["id"]).data is None
+
+    def test_worker_command_drains_queue(self, app, client, auth_headers, sample_product, runner, monkeypatch):
+        # flask image-worker --once processa a fila em outro processo
+        monkeypatch.setattr("app.images.get_worker_pool", lambda: type("Pool", (), {"notify": lambda self: None})())
+        for _ in range(2):
+            client.post(f"/products/{sample_product['id']}/images", json={"image": PNG_B64}, headers=auth_headers)
+        assert ImageJob.objects(status="pending").count() == 2
+
+        result = runner.invoke(args=["image-worker", "--once"])
+
+        assert "jobs processados: 2" in result.output
+        assert len(Product.objects.get(id=sample_product["id"]).images) == 2
+
+    def test_failed_upload_is_retried_then_failed(self, app, client, auth_headers, sample_product):
+        app.config.update({"BACKGROUND_TASKS_EAGER": True, "IMAGE_JOB_MAX_ATTEMPTS": 2})
+        app.extensions["image_storage"] = FailingStorage()
+
+        job = client.post(f"/products/{sample_product['id']}/images", json={"image": PNG_B64}, headers=auth_headers).json["job"]
+        # primeira tentativa falhou: volta para a fila com os bytes
+        assert job["status"] == "pending"
+        assert "storage indisponível" in job["error"]
+
+        with app.app_context():
+            process_pending()
+        job = ImageJob.objects.get(id=job["id"])
+        assert job.status == "failed"
+        assert job.attempts == 2
+        assert job.data is None
+        assert Product.objects.get(id=sample_product["id"]).images == []
+
+    def test_abandoned_job_is_reclaimed(self, app, client, auth_headers, sample_product, monkeypatch):
+        # job "processing" de um worker que morreu volta a ser processado após o timeout
+        monkeypatch.setattr("app.images.get_worker_pool", lambda: type("Pool", (), {"notify": lambda self: None})())
+        job_id = client.post(f"/products/{sample_product['id']}/images", json={"image": PNG_B64}, headers=auth_headers).json["job"]["id"]
+        ImageJob.objects(id=job_id).update(set__status="processing", set__started_at=datetime.utcnow() - timedelta(hours=1))
+
+        with app.app_context():
+            assert process_pending() == 1
+        assert ImageJob.objects.get(id=job_id).status == "done"
+
+    def test_invalid_image(self, client, auth_headers, sample_product):
+        url = f"/products/{sample_product['id']}/images"
+        assert client.post(url, json={}, headers=auth_headers).status_code == 400
+        assert client.post(url, json={"image": "não é base64!"}, headers=auth_headers).status_code == 400
+
+    def test_only_owner_can_upload_and_see_jobs(self, app, client, auth_headers, second_user_headers, sample_product):
+        app.config["BACKGROUND_TASKS_EAGER"] = True
+        url = f"/products/{sample_product['id']}/images"
+        assert client.post(url, json={"image": PNG_B64}, headers=second_user_headers).status_code == 403
+
+        status_url = client.post(url, json={"image": PNG_B64}, headers=auth_headers).json["status_url"]
+        assert client.get(status_url, headers=second_user_headers).status_code == 403
+
+    def test_job_not_found(self, client, auth_headers, sample_product):
+        base = f"/products/{sample_product['id']}/images/jobs"
+        assert client.get(f"{base}/507f1f77bcf86cd799439011", headers=auth_headers).status_code == 404
+        assert client.get(f"{base}/invalido", headers=auth_headers).status_code == 400
+
+
+class TestLocalStorage:
+
+    def test_upload_writes_file(self, tmp_path):
+        storage = LocalStorage(tmp_path, "/uploads")
+
+        url = storage.upload(PNG, folder="marketplace/products/1")
+
+        assert url.startswith("/uploads/marketplace/products/1/") and url.endswith(".png")
+        assert (tmp_path / url[len("/uploads/"):]).read_bytes() == PNG
+
+    def test_path_cannot_escape_root(self, tmp_path):
+        with pytest.raises(ValueError):
+            LocalStorage(tmp_path).path_for("../fora.png")
+
+
+class SlowStorage:
+    # Armazenamento lento que registra quantos uploads rodam ao mesmo tempo
+    name = "slow"
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def upload(self, data, folder, name=None):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            time.sleep(0.05)
+            if data == self.fail_on:
+                raise ConnectionError("timeout")
+            return f"/uploads/{folder}/{data.decode()}.png"
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+def _b64(text):
+    return base64.b64encode(text.encode()).decode()
+
+
+class TestBatchUpload:
+    # envio em lote (POST /products/<id>/images/batch)
+
+    def test_batch_upload(self, app, client, auth_headers, sample_product):
+        images = [_b64(f"img{i}") for i in range(4)]
+        app.extensions["image_storage"] = SlowStorage()
+
+        response = client.post(f"/products/{sample_product['id']}/images/batch", json={"images": images}, headers=auth_headers)
+
+        assert response.status_code == 201
+        urls = [r["image_url"] for r in response.json["results"]]
+        assert all(r["status"] == "uploaded" for r in response.json["results"])
+        # ordem preservada e gravada no produto
+        assert urls == [f"/uploads/marketplace/images/img{i}.png" for i in range(4)]
+        assert response.json["images"] == urls
+        assert Product.objects.get(id=sample_product["id"]).images == urls
+
+    def test_uploads_run_in_bounded_pool(self, app, client, auth_headers, sample_product):
+        app.config["IMAGE_UPLOAD_CONCURRENCY"] = 3
+        storage = app.extensions["image_storage"] = SlowStorage()
+
+        client.post(f"/products/{sample_product['id']}/images/batch", json={"images": [_b64(f"i{n}") for n in range(8)]}, headers=auth_headers)
+
+        assert 1 < storage.peak <= 3
+
+    def test_partial_failure(self, app, client, auth_headers, sample_product):
+        app.extensions["image_storage"] = SlowStorage(fail_on=b"ruim")
+        images = [_b64("boa"), "###", _b64("ruim")]
+
+        response = client.post(f"/products/{sample_product['id']}/images/batch", json={"images": images}, headers=auth_headers)
+
+        assert response.status_code == 201
+        statuses = [r["status"] for r in response.json["results"]]
+        assert statuses == ["uploaded", "failed", "failed"]
+        assert "base64" in response.json["results"][1]["error"]
+        assert "timeout" in response.json["results"][2]["error"]
+        assert len(Product.objects.get(id=sample_product["id"]).images) == 1
+
+    def test_all_failed(self, app, client, auth_headers, sample_product):
+        app.extensions["image_storage"] = FailingStorage()
+
+        response = client.post(f"/products/{sample_product['id']}/images/batch", json={"images": [PNG_B64]}, headers=auth_headers)
+
+        assert response.status_code == 502
+        assert response.json["results"][0]["status"] == "failed"
+
+    def test_image_cap(self, app, client, auth_headers, sample_product):
+        app.config["MAX_IMAGES_PER_PRODUCT"] = 3
+        app.extensions["image_storage"] = SlowStorage()
+        url = f"/products/{sample_product['id']}/images/batch"
+
+        assert client.post(url, json={"images": [_b64("a"), _b64("b")]}, headers=auth_headers).status_code == 201
+        response = client.post(url, json={"images": [_b64("c"), _b64("d")]}, headers=auth_headers)
+        assert response.status_code == 400
+        assert "restam 1" in response.json["error"]
+
+        # o envio individual também respeita o limite
+        client.post(url, json={"images": [_b64("c")]}, headers=auth_headers)
+        response = client.post(f"/products/{sample_product['id']}/images", json={"image": PNG_B64}, headers=auth_headers)
+        assert response.status_code == 400
+
+    def test_cap_is_enforced_by_the_update(self, app, sample_product):
+        # o $push condicional não passa do limite mesmo sem a verificação prévia
+        app.config["MAX_IMAGES_PER_PRODUCT"] = 2
+        with app.app_context():
+            append_images(sample_product["id"], ["a"])
+            with pytest.raises(ImageLimitError):
+                append_images(sample_product["id"], ["b", "c"])
+            append_images(sample_product["id"], ["b"])
+        assert Product.objects.get(id=sample_product["id"]).images == ["a", "b"]
+
+    def test_batch_validation(self, client, auth_headers, second_user_headers, sample_product):
+        url = f"/products/{sample_product['id']}/images/batch"
+        assert client.post(url, json={}, headers=auth_headers).status_code == 400
+        assert client.post(url, json={"images": []}, headers=auth_headers).status_code == 400
+        assert client.post(url, json={"images": [PNG_B64]}, headers=second_user_headers).status_code == 403
+        assert client.post("/products/507f1f77bcf86cd799439011/images/batch", json={"images": [PNG_B64]}, headers=auth_headers).status_code == 404
+
+
+class CountingStorage(LocalStorage):
+    # Armazenamento local que conta os uploads (acessos à "rede")
+    def __init__(self, root):
+        super().__init__(root)
+        self.uploads = 0
+
+    def upload(self, data, folder, name=None):
+        self.uploads += 1
+        return super().upload(data, folder, name)
+
+
+class TestImageDedup:
+    # deduplicação por SHA-256 (ImageBlob)
+
+    def test_same_image_is_uploaded_once(self, app, client, auth_headers, tmp_path, create_products):
+        storage = app.extensions["image_storage"] = CountingStorage(tmp_path)
+        first, second = create_products(auth_headers, 2)
+
+        a = client.post(f"/products/{first}/images/batch", json={"images": [PNG_B64]}, headers=auth_headers).json
+        b = client.post(f"/products/{second}/images/batch", json={"images": [PNG_B64]}, headers=auth_headers).json
+
+        assert storage.uploads == 1
+        assert a["images"] == b["images"]
+        assert ImageBlob.objects.count() == 1
+        metrics = client.get("/metrics").json["image_dedup"]
+        assert metrics["hits"] == 1 and metrics["misses"] == 1
+        assert metrics["hit_ratio"] == 0.5
+        assert metrics["bytes_saved"] == len(PNG)
+
+    def test_duplicates_in_one_batch(self, app, client, auth_headers, sample_product, tmp_path):
+        app.extensions["image_storage"] = CountingStorage(tmp_path)
+
+        response = client.post(f"/products/{sample_product['id']}/images/batch", json={"images": [PNG_B64] * 3}, headers=auth_headers)
+
+        assert response.status_code == 201
+        assert len(set(response.json["images"])) == 1
+        assert ImageBlob.objects.count() == 1
+
+    def test_async_upload_reuses_blob(self, app, client, auth_headers, sample_product, tmp_path):
+        app.config["BACKGROUND_TASKS_EAGER"] = True
+        storage = app.extensions["image_storage"] = CountingStorage(tmp_path)
+
+        for _ in range(2):
+            job = client.post(f"/products/{sample_product['id']}/images", json={"image": PNG_B64}, headers=auth_headers).json["job"]
+            assert job["status"] == "done"
+
+        assert storage.uploads == 1
+
+    def test_dedup_can_be_disabled(self, app, client, auth_headers, sample_product, tmp_path):
+        app.config["IMAGE_DEDUP"] = "false"
+        storage = app.extensions["image_storage"] = CountingStorage(tmp_path)
+
+        client.post(f"/products/{sample_product['id']}/images/batch", json={"images": [PNG_B64] * 2}, headers=auth_headers)
+
+        assert storage.uploads == 2
+        assert ImageBlob.objects.count() == 0
+
+    def test_blob_belongs_to_its_storage(self, app, client, auth_headers, sample_product, tmp_path):
+        # trocar de backend não reaproveita URLs de outro armazenamento
+        ImageBlob(sha256=hashlib.sha256(PNG).hexdigest(), storage="cloudinary", url="https://cdn/x.png").save()
+        storage = app.extensions["image_storage"] = CountingStorage(tmp_path)
+
+        response = client.post(f"/products/{sample_product['id']}/images/batch", json={"images": [PNG_B64]}, headers=auth_headers)
+
+        assert storage.uploads == 1
+        assert response.json["images"][0].startswith("/uploads/")
+
+
+class TestSignedUpload:
+    # upload direto ao armazenamento (POST .../images/sign, PUT /uploads/<key>, POST .../images/commit)
+
+    def _sign(self, client, headers, product_id, **body):
+        return client.post(f"/products/{product_id}/images/sign", json=body, headers=headers)
+
+    def _put(self, client, upload, data=PNG):
+        return client.put(upload["upload_url"], data=data)
+
+    def test_direct_upload_flow(self, client, auth_headers, sample_product):
+        product_id = sample_product["id"]
+        upload = self._sign(client, auth_headers, product_id, content_type="image/png").json["upload"]
+        assert upload["method"] == "PUT"
+        assert upload["key"].startswith(f"marketplace/products/{product_id}/") and upload["key"].endswith(".png")
+
+        receipt = self._put(client, upload)
+        assert receipt.status_code == 201
+
+        response = client.post(f"/products/{product_id}/images/commit", json=receipt.json, headers=auth_headers)
+        assert response.status_code == 201
+        assert response.json["images"] == [response.json["image_url"]]
+        assert client.get(response.json["image_url"]).data == PNG
+
+        # commit repetido não duplica a imagem
+        again = client.post(f"/products/{product_id}/images/commit", json=receipt.json, headers=auth_headers)
+        assert again.status_code == 200
+        assert len(Product.objects.get(id=product_id).images) == 1
+
+    def test_tampered_or_expired_signature(self, client, auth_headers, sample_product, monkeypatch):
+        upload = self._sign(client, auth_headers, sample_product["id"]).json["upload"]
+
+        tampered = dict(upload, upload_url=upload["upload_url"].replace("signature=", "signature=0"))
+        assert self._put(client, tampered).status_code == 403
+
+        # depois de expires a URL deixa de valer
+        monkeypatch.setattr("app.storage.time.time", lambda: upload["expires_at"] + 1)
+        assert self._put(client, upload).status_code == 403
+
+    def test_forged_receipt_is_rejected(self, client, auth_headers, sample_product):
+        upload = self._sign(client, auth_headers, sample_product["id"]).json["upload"]
+        self._put(client, upload)
+
+        response = client.post(f"/products/{sample_product['id']}/images/commit",
+                               json={"key": upload["key"], "signature": "0" * 64}, headers=auth_headers)
+
+        assert response.status_code == 400
+
+    def test_receipt_is_bound_to_product(self, client, auth_headers, sample_product):
+        other = client.post("/products", json={
+            "title": "Outro", "description": "Desc", "price": 1.0,
+            "category": "outros", "estado_de_conservacao": "usado"
+        }, headers=auth_headers).json["product"]["id"]
+        upload = self._sign(client, auth_headers, other).json["upload"]
+        receipt = self._put(client, upload).json
+
+        response = client.post(f"/products/{sample_product['id']}/images/commit", json=receipt, headers=auth_headers)
+
+        assert response.status_code == 400
+        assert "não pertence" in response.json["error"]
+
+    def test_sign_validation(self, app, client, auth_headers, second_user_headers, sample_product):
+        assert self._sign(client, second_user_headers, sample_product["id"]).status_code == 403
+        assert self._sign(client, auth_headers, sample_product["id"], content_type="text/html").status_code == 400
+
+        app.config["MAX_IMAGES_PER_PRODUCT"] = 0
+        assert self._sign(client, auth_headers, sample_product["id"]).status_code == 400
+
+    def test_upload_size_limit(self, app, client, auth_headers, sample_product):
+        app.config["IMAGE_UPLOAD_MAX_BYTES"] = 10
+        upload = self._sign(client, auth_headers, sample_product["id"]).json["upload"]
+
+        assert self._put(client, upload, data=b"x" * 11).status_code == 413
+
+
+class TestCloudinarySignedUpload:
+    # assinatura no formato do Cloudinary, sem rede
+
+    @pytest.fixture(autouse=True)
+    def cloudinary_config(self):
+        import cloudinary
+        config = cloudinary.config()
+        previous = (config.cloud_name, config.api_key, config.api_secret)
+        cloudinary.config(cloud_name="demo", api_key="123", api_secret="segredo")
+        yield
+        cloudinary.config(cloud_name=previous[0], api_key=previous[1], api_secret=previous[2])
+
+    def test_sign_and_verify(self):
+        import cloudinary.utils
+        from app.storage import CloudinaryStorage
+        storage = CloudinaryStorage()
+
+        upload = storage.sign_upload("marketplace/products/1", "abc", "image/jpeg", 600)
+        fields = upload["fields"]
+        params = {k: fields[k] for k in ("folder", "public_id", "timestamp")}
+        assert fields["signature"] == cloudinary.utils.api_sign_request(params, "segredo")
+        assert upload["upload_url"].endswith("/demo/image/upload")
+
+        public_id, version = "marketplace/products/1/abc", "1700000000"
+        signature = hashlib.sha1(f"public_id={public_id}&version={version}segredo".encode()).hexdigest()
+        key, url = storage.verify_upload({"public_id": public_id, "version": version, "signature": signature})
+        assert key == public_id
+        assert url.startswith("https://res.cloudinary.com/demo/image/upload/v1700000000/")
+
+        with pytest.raises(ValueError):
+            storage.verify_upload({"public_id": public_id, "version": version, "signature": "0" * 40})
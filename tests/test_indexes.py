@@ -0,0 +1,48 @@
+import itertools
+import pytest
+from app.models import Product
+from app.pagination import SORTS, sort_keys
+
+# Filtros de igualdade aceitos por GET /products (buyer=None é sempre aplicado)
+EQUALITY_FILTERS = ("category", "estado_de_conservacao")
+
+
+def _shapes():
+    for size in range(len(EQUALITY_FILTERS) + 1):
+        for filters in itertools.combinations(EQUALITY_FILTERS, size):
+            for sort in SORTS:
+                yield filters, sort
+
+
+def _supports_sort(index, equality, sort):
+    """
+    Um índice evita o sort em memória quando é formado por campos com
+    igualdade na consulta seguidos exatamente pelas chaves de ordenação
+    (todas na mesma direção do índice ou todas invertidas).
+    """
+    keys = [("_id" if name == "id" else name, direction) for name, direction in sort_keys(sort)]
+    prefix, tail = index[:-len(keys)], index[-len(keys):]
+    if [name for name, _ in tail] != [name for name, _ in keys]:
+        return False
+    same = all(d == k for (_, d), (_, k) in zip(tail, keys))
+    reversed_ = all(d == -k for (_, d), (_, k) in zip(tail, keys))
+    prefix_names = {name for name, _ in prefix}
+    return (same or reversed_) and "buyer" in prefix_names and prefix_names <= {"buyer", *equality}
+
+
+@pytest.mark.parametrize("filters,sort", list(_shapes()))
+def test_every_listing_shape_has_an_index(filters, sort):
+    # falha se alguma combinação filtro + ordenação precisar de sort em memória
+    indexes = [spec["fields"] for spec in Product._meta["index_specs"]]
+    assert any(_supports_sort(index, filters, sort) for index in indexes), (filters, sort)
+
+
+@pytest.mark.parametrize("filters", [(), ("category",), ("estado_de_conservacao",)])
+def test_single_filter_shapes_have_exact_index(filters):
+    # cada filtro de igualdade isolado tem um índice próprio para cada ordenação
+    indexes = [spec["fields"] for spec in Product._meta["index_specs"]]
+    for sort in SORTS:
+        assert any(
+            _supports_sort(index, filters, sort) and {n for n, _ in index} >= set(filters)
+            for index in indexes
+        ), (filters, sort)
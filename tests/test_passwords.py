@@ -0,0 +1,102 @@
+import pytest
+from app.models import User
+from app.passwords import PasswordHasher, hash_password, verify_password, hash_parameters
+
+# Custos baixos: os testes conferem o formato, não a força do hash
+FAST = {"scrypt": 2 ** 10, "pbkdf2": 1000, "bcrypt": 4}
+
+USER = {"email": "hash@example.com", "name": "Hash", "password": "senha-segura-123", "cellphone": "+5511988887777"}
+
+
+class TestHashing:
+
+    @pytest.mark.parametrize("scheme", sorted(FAST))
+    def test_hash_and_verify(self, scheme):
+        hashed = hash_password("segredo", scheme, FAST[scheme])
+
+        assert verify_password("segredo", hashed)
+        assert not verify_password("outro", hashed)
+        assert hash_parameters(hashed) == (scheme, FAST[scheme])
+
+    def test_unknown_hash(self):
+        assert hash_parameters("texto-puro") == (None, None)
+
+    def test_needs_rehash(self):
+        hasher = PasswordHasher("bcrypt", cost=4)
+
+        assert not hasher.needs_rehash(hash_password("x", "bcrypt", 4))
+        assert hasher.needs_rehash(hash_password("x", "bcrypt", 5))
+        assert hasher.needs_rehash(hash_password("x", "scrypt", 2 ** 10))
+
+    def test_bcrypt_rejects_long_passwords(self):
+        with pytest.raises(ValueError):
+            hash_password("a" * 73, "bcrypt", 4)
+        assert not verify_password("a" * 73, hash_password("a" * 72, "bcrypt", 4))
+
+    def test_invalid_scheme(self):
+        with pytest.raises(RuntimeError):
+            PasswordHasher("md5")
+
+    def test_process_pool(self):
+        # o hash roda em outro processo e o resultado volta para a thread
+        hasher = PasswordHasher("bcrypt", cost=4, workers=1)
+        try:
+            hashed = hasher.hash("segredo")
+            assert hasher._executor is not None
+            assert hasher.verify("segredo", hashed)
+            assert not hasher.verify("errada", hashed)
+        finally:
+            hasher.shutdown()
+
+
+class TestRehashOnLogin:
+
+    def _switch_scheme(self, app, scheme, cost):
+        app.config.update({"PASSWORD_HASH_SCHEME": scheme, "PASSWORD_HASH_COST": cost})
+        app.extensions.pop("password_hasher", None)
+
+    def test_login_upgrades_hash(self, app, client):
+        self._switch_scheme(app, "pbkdf2", 1000)
+        client.post("/auth/register", json=USER)
+        assert User.objects.get(email=USER["email"]).password_hash.startswith("pbkdf2:sha256:1000$")
+
+        self._switch_scheme(app, "bcrypt", 4)
+        response = client.post("/auth/login", json={"email": USER["email"], "password": USER["password"]})
+
+        assert response.status_code == 200
+        assert hash_parameters(User.objects.get(email=USER["email"]).password_hash) == ("bcrypt", 4)
+        # a senha continua a mesma
+        again = client.post("/auth/login", json={"email": USER["email"], "password": USER["password"]})
+        assert again.status_code == 200
+
+    def test_failed_login_keeps_hash(self, app, client):
+        self._switch_scheme(app, "pbkdf2", 1000)
+        client.post("/auth/register", json=USER)
+        old_hash = User.objects.get(email=USER["email"]).password_hash
+
+        self._switch_scheme(app, "bcrypt", 4)
+        response = client.post("/auth/login", json={"email": USER["email"], "password": "errada"})
+
+        assert response.status_code == 401
+        assert User.objects.get(email=USER["email"]).password_hash == old_hash
+
+    def test_rehash_does_not_undo_password_change(self, app):
+        # outro request trocou a senha entre a leitura e o rehash
+        self._switch_scheme(app, "pbkdf2", 1000)
+        with app.app_context():
+            user = User(email=USER["email"], name="Hash", cellphone=USER["cellphone"])
+            user.set_password(USER["password"])
+            user.save()
+            User.objects(id=user.id).update_one(set__password_hash=hash_password("nova", "pbkdf2", 1000))
+
+            self._switch_scheme(app, "bcrypt", 4)
+            assert not user.upgrade_password_hash(USER["password"])
+            assert verify_password("nova", User.objects.get(id=user.id).password_hash)
+
+    def test_register_with_too_long_password(self, app, client):
+        self._switch_scheme(app, "bcrypt", 4)
+
+        response = client.post("/auth/register", json={**USER, "password": "a" * 100})
+
+        assert response.status_code == 400
+        assert "72 bytes" in response.json["error"]
@@ -1,4 +1,8 @@
 import pytest
+from datetime import datetime
+from mongomock.collection import Collection
+from app.models import User, Product, FacetCounts
+from app.routes import products as products_routes
 
 
 class TestListProducts:
@@ -9,7 +13,8 @@ class TestListProducts:
         response = client.get("/products")
 
         assert response.status_code == 200
-        assert response.json == []
+        assert response.json["products"] == []
+        assert response.json["next_cursor"] is None
 
     def test_list_products(self, client, auth_headers):
         # listar produtos disponíveis
@@ -24,14 +29,14 @@ class TestListProducts:
         response = client.get("/products")
 
         assert response.status_code == 200
-        assert len(response.json) == 3
-        assert all("id" in p for p in response.json)
-        assert all("title" in p for p in response.json)
+        assert len(response.json["products"]) == 3
+        assert all("id" in p for p in response.json["products"])
+        assert all("title" in p for p in response.json["products"])
         # verifica owner é objeto completo
-        assert all("owner" in p for p in response.json)
-        assert all(isinstance(p["owner"], dict) for p in response.json)
-        assert all("email" in p["owner"] for p in response.json)
-        assert all("cellphone" in p["owner"] for p in response.json)
+        assert all("owner" in p for p in response.json["products"])
+        assert all(isinstance(p["owner"], dict) for p in response.json["products"])
+        assert all("email" in p["owner"] for p in response.json["products"])
+        assert all("cellphone" in p["owner"] for p in response.json["products"])
 
     def test_list_products_excludes_sold(self, client, auth_headers, second_user_headers):
         # excluir produtos já vendidos
@@ -40,7 +45,7 @@ class TestListProducts:
         product_id = response.json["product"]["id"]
 
         response = client.get("/products")
-        assert len(response.json) == 1
+        assert len(response.json["products"]) == 1
 
         # owner gera código e buyer confirma
         gen_response = client.post(f"/products/{product_id}/generate-code", headers=auth_headers)
@@ -51,7 +56,7 @@ class TestListProducts:
 
         # verifica que não aparece mais na listagem
         response = client.get("/products")
-        assert len(response.json) == 0
+        assert len(response.json["products"]) == 0
 
     def test_search_products_by_title(self, client, auth_headers):
         # buscar produtos por título
@@ -65,8 +70,8 @@ class TestListProducts:
 
         response = client.get("/products?q=iPhone")
         assert response.status_code == 200
-        assert len(response.json) == 1
-        assert "iPhone" in response.json[0]["title"]
+        assert len(response.json["products"]) == 1
+        assert "iPhone" in response.json["products"][0]["title"]
 
     def test_search_products_by_description(self, client, auth_headers):
         # Deve buscar produtos por descrição
@@ -81,8 +86,8 @@ class TestListProducts:
 
         response = client.get("/products?q=Tablet")
         assert response.status_code == 200
-        assert len(response.json) == 1
-        assert "Tablet" in response.json[0]["description"]
+        assert len(response.json["products"]) == 1
+        assert "Tablet" in response.json["products"][0]["description"]
 
     def test_search_products_case_insensitive(self, client, auth_headers):
         # busca case insensitive
@@ -92,7 +97,7 @@ class TestListProducts:
         # busca com minúsculas
         response = client.get("/products?q=iphone")
         assert response.status_code == 200
-        assert len(response.json) == 1
+        assert len(response.json["products"]) == 1
 
     def test_filter_products_by_category(self, client, auth_headers):
         # deve filtrar produtos por categoria
@@ -107,13 +112,13 @@ class TestListProducts:
 
         response = client.get("/products?category=eletrônicos")
         assert response.status_code == 200
-        assert len(response.json) == 2
-        assert all(p["category"] == "eletrônicos" for p in response.json)
+        assert len(response.json["products"]) == 2
+        assert all(p["category"] == "eletrônicos" for p in response.json["products"])
 
         response = client.get("/products?category=móveis")
         assert response.status_code == 200
-        assert len(response.json) == 1
-        assert response.json[0]["category"] == "móveis"
+        assert len(response.json["products"]) == 1
+        assert response.json["products"][0]["category"] == "móveis"
 
     def test_filter_products_by_estado_de_conservacao(self, client, auth_headers):
         # deve filtrar produtos por estado de conservação
@@ -129,13 +134,13 @@ class TestListProducts:
 
         response = client.get("/products?estado_de_conservacao=novo")
         assert response.status_code == 200
-        assert len(response.json) == 2
-        assert all(p["estado_de_conservacao"] == "novo" for p in response.json)
+        assert len(response.json["products"]) == 2
+        assert all(p["estado_de_conservacao"] == "novo" for p in response.json["products"])
 
         response = client.get("/products?estado_de_conservacao=seminovo")
         assert response.status_code == 200
-        assert len(response.json) == 1
-        assert response.json[0]["estado_de_conservacao"] == "seminovo"
+        assert len(response.json["products"]) == 1
+        assert response.json["products"][0]["estado_de_conservacao"] == "seminovo"
 
     def test_filter_products_combined(self, client, auth_headers):
         # filtrar produtos combinando categoria e estado
@@ -150,8 +155,345 @@ class TestListProducts:
 
         response = client.get("/products?category=eletrônicos&estado_de_conservacao=novo")
         assert response.status_code == 200
-        assert len(response.json) == 2
-        assert all(p["category"] == "eletrônicos" and p["estado_de_conservacao"] == "novo" for p in response.json)
+        assert len(response.json["products"]) == 2
+        assert all(p["category"] == "eletrônicos" and p["estado_de_conservacao"] == "novo" for p in response.json["products"])
+
+
+class TestListProductsPagination:
+    # paginação por cursor (GET /products?limit=&cursor=)
+
+    def test_paginate_through_all_products(self, client, auth_headers, create_products):
+        # percorre todas as páginas sem repetir nem perder produtos
+        create_products(auth_headers, 5)
+
+        seen = []
+        cursor = None
+        pages = 0
+        while True:
+            url = "/products?limit=2" + (f"&cursor={cursor}" if cursor else "")
+            response = client.get(url)
+            assert response.status_code == 200
+            assert len(response.json["products"]) <= 2
+            seen += [p["id"] for p in response.json["products"]]
+            pages += 1
+            cursor = response.json["next_cursor"]
+            if not cursor:
+                break
+
+        assert pages == 3
+        assert len(seen) == 5
+        assert len(set(seen)) == 5
+
+    def test_paginate_orders_most_recent_first(self, client, auth_headers, create_products):
+        # páginas seguem a ordem de criação decrescente
+        create_products(auth_headers, 3)
+
+        response = client.get("/products?limit=3")
+        titles = [p["title"] for p in response.json["products"]]
+        assert titles == ["Produto 2", "Produto 1", "Produto 0"]
+        assert response.json["next_cursor"] is None
+
+    def test_paginate_ties_on_created_at(self, client, auth_headers, create_products):
+        # produtos com o mesmo created_at são desempatados pelo id
+        create_products(auth_headers, 4)
+        Product.objects.update(set__created_at=datetime(2025, 1, 1))
+
+        first = client.get("/products?limit=2")
+        second = client.get(f"/products?limit=2&cursor={first.json['next_cursor']}")
+
+        ids = [p["id"] for p in first.json["products"] + second.json["products"]]
+        assert len(set(ids)) == 4
+        assert second.json["next_cursor"] is None
+
+    def test_invalid_limit(self, client):
+        # limit fora do intervalo retorna 400
+        assert client.get("/products?limit=0").status_code == 400
+        assert client.get("/products?limit=101").status_code == 400
+        assert client.get("/products?limit=abc").status_code == 400
+
+    def test_invalid_cursor(self, client):
+        # cursor malformado retorna 400
+        response = client.get("/products?cursor=nao-e-um-cursor")
+        assert response.status_code == 400
+        assert "error" in response.json
+
+    def test_list_products_loads_users_in_one_query(self, client, auth_headers, second_user_headers, collection_reads):
+        # owner/buyer são carregados em lote: o número de consultas não depende do tamanho da página
+        for i in range(3):
+            p = {"title": f"Produto {i}", "description": "Desc", "price": 10.0, "category": "outros", "estado_de_conservacao": "usado"}
+            client.post("/products", json=p, headers=auth_headers)
+            client.post("/products", json=p, headers=second_user_headers)
+
+        collection_reads.clear()
+        response = client.get("/products?limit=2")
+        small_page = dict(collection_reads)
+
+        collection_reads.clear()
+        response = client.get("/products?limit=6")
+        large_page = dict(collection_reads)
+
+        assert len(response.json["products"]) == 6
+        assert small_page == large_page
+        assert large_page["users"] == 1
+
+
+class TestListProductsFields:
+    # representação resumida e campos esparsos (GET /products?view=&fields=)
+
+    def test_summary_view(self, client, auth_headers, sample_product):
+        response = client.get("/products?view=summary")
+
+        assert response.status_code == 200
+        product = response.json["products"][0]
+        assert set(product) == {"id", "title", "price", "thumbnail", "category"}
+
+    def test_fields_param(self, client, auth_headers, sample_product):
+        response = client.get("/products?fields=title,price")
+
+        assert response.status_code == 200
+        assert set(response.json["products"][0]) == {"id", "title", "price"}
+
+    def test_invalid_fields(self, client):
+        response = client.get("/products?fields=title,password_hash")
+        assert response.status_code == 400
+        assert "password_hash" in response.json["error"]
+
+        assert client.get("/products?view=tiny").status_code == 400
+
+    def test_projection_is_pushed_to_mongo(self, client, auth_headers, sample_product, monkeypatch):
+        # a consulta ao Mongo pede apenas os campos necessários
+        projections = []
+        original_find = Collection.find
+
+        def spy(self, filter=None, projection=None, *args, **kwargs):
+            if self.name == "products":
+                projections.append(projection)
+            return original_find(self, filter, projection, *args, **kwargs)
+
+        monkeypatch.setattr(Collection, "find", spy)
+        client.get("/products?view=summary")
+
+        projection = projections[-1]
+        assert projection["images"] == {"$slice": 1}
+        assert "description" not in projection
+        assert "owner" not in projection
+
+    def test_summary_thumbnail_uses_first_image(self, client, auth_headers, sample_product):
+        Product.objects(id=sample_product["id"]).update(set__images=["a.jpg", "b.jpg"])
+
+        response = client.get("/products?view=summary")
+        assert response.json["products"][0]["thumbnail"] == "a.jpg"
+
+    def test_summary_view_paginates(self, client, auth_headers):
+        for i in range(3):
+            p = {"title": f"Produto {i}", "description": "Desc", "price": 10.0, "category": "outros", "estado_de_conservacao": "usado"}
+            client.post("/products", json=p, headers=auth_headers)
+
+        first = client.get("/products?view=summary&limit=2")
+        second = client.get(f"/products?view=summary&limit=2&cursor={first.json['next_cursor']}")
+
+        assert len(first.json["products"]) == 2
+        assert len(second.json["products"]) == 1
+
+
+class TestListProductsSortAndPrice:
+    # ordenação e faixa de preço (GET /products?sort=&min_price=&max_price=)
+
+    def test_sort_by_price(self, client, auth_headers, create_products):
+        create_products(auth_headers, prices=[300.0, 100.0, 200.0])
+
+        ascending = [p["price"] for p in client.get("/products?sort=price").json["products"]]
+        descending = [p["price"] for p in client.get("/products?sort=-price").json["products"]]
+
+        assert ascending == [100.0, 200.0, 300.0]
+        assert descending == [300.0, 200.0, 100.0]
+
+    def test_sort_oldest_first(self, client, auth_headers, create_products):
+        create_products(auth_headers, prices=[1.0, 2.0, 3.0])
+
+        titles = [p["title"] for p in client.get("/products?sort=created_at").json["products"]]
+        assert titles == ["Produto 0", "Produto 1", "Produto 2"]
+
+    def test_sort_featured_first(self, client, auth_headers, create_products):
+        ids = create_products(auth_headers, prices=[1.0, 2.0, 3.0])
+        Product.objects(id=ids[0]).update(set__em_destaque=True)
+
+        products = client.get("/products?sort=featured").json["products"]
+        assert [p["id"] for p in products] == [ids[0], ids[2], ids[1]]
+
+    def test_sort_popular(self, client, auth_headers, second_user_headers, create_products):
+        ids = create_products(auth_headers, prices=[1.0, 2.0, 3.0])
+        for headers in (auth_headers, second_user_headers):
+            client.post(f"/products/{ids[0]}/favorite", headers=headers)
+        client.post(f"/products/{ids[1]}/favorite", headers=auth_headers)
+
+        products = client.get("/products?sort=popular").json["products"]
+        assert [p["id"] for p in products] == [ids[0], ids[1], ids[2]]
+        assert [p["favorites_count"] for p in products] == [2, 1, 0]
+
+    def test_favorite_refreshes_cached_listing(self, client, auth_headers, create_products):
+        """Favoritar/desfavoritar invalida a listagem em cache (contagem e ordem)"""
+        ids = create_products(auth_headers, prices=[1.0, 2.0])
+        first = client.get("/products?sort=popular")
+        assert [p["favorites_count"] for p in first.json["products"]] == [0, 0]
+
+        client.post(f"/products/{ids[0]}/favorite", headers=auth_headers)
+
+        response = client.get("/products?sort=popular", headers={"If-None-Match": first.headers["ETag"]})
+        assert response.status_code == 200
+        assert [(p["id"], p["favorites_count"]) for p in response.json["products"]] == [(ids[0], 1), (ids[1], 0)]
+
+        client.delete(f"/products/{ids[0]}/favorite", headers=auth_headers)
+
+        products = client.get("/products?sort=popular").json["products"]
+        assert [p["favorites_count"] for p in products] == [0, 0]
+
+    def test_popular_pagination_over_legacy_products(self, client, auth_headers, runner):
+        """Produtos sem favorites_count (anteriores ao campo) não somem das páginas"""
+        owner = User.objects.get(email="test@example.com")
+        Product._get_collection().insert_many([
+            {"title": f"t{i}", "price": 1.0, "category": "outros", "estado_de_conservacao": "usado",
+             "owner": owner.id, "buyer": None, "created_at": datetime(2024, 1, 10 - i)}
+            for i in range(5)
+        ])
+
+        assert "produtos corrigidos: 5" in runner.invoke(args=["reconcile-favorites"]).output
+
+        seen = []
+        cursor = None
+        while True:
+            url = "/products?sort=popular&limit=2" + (f"&cursor={cursor}" if cursor else "")
+            body = client.get(url).json
+            seen += [p["title"] for p in body["products"]]
+            cursor = body["next_cursor"]
+            if not cursor:
+                break
+
+        assert seen == ["t0", "t1", "t2", "t3", "t4"]
+
+    def test_price_pagination_with_ties(self, client, auth_headers, create_products):
+        create_products(auth_headers, prices=[50.0, 10.0, 50.0, 50.0, 20.0])
+
+        seen = []
+        cursor = None
+        while True:
+            url = "/products?sort=price&limit=2" + (f"&cursor={cursor}" if cursor else "")
+            body = client.get(url).json
+            seen += [(p["price"], p["id"]) for p in body["products"]]
+            cursor = body["next_cursor"]
+            if not cursor:
+                break
+
+        assert [price for price, _ in seen] == [10.0, 20.0, 50.0, 50.0, 50.0]
+        assert len({product_id for _, product_id in seen}) == 5
+
+    def test_price_range(self, client, auth_headers, create_products):
+        create_products(auth_headers, prices=[10.0, 50.0, 100.0, 500.0])
+
+        prices = [p["price"] for p in client.get("/products?min_price=50&max_price=100&sort=price").json["products"]]
+        assert prices == [50.0, 100.0]
+
+        prices = [p["price"] for p in client.get("/products?min_price=101").json["products"]]
+        assert prices == [500.0]
+
+    def test_invalid_sort_and_price(self, client):
+        assert client.get("/products?sort=title").status_code == 400
+        assert client.get("/products?min_price=abc").status_code == 400
+        for raw in ("nan", "inf", "-inf"):
+            response = client.get(f"/products?min_price={raw}")
+            assert response.status_code == 400
+            assert response.json["error"] == "min_price deve ser um número"
+        assert client.get("/products?max_price=nan").status_code == 400
+        assert client.get("/products?max_price=-1").status_code == 400
+        assert client.get("/products?min_price=10&max_price=5").status_code == 400
+
+    def test_cursor_from_another_sort_is_rejected(self, client, auth_headers, create_products):
+        create_products(auth_headers, prices=[1.0, 2.0, 3.0])
+        cursor = client.get("/products?limit=1").json["next_cursor"]
+
+        assert client.get(f"/products?sort=price&cursor={cursor}").status_code == 400
+
+    def test_facets_honor_price_range(self, client, auth_headers, create_products):
+        create_products(auth_headers, prices=[10.0, 500.0])
+
+        facets = client.get("/products/facets?max_price=100").json
+        assert facets["category"]["outros"] == 1
+
+
+class TestProductFacets:
+    # contagem por categoria e estado (GET /products/facets)
+
+    def test_facets_empty(self, client):
+        response = client.get("/products/facets")
+
+        assert response.status_code == 200
+        assert response.json["category"] == {"eletrodomésticos": 0, "eletrônicos": 0, "móveis": 0, "outros": 0}
+        assert response.json["estado_de_conservacao"] == {"novo": 0, "seminovo": 0, "usado": 0}
+
+    def test_first_write_keeps_existing_catalog(self, client, auth_headers, create_products):
+        """Produtos anteriores aos contadores entram na contagem da primeira escrita"""
+        owner = User.objects.get(email="test@example.com")
+        for i in range(3):
+            Product(title=f"Antigo {i}", price=10.0, category="móveis", estado_de_conservacao="usado", owner=owner).save()
+        FacetCounts.objects.delete()
+
+        create_products(auth_headers, category="outros", estado_de_conservacao="novo")
+
+        facets = client.get("/products/facets").json
+        assert facets["category"]["móveis"] == 3
+        assert facets["category"]["outros"] == 1
+        assert facets["estado_de_conservacao"]["usado"] == 3
+
+    def test_facets_follow_writes(self, client, auth_headers, second_user_headers, create_products):
+        first = create_products(auth_headers, category="móveis", estado_de_conservacao="usado")[0]
+        second = create_products(auth_headers, category="móveis", estado_de_conservacao="novo")[0]
+        third = create_products(auth_headers, category="eletrônicos", estado_de_conservacao="novo")[0]
+
+        facets = client.get("/products/facets").json
+        assert facets["category"]["móveis"] == 2
+        assert facets["estado_de_conservacao"]["novo"] == 2
+
+        # edição move o produto de categoria
+        client.patch(f"/products/{first}", json={"category": "outros"}, headers=auth_headers)
+        # remoção e venda tiram o produto dos disponíveis
+        client.delete(f"/products/{second}", headers=auth_headers)
+        code = client.post(f"/products/{third}/generate-code", headers=auth_headers).json["confirmation_code"]
+        client.post("/products/confirm-with-code", json={"confirmation_code": code}, headers=second_user_headers)
+
+        facets = client.get("/products/facets").json
+        assert facets["category"] == {"eletrodomésticos": 0, "eletrônicos": 0, "móveis": 0, "outros": 1}
+        assert facets["estado_de_conservacao"] == {"novo": 0, "seminovo": 0, "usado": 1}
+
+    def test_unfiltered_facets_do_not_aggregate(self, client, auth_headers, collection_reads, create_products):
+        create_products(auth_headers, category="móveis", estado_de_conservacao="usado")
+
+        collection_reads.clear()
+        client.get("/products/facets")
+
+        assert collection_reads["products"] == 0
+        assert collection_reads["product_facets"] == 1
+
+    def test_filtered_facets(self, client, auth_headers, create_products):
+        create_products(auth_headers, category="móveis", estado_de_conservacao="usado", title="Mesa de madeira")
+        create_products(auth_headers, category="móveis", estado_de_conservacao="novo", title="Cadeira")
+        create_products(auth_headers, category="outros", estado_de_conservacao="novo", title="Mesa de ping pong")
+
+        facets = client.get("/products/facets?q=mesa").json
+        assert facets["category"] == {"eletrodomésticos": 0, "eletrônicos": 0, "móveis": 1, "outros": 1}
+
+        facets = client.get("/products/facets?estado_de_conservacao=novo").json
+        assert facets["category"]["móveis"] == 1
+        assert facets["estado_de_conservacao"] == {"novo": 2, "seminovo": 0, "usado": 0}
+
+    def test_rebuild_facets_command(self, client, auth_headers, runner, create_products):
+        create_products(auth_headers, category="móveis", estado_de_conservacao="usado")
+        FacetCounts.objects.delete()
+        Product.objects.update(set__category="outros")
+
+        result = runner.invoke(args=["rebuild-facets"])
+
+        assert result.exit_code == 0
+        assert client.get("/products/facets").json["category"]["outros"] == 1
 
 
 class TestCreateProduct:
@@ -364,6 +706,99 @@ class TestGetProduct:
         assert "error" in response.json
 
 
+class TestConditionalGet:
+    # Testes de ETag / If-None-Match (GET /products e GET /products/<product_id>)
+
+    def test_get_product_returns_etag(self, client, sample_product):
+        # Deve retornar ETag forte e Cache-Control
+        response = client.get(f"/products/{sample_product['id']}")
+
+        assert response.status_code == 200
+        assert response.headers["ETag"].startswith(f'"{sample_product["id"]}-')
+        assert response.headers["Cache-Control"] == "no-cache"
+
+    def test_get_product_not_modified(self, client, sample_product, collection_reads):
+        # Com If-None-Match igual ao ETag deve retornar 304 sem corpo
+        url = f"/products/{sample_product['id']}"
+        etag = client.get(url).headers["ETag"]
+
+        collection_reads.clear()
+        response = client.get(url, headers={"If-None-Match": etag})
+
+        assert response.status_code == 304
+        assert response.data == b""
+        assert response.headers["ETag"] == etag
+        # apenas a leitura do carimbo, sem carregar o owner
+        assert collection_reads["products"] == 1
+        assert collection_reads["users"] == 0
+
+    def test_etag_is_stable_without_updated_at(self, client, sample_product):
+        """Produtos gravados antes do carimbo usam created_at: o ETag não muda a cada GET"""
+        Product.objects(id=sample_product["id"]).update(unset__updated_at=True)
+        url = f"/products/{sample_product['id']}"
+
+        etag = client.get(url).headers["ETag"]
+
+        assert client.get(url).headers["ETag"] == etag
+        assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    def test_get_product_etag_changes_after_update(self, client, auth_headers, sample_product):
+        # Uma edição deve mudar o ETag e o If-None-Match antigo deve receber 200
+        url = f"/products/{sample_product['id']}"
+        Product.objects(id=sample_product["id"]).update(set__updated_at=datetime(2020, 1, 1))
+        etag = client.get(url).headers["ETag"]
+
+        client.patch(url, json={"price": 1.0}, headers=auth_headers)
+        response = client.get(url, headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert response.json["price"] == 1.0
+
+    def test_get_product_etag_changes_when_owner_changes(self, client, auth_headers, sample_product):
+        # Os dados do owner vêm embutidos: editar o perfil muda o ETag do produto
+        url = f"/products/{sample_product['id']}"
+        Product.objects(id=sample_product["id"]).update(set__updated_at=datetime(2020, 1, 1))
+        etag = client.get(url).headers["ETag"]
+
+        client.patch("/auth/me", json={"name": "Outro Nome"}, headers=auth_headers)
+        response = client.get(url, headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.json["owner"]["name"] == "Outro Nome"
+
+    def test_list_products_not_modified(self, client, sample_product):
+        # A listagem também responde 304 quando nada mudou
+        etag = client.get("/products").headers["ETag"]
+        response = client.get("/products", headers={"If-None-Match": etag})
+
+        assert response.status_code == 304
+        assert response.data == b""
+
+    def test_list_products_etag_changes_after_write(self, client, auth_headers, sample_product):
+        # Criar um produto invalida a listagem e gera outro ETag
+        etag = client.get("/products").headers["ETag"]
+        client.post("/products", json={
+            "title": "Outro",
+            "description": "Outro produto",
+            "price": 10.0,
+            "category": sample_product["category"],
+            "estado_de_conservacao": sample_product["estado_de_conservacao"],
+        }, headers=auth_headers)
+
+        response = client.get("/products", headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert len(response.json["products"]) == 2
+
+    def test_cache_control_max_age(self, app, client, sample_product):
+        # HTTP_CACHE_MAX_AGE permite cache no cliente/CDN
+        app.config["HTTP_CACHE_MAX_AGE"] = "60"
+        response = client.get(f"/products/{sample_product['id']}")
+
+        assert response.headers["Cache-Control"] == "public, max-age=60"
+
+
 class TestGenerateCode:
     # rota de geração de código (POST /products/<product_id>/generate-code)
 
@@ -390,6 +825,49 @@ class TestGenerateCode:
         assert response2.status_code == 200
         assert code1 == code2
 
+    def test_generate_code_retries_on_collision(self, client, auth_headers, sample_product, monkeypatch):
+        # um código repetido esbarra no índice único e outro é sorteado, sem consulta prévia
+        other = client.post("/products", json={
+            "title": "Outro", "description": "Desc", "price": 1.0,
+            "category": "outros", "estado_de_conservacao": "usado"
+        }, headers=auth_headers).json["product"]
+        Product.objects(id=other["id"]).update(set__confirmation_code="AAAAAAAA")
+
+        candidates = iter(["AAAAAAAA", "BBBBBBBB"])
+        monkeypatch.setattr(products_routes, "new_code", lambda *args: next(candidates))
+        response = client.post(f"/products/{sample_product['id']}/generate-code", headers=auth_headers)
+
+        assert response.status_code == 201
+        assert response.json["confirmation_code"] == "BBBBBBBB"
+
+    def test_generate_code_uses_configured_format(self, app, client, auth_headers, sample_product):
+        # tamanho e alfabeto vêm de CONFIRMATION_CODE_LENGTH/ALPHABET
+        app.config.update({"CONFIRMATION_CODE_LENGTH": "6", "CONFIRMATION_CODE_ALPHABET": "XYZ"})
+
+        code = client.post(f"/products/{sample_product['id']}/generate-code", headers=auth_headers).json["confirmation_code"]
+
+        assert len(code) == 6
+        assert set(code) <= set("XYZ")
+
+    def test_concurrent_generation_returns_same_code(self, app, auth_headers, sample_product):
+        # chamadas simultâneas para o mesmo produto recebem o mesmo código
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+
+        barrier = threading.Barrier(8)
+
+        def generate(_):
+            with app.test_client() as c:
+                barrier.wait()
+                return c.post(f"/products/{sample_product['id']}/generate-code", headers=auth_headers).json
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(generate, range(8)))
+
+        codes = {result["confirmation_code"] for result in results}
+        assert len(codes) == 1
+        assert Product.objects.get(id=sample_product["id"]).confirmation_code in codes
+
     def test_generate_code_not_owner(self, client, second_user_headers, sample_product):
         # retornar erro 403 se não for o owner
         product_id = sample_product["id"]
@@ -496,6 +974,50 @@ class TestConfirmWithCode:
         assert response.status_code == 400
         assert "error" in response.json
 
+    def test_confirm_with_code_same_buyer_again(self, client, auth_headers, second_user_headers, sample_product):
+        # o mesmo comprador confirmando de novo recebe 200 e nada muda
+        code = client.post(f"/products/{sample_product['id']}/generate-code", headers=auth_headers).json["confirmation_code"]
+
+        first = client.post("/products/confirm-with-code", json={"confirmation_code": code}, headers=second_user_headers)
+        second = client.post("/products/confirm-with-code", json={"confirmation_code": code}, headers=second_user_headers)
+
+        assert first.status_code == second.status_code == 200
+        assert second.json["product"]["buyer"]["email"] == "buyer@example.com"
+        # o produto deixou de estar disponível uma única vez
+        assert client.get("/products/facets").json["category"]["eletrônicos"] == 0
+
+    def test_concurrent_confirmations_have_one_winner(self, app, client, auth_headers, sample_product):
+        # várias confirmações simultâneas do mesmo código: apenas uma vence
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+
+        code = client.post(f"/products/{sample_product['id']}/generate-code", headers=auth_headers).json["confirmation_code"]
+        buyers = []
+        for i in range(8):
+            user = {"email": f"buyer{i}@example.com", "name": f"Buyer {i}", "password": "buyerpass123", "cellphone": "+5511900000000"}
+            client.post("/auth/register", json=user)
+            token = client.post("/auth/login", json={"email": user["email"], "password": "buyerpass123"}).json["access_token"]
+            buyers.append((user["email"], {"Authorization": f"Bearer {token}"}))
+
+        barrier = threading.Barrier(len(buyers))
+
+        def confirm(buyer):
+            email, headers = buyer
+            with app.test_client() as c:
+                barrier.wait()
+                response = c.post("/products/confirm-with-code", json={"confirmation_code": code}, headers=headers)
+                return email, response.status_code
+
+        with ThreadPoolExecutor(max_workers=len(buyers)) as pool:
+            results = list(pool.map(confirm, buyers))
+
+        winners = [email for email, status in results if status == 200]
+        assert len(winners) == 1
+        assert sorted(status for _, status in results) == [200] + [400] * (len(buyers) - 1)
+        product = client.get(f"/products/{sample_product['id']}").json
+        assert product["buyer"]["email"] == winners[0]
+        assert client.get("/products/facets").json["category"]["eletrônicos"] == 0
+
     def test_confirm_with_code_without_code(self, client, second_user_headers):
         # deve retornar erro 400 sem código
         response = client.post("/products/confirm-with-code",
@@ -521,7 +1043,7 @@ class TestListProductsWithConfirmation:
         product_id = sample_product["id"]
 
         response = client.get("/products")
-        assert len(response.json) == 1
+        assert len(response.json["products"]) == 1
 
         # owner gera código e buyer confirma
         gen_response = client.post(f"/products/{product_id}/generate-code", headers=auth_headers)
@@ -532,7 +1054,7 @@ class TestListProductsWithConfirmation:
 
         # verifica que não aparece mais na listagem
         response = client.get("/products")
-        assert len(response.json) == 0
+        assert len(response.json["products"]) == 0
 
 
 class TestUpdateProduct:
@@ -790,6 +1312,105 @@ class TestFavorites:
         assert "error" in response.json
 
 
+    def test_favorite_membership(self, client, auth_headers, sample_product):
+        # GET /favorite indica se o produto está nos favoritos
+        url = f"/products/{sample_product['id']}/favorite"
+
+        assert client.get(url, headers=auth_headers).json == {"favorited": False}
+        client.post(url, headers=auth_headers)
+        assert client.get(url, headers=auth_headers).json == {"favorited": True}
+        client.delete(url, headers=auth_headers)
+        assert client.get(url, headers=auth_headers).json == {"favorited": False}
+
+    def test_favorite_membership_invalid_id(self, client, auth_headers):
+        response = client.get("/products/invalid_id/favorite", headers=auth_headers)
+
+        assert response.status_code == 400
+
+    def test_remove_favorite_single_round_trip(self, client, auth_headers, sample_product, collection_reads):
+        # a remoção não lê o usuário; o produto só no próprio findAndModify do contador
+        url = f"/products/{sample_product['id']}/favorite"
+        client.post(url, headers=auth_headers)
+
+        collection_reads.clear()
+        response = client.delete(url, headers=auth_headers)
+
+        assert response.status_code == 200
+        assert collection_reads["users"] == 0
+        # o mongomock implementa find_one_and_update com um find
+        assert collection_reads["products"] == 1
+
+    def test_concurrent_favorites_are_not_lost(self, app, auth_headers):
+        # toques simultâneos em produtos diferentes não sobrescrevem uns aos outros
+        from concurrent.futures import ThreadPoolExecutor
+
+        with app.test_client() as client:
+            ids = [
+                client.post("/products", json={
+                    "title": f"Produto {i}", "description": "Desc", "price": 10.0,
+                    "category": "outros", "estado_de_conservacao": "usado"
+                }, headers=auth_headers).json["product"]["id"]
+                for i in range(8)
+            ]
+
+        def favorite(product_id):
+            with app.test_client() as c:
+                return c.post(f"/products/{product_id}/favorite", headers=auth_headers).status_code
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            statuses = list(pool.map(favorite, ids + ids))
+
+        assert statuses.count(201) == 8
+        assert statuses.count(200) == 8
+        user = User.objects.no_dereference().get(email="test@example.com")
+        assert sorted(str(ref.id) for ref in user.favorites) == sorted(ids)
+
+    def test_deleted_product_leaves_favorites(self, client, auth_headers, second_user_headers, sample_product):
+        # deletar o produto o remove dos favoritos de todos os usuários
+        product_id = sample_product["id"]
+        client.post(f"/products/{product_id}/favorite", headers=second_user_headers)
+
+        client.delete(f"/products/{product_id}", headers=auth_headers)
+        response = client.get("/auth/me/favorites", headers=second_user_headers)
+
+        assert response.json["total"] == 0
+        assert response.json["favorites"] == []
+
+    def test_favorites_count_follows_toggles(self, client, auth_headers, second_user_headers, sample_product):
+        # favorites_count sobe e desce com add/remove, sem contar repetições
+        url = f"/products/{sample_product['id']}/favorite"
+        assert sample_product["favorites_count"] == 0
+
+        response = client.post(url, headers=auth_headers)
+        assert response.json["product"]["favorites_count"] == 1
+        client.post(url, headers=auth_headers)
+        client.post(url, headers=second_user_headers)
+        assert client.get(f"/products/{sample_product['id']}").json["favorites_count"] == 2
+
+        client.delete(url, headers=auth_headers)
+        client.delete(url, headers=auth_headers)
+        assert client.get(f"/products/{sample_product['id']}").json["favorites_count"] == 1
+
+    def test_deleted_account_leaves_favorites_count(self, client, auth_headers, second_user_headers, sample_product):
+        # ao deletar a conta, os favoritos do usuário deixam de contar
+        client.post(f"/products/{sample_product['id']}/favorite", headers=second_user_headers)
+
+        client.delete("/auth/me", json={"password": "buyerpass123"}, headers=second_user_headers)
+
+        assert client.get(f"/products/{sample_product['id']}").json["favorites_count"] == 0
+
+    def test_reconcile_favorites_command(self, client, auth_headers, second_user_headers, sample_product, runner):
+        # o comando corrige contadores divergentes a partir das listas dos usuários
+        product_id = sample_product["id"]
+        client.post(f"/products/{product_id}/favorite", headers=second_user_headers)
+        Product.objects(id=product_id).update(set__favorites_count=7)
+
+        result = runner.invoke(args=["reconcile-favorites"])
+
+        assert "produtos corrigidos: 1" in result.output
+        assert Product.objects.get(id=product_id).favorites_count == 1
+        assert "produtos corrigidos: 0" in runner.invoke(args=["reconcile-favorites"]).output
+
 class TestUploadProductImages:
     # testes para a rota de upload de imagens (POST /products/<product_id>/images)
 
@@ -829,7 +1450,7 @@ class TestUploadProductImages:
 
         response = client.get("/products")
         assert response.status_code == 200
-        assert len(response.json) > 0
-        for product in response.json:
+        assert len(response.json["products"]) > 0
+        for product in response.json["products"]:
             assert "images" in product
             assert "thumbnail" in product
@@ -0,0 +1,224 @@
+import base64
+import threading
+import time
+import pytest
+from app.models import Product, ImageJob
+from app.resilience import (
+    CircuitBreaker, Bulkhead, StorageGuard, CircuitOpenError, BulkheadFullError, CallTimeoutError,
+    CLOSED, OPEN, HALF_OPEN,
+)
+
+PNG_B64 = base64.b64encode(b"\x89PNG\r\n\x1a\nimagem-de-teste").decode()
+
+
+class FakeStorage:
+    # Armazenamento falso: falha, trava (até release) ou responde, e conta as chamadas
+    name = "fake"
+
+    def __init__(self, fail=False, hang=False):
+        self.fail = fail
+        self.hang = hang
+        self.calls = 0
+        self.release = threading.Event()
+
+    def upload(self, data, folder, name=None):
+        self.calls += 1
+        if self.hang:
+            self.release.wait(5)
+        if self.fail:
+            raise ConnectionError("storage indisponível")
+        return f"/uploads/{folder}/{name}.png"
+
+
+def _fail():
+    raise ConnectionError("falhou")
+
+
+class TestCircuitBreaker:
+
+    def test_opens_after_threshold(self, clock):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=clock)
+        for _ in range(2):
+            breaker.allow()
+            breaker.record_failure()
+        assert breaker.state == CLOSED
+
+        breaker.allow()
+        breaker.record_failure()
+
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.allow()
+        assert breaker.stats()["rejections"] == 1
+        assert breaker.stats()["opened"] == 1
+
+    def test_success_resets_failure_count(self, clock):
+        breaker = CircuitBreaker(failure_threshold=2, clock=clock)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        assert breaker.state == CLOSED
+
+    def test_half_open_allows_a_single_probe(self, clock):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+
+        clock.now = 10
+        assert breaker.state == HALF_OPEN
+        breaker.allow()
+        # só uma sonda por vez
+        with pytest.raises(CircuitOpenError):
+            breaker.allow()
+
+        breaker.record_success()
+        assert breaker.state == CLOSED
+        breaker.allow()
+
+    def test_failed_probe_reopens(self, clock):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        breaker.allow()
+
+        breaker.record_failure()
+
+        assert breaker.state == OPEN
+        clock.now = 15
+        with pytest.raises(CircuitOpenError):
+            breaker.allow()
+        assert breaker.stats()["opened"] == 2
+
+
+class TestBulkhead:
+
+    def test_rejects_when_full(self):
+        bulkhead = Bulkhead(max_concurrent=2, max_wait=0)
+        bulkhead.acquire()
+        bulkhead.acquire()
+
+        with pytest.raises(BulkheadFullError):
+            bulkhead.acquire()
+        assert bulkhead.stats() == {"max_concurrent": 2, "active": 2, "rejections": 1}
+
+        bulkhead.release()
+        bulkhead.acquire()
+
+
+class TestStorageGuard:
+
+    def test_timeout_frees_the_caller(self):
+        storage = FakeStorage(hang=True)
+        guard = StorageGuard(timeout=0.05, bulkhead=Bulkhead(max_concurrent=2, max_wait=0))
+
+        started = time.monotonic()
+        with pytest.raises(CallTimeoutError):
+            guard.call(storage.upload, b"x", folder="f", name="a")
+
+        assert time.monotonic() - started < 1
+        assert guard.stats()["timeouts"] == 1
+        # a chamada travada continua ocupando a vaga até terminar de fato
+        assert guard.bulkhead.stats()["active"] == 1
+        storage.release.set()
+        deadline = time.monotonic() + 5
+        while guard.bulkhead.stats()["active"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert guard.bulkhead.stats()["active"] == 0
+        guard.shutdown()
+
+    def test_hung_calls_fill_the_bulkhead(self):
+        storage = FakeStorage(hang=True)
+        guard = StorageGuard(
+            timeout=0.02,
+            breaker=CircuitBreaker(failure_threshold=10),
+            bulkhead=Bulkhead(max_concurrent=2, max_wait=0),
+        )
+        for name in ("a", "b"):
+            with pytest.raises(CallTimeoutError):
+                guard.call(storage.upload, b"x", folder="f", name=name)
+
+        # sem vagas: rejeita sem chegar ao armazenamento
+        with pytest.raises(BulkheadFullError):
+            guard.call(storage.upload, b"x", folder="f", name="c")
+        assert storage.calls == 2
+        storage.release.set()
+        guard.shutdown()
+
+    def test_breaker_fails_fast(self):
+        guard = StorageGuard(timeout=1, breaker=CircuitBreaker(failure_threshold=2))
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                guard.call(_fail)
+
+        with pytest.raises(CircuitOpenError):
+            guard.call(lambda: "ok")
+        stats = guard.stats()
+        assert stats["calls"] == 2
+        assert stats["failures"] == 2
+        assert stats["breaker"]["state"] == OPEN
+        guard.shutdown()
+
+    def test_bulkhead_rejection_releases_probe(self, clock):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=1, clock=clock)
+        bulkhead = Bulkhead(max_concurrent=1, max_wait=0)
+        guard = StorageGuard(timeout=1, breaker=breaker, bulkhead=bulkhead)
+        breaker.record_failure()
+        clock.now = 1
+        bulkhead.acquire()
+
+        with pytest.raises(BulkheadFullError):
+            guard.call(lambda: "ok")
+
+        bulkhead.release()
+        assert guard.call(lambda: "ok") == "ok"
+        assert breaker.state == CLOSED
+        guard.shutdown()
+
+
+class TestStorageResilience:
+    # o StorageGuard nos uploads de imagem
+
+    def test_open_circuit_skips_storage(self, app, client, auth_headers, sample_product):
+        app.config.update({"STORAGE_BREAKER_THRESHOLD": 2, "IMAGE_DEDUP": False})
+        storage = app.extensions["image_storage"] = FakeStorage(fail=True)
+        url = f"/products/{sample_product['id']}/images/batch"
+
+        for _ in range(2):
+            assert client.post(url, json={"images": [PNG_B64]}, headers=auth_headers).status_code == 502
+        response = client.post(url, json={"images": [PNG_B64]}, headers=auth_headers)
+
+        assert response.status_code == 502
+        assert "circuito aberto" in response.json["results"][0]["error"]
+        assert storage.calls == 2
+        metrics = client.get("/metrics").json["storage"]
+        assert metrics["breaker"]["state"] == "open"
+        assert metrics["breaker"]["rejections"] == 1
+
+    def test_slow_storage_times_out(self, app, client, auth_headers, sample_product):
+        app.config["STORAGE_TIMEOUT"] = 0.05
+        storage = app.extensions["image_storage"] = FakeStorage(hang=True)
+
+        started = time.monotonic()
+        response = client.post(f"/products/{sample_product['id']}/images/batch", json={"images": [PNG_B64]}, headers=auth_headers)
+        storage.release.set()
+
+        assert response.status_code == 502
+        assert "não respondeu" in response.json["results"][0]["error"]
+        assert time.monotonic() - started < 2
+        assert client.get("/metrics").json["storage"]["timeouts"] == 1
+
+    def test_rejected_job_keeps_its_attempts(self, app, client, auth_headers, sample_product):
+        # com o circuito aberto o job volta para a fila sem gastar tentativa
+        app.config.update({"BACKGROUND_TASKS_EAGER": True, "STORAGE_BREAKER_THRESHOLD": 1})
+        app.extensions["image_storage"] = FakeStorage(fail=True)
+        url = f"/products/{sample_product['id']}/images"
+        first = client.post(url, json={"image": PNG_B64}, headers=auth_headers).json["job"]
+        assert first["attempts"] == 1
+
+        job = client.post(url, json={"image": PNG_B64}, headers=auth_headers).json["job"]
+
+        assert job["status"] == "pending"
+        assert job["attempts"] == 0
+        assert "circuito aberto" in job["error"]
+        assert ImageJob.objects.get(id=job["id"]).data is not None
+        assert Product.objects.get(id=sample_product["id"]).images == []
@@ -0,0 +1,130 @@
+import uuid
+from datetime import datetime, timedelta
+from app.models import User, RevokedToken
+from app.revocation import BloomFilter, RevocationList
+
+
+def _login(client, email="test@example.com", password="testpassword123"):
+    tokens = client.post("/auth/login", json={"email": email, "password": password}).json
+    return {"Authorization": f"Bearer {tokens['access_token']}"}, tokens["refresh_token"]
+
+
+class TestBloomFilter:
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        items = [f"jti:{uuid.uuid4()}" for _ in range(1000)]
+        for item in items:
+            bloom.add(item)
+
+        assert all(item in bloom for item in items)
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for _ in range(1000):
+            bloom.add(f"jti:{uuid.uuid4()}")
+
+        false_positives = sum(f"jti:{uuid.uuid4()}" in bloom for _ in range(10000))
+
+        assert false_positives < 300
+
+
+class TestRevocation:
+    """Lista de revogação de JWT (app/revocation.py)"""
+
+    def test_common_case_does_not_query_revocations(self, client, auth_headers, collection_reads):
+        """Token não revogado: o filtro responde sem consultar revoked_tokens"""
+        client.get("/auth/me", headers=auth_headers)
+
+        collection_reads.clear()
+        for _ in range(5):
+            assert client.get("/auth/me", headers=auth_headers).status_code == 200
+
+        assert collection_reads["revoked_tokens"] == 0
+        assert client.get("/metrics").json["revocation"]["bloom_negatives"] >= 5
+
+    def test_logout_revokes_only_that_token(self, client, auth_headers):
+        other_headers, _ = _login(client)
+
+        assert client.post("/auth/logout", headers=auth_headers).status_code == 200
+
+        assert client.get("/auth/me", headers=auth_headers).status_code == 401
+        assert client.get("/auth/me", headers=other_headers).status_code == 200
+
+    def test_refresh_after_logout_is_rejected(self, client, auth_headers):
+        """O logout encerra a sessão: o refresh token do mesmo login não renova mais"""
+        headers, refresh_token = _login(client)
+
+        assert client.post("/auth/logout", headers=headers).status_code == 200
+
+        assert client.post("/auth/refresh", headers={"Authorization": f"Bearer {refresh_token}"}).status_code == 401
+
+    def test_logout_revokes_renewed_access_tokens(self, client, auth_headers):
+        """Access tokens emitidos por renovações da mesma sessão também caem"""
+        old_headers, refresh_token = _login(client)
+        renewed = client.post("/auth/refresh", headers={"Authorization": f"Bearer {refresh_token}"}).json
+        new_headers = {"Authorization": f"Bearer {renewed['access_token']}"}
+
+        assert client.post("/auth/logout", headers=new_headers).status_code == 200
+
+        assert client.get("/auth/me", headers=old_headers).status_code == 401
+        assert client.post("/auth/refresh", headers={"Authorization": f"Bearer {renewed['refresh_token']}"}).status_code == 401
+
+    def test_password_change_revokes_issued_tokens(self, client, auth_headers):
+        _, refresh_token = _login(client)
+
+        response = client.put("/auth/me", json={"password": "nova-senha-123", "current_password": "testpassword123"}, headers=auth_headers)
+
+        assert response.status_code == 200
+        assert client.get("/auth/me", headers=auth_headers).status_code == 401
+        assert client.post("/auth/refresh", headers={"Authorization": f"Bearer {refresh_token}"}).status_code == 401
+        # a resposta traz tokens novos, emitidos depois do carimbo
+        new_headers = {"Authorization": f"Bearer {response.json['access_token']}"}
+        assert client.get("/auth/me", headers=new_headers).status_code == 200
+        assert client.post("/auth/refresh", headers={"Authorization": f"Bearer {response.json['refresh_token']}"}).status_code == 200
+
+    def test_profile_update_keeps_tokens(self, client, auth_headers):
+        client.put("/auth/me", json={"name": "Outro"}, headers=auth_headers)
+
+        assert client.get("/auth/me", headers=auth_headers).status_code == 200
+
+    def test_delete_me_revokes_tokens(self, client, auth_headers):
+        other_headers, _ = _login(client)
+
+        client.delete("/auth/me", json={"password": "testpassword123"}, headers=auth_headers)
+
+        assert client.get("/auth/me", headers=other_headers).status_code == 401
+
+    def test_revocations_from_other_processes_are_synced(self, app, client, auth_headers):
+        """Revogações gravadas por outro processo entram no filtro na próxima carga"""
+        app.config["REVOCATION_SYNC_INTERVAL"] = 0
+        client.get("/auth/me", headers=auth_headers)
+        user = User.objects.get(email="test@example.com")
+
+        now = datetime.utcnow()
+        RevokedToken(kind="user", key=str(user.id), not_before=now, expires_at=now + timedelta(days=1)).save()
+
+        assert client.get("/auth/me", headers=auth_headers).status_code == 401
+
+    def test_filter_is_loaded_from_collection(self, app, client, auth_headers):
+        """Um processo novo carrega as revogações existentes"""
+        client.post("/auth/logout", headers=auth_headers)
+
+        app.extensions["revocation_list"] = RevocationList()
+
+        assert client.get("/auth/me", headers=auth_headers).status_code == 401
+
+    def test_false_positive_is_cached(self, app, client, auth_headers, collection_reads, monkeypatch):
+        """Um "talvez" do filtro consulta o banco uma vez; depois o LRU responde"""
+        client.get("/auth/me", headers=auth_headers)  # carga inicial do filtro
+        monkeypatch.setattr(BloomFilter, "__contains__", lambda self, item: True)
+
+        collection_reads.clear()
+        for _ in range(3):
+            assert client.get("/auth/me", headers=auth_headers).status_code == 200
+
+        # jti, família e carimbo do usuário, uma consulta cada
+        assert collection_reads["revoked_tokens"] == 3
+        stats = client.get("/metrics", headers=auth_headers).json["revocation"]
+        assert stats["false_positives"] == 3
+        assert stats["lru_hits"] >= 4
@@ -0,0 +1,108 @@
+import operator
+import pytest
+from functools import reduce
+from types import SimpleNamespace
+from mongoengine.queryset.base import BaseQuerySet
+from mongoengine.queryset.visitor import Q
+from app.search import tokenize, fold, MemorySearchBackend
+
+
+def _text_or(self, text, language=None):
+    # mongomock não implementa $text: emula o OU entre os termos do MongoDB
+    terms = [Q(title__icontains=t) | Q(description__icontains=t) for t in text.split()]
+    return self.filter(reduce(operator.or_, terms))
+
+
+class TestTokenizer:
+    # normalização de texto usada pelo índice de busca
+
+    def test_fold_removes_accents(self):
+        assert fold("Sofá Retrátil Eletrônico") == "sofa retratil eletronico"
+
+    def test_tokenize_drops_stopwords(self):
+        assert tokenize("Mesa de jantar com cadeiras") == tokenize("mesa jantar cadeiras")
+
+    def test_tokenize_stems_plural_and_gender(self):
+        assert tokenize("geladeiras") == tokenize("Geladeira")
+        assert tokenize("televisões") == tokenize("televisão")
+        assert tokenize("usada") == tokenize("usado")
+
+    def test_tokenize_keeps_numbers(self):
+        assert "15" in tokenize("iPhone 15")
+
+
+class TestMemorySearchBackend:
+    # índice invertido em memória
+
+    def test_search_intersects_tokens(self):
+        backend = MemorySearchBackend()
+        backend.index(SimpleNamespace(id=1, title="iPhone 15", description="Smartphone Apple"))
+        backend.index(SimpleNamespace(id=2, title="iPad Pro", description="Tablet Apple"))
+
+        assert backend.search("apple") == {1, 2}
+        assert backend.search("apple tablet") == {2}
+        assert backend.search("android") == set()
+
+    def test_reindex_replaces_old_tokens(self):
+        backend = MemorySearchBackend()
+        backend.index(SimpleNamespace(id=1, title="Notebook Dell", description=""))
+        backend.index(SimpleNamespace(id=1, title="Notebook Lenovo", description=""))
+
+        assert backend.search("dell") == set()
+        assert backend.search("lenovo") == {1}
+
+        backend.remove(1)
+        assert backend.search("notebook") == set()
+
+
+class TestProductSearch:
+    # busca via GET /products?q=
+
+    def test_search_ignores_accents_and_plural(self, client, auth_headers):
+        product_data = {"title": "Sofá retrátil", "description": "Duas almofadas", "price": 800.0, "category": "móveis", "estado_de_conservacao": "usado"}
+        client.post("/products", json=product_data, headers=auth_headers)
+
+        response = client.get("/products?q=sofas")
+        assert len(response.json["products"]) == 1
+
+        response = client.get("/products?q=almofada")
+        assert len(response.json["products"]) == 1
+
+    def test_search_reflects_updates(self, client, auth_headers, sample_product):
+        product_id = sample_product["id"]
+        client.patch(f"/products/{product_id}", json={"title": "Galaxy S24"}, headers=auth_headers)
+
+        assert len(client.get("/products?q=iphone").json["products"]) == 0
+        assert len(client.get("/products?q=galaxy").json["products"]) == 1
+
+    def test_search_excludes_deleted(self, client, auth_headers, sample_product):
+        client.delete(f"/products/{sample_product['id']}", headers=auth_headers)
+
+        assert len(client.get("/products?q=iphone").json["products"]) == 0
+
+    def test_search_only_stopwords_returns_empty(self, client, auth_headers, sample_product):
+        response = client.get("/products?q=de")
+        assert response.status_code == 200
+        assert response.json["products"] == []
+
+
+class TestSearchBackendSemantics:
+    # os dois backends respondem igual: todos os termos precisam aparecer
+
+    @pytest.fixture(params=["memory", "mongo"])
+    def search_client(self, request, app, client, monkeypatch):
+        app.config["SEARCH_BACKEND"] = request.param
+        app.extensions.pop("search_backend", None)
+        if request.param == "mongo":
+            monkeypatch.setattr(BaseQuerySet, "search_text", _text_or, raising=False)
+        return client
+
+    def test_all_terms_must_match(self, search_client, auth_headers):
+        for title, description in (("iPhone 15", "Smartphone Apple"), ("iPad Pro", "Tablet Apple"), ("Galaxy Tab", "Tablet Samsung")):
+            product = {"title": title, "description": description, "price": 10.0, "category": "eletrônicos", "estado_de_conservacao": "novo"}
+            search_client.post("/products", json=product, headers=auth_headers)
+
+        titles = lambda q: sorted(p["title"] for p in search_client.get(f"/products?q={q}").json["products"])
+        assert titles("apple") == ["iPad Pro", "iPhone 15"]
+        assert titles("apple tablet") == ["iPad Pro"]
+        assert titles("apple android") == []
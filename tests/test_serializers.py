@@ -0,0 +1,71 @@
+import pytest
+from app.cache import get_product_cache
+from app.models import Product
+from app.serializers import ProductRow, load_related_users
+
+
+@pytest.fixture
+def marketplace(client, auth_headers, second_user_headers):
+    """
+    Cria produtos variados: com e sem imagens/descrição, vendidos e favoritados.
+    """
+    ids = []
+    for i in range(4):
+        product = {"title": f"Produto {i}", "description": f"Desc {i}", "price": 10 + i, "category": "outros", "estado_de_conservacao": "usado"}
+        if i == 3:
+            del product["description"]
+        ids.append(client.post("/products", json=product, headers=auth_headers).json["product"]["id"])
+
+    Product.objects(id=ids[0]).update(set__images=["a.jpg", "b.jpg"])
+    code = client.post(f"/products/{ids[1]}/generate-code", headers=auth_headers).json["confirmation_code"]
+    client.post("/products/confirm-with-code", json={"confirmation_code": code}, headers=second_user_headers)
+    for product_id in ids:
+        client.post(f"/products/{product_id}/favorite", headers=second_user_headers)
+    return ids
+
+
+def _get_both(client, url, headers=None):
+    # Faz a mesma requisição pelo caminho padrão e pelo caminho cru
+    app = client.application
+    with app.app_context():
+        get_product_cache().enabled = False
+    app.config["RAW_READ_ENDPOINTS"] = ""
+    documents = client.get(url, headers=headers)
+    app.config["RAW_READ_ENDPOINTS"] = "products.list_products,auth.my_sales,auth.my_purchases,auth.my_favorites"
+    raw = client.get(url, headers=headers)
+    return documents, raw
+
+
+class TestRawReadPath:
+    # o caminho rápido (as_pymongo) gera exatamente os mesmos bytes que Product.to_dict()
+
+    @pytest.mark.parametrize("url", [
+        "/products",
+        "/products?limit=2",
+        "/products?view=summary",
+        "/products?fields=owner,buyer,created_at",
+    ])
+    def test_list_products_identical(self, client, marketplace, url):
+        documents, raw = _get_both(client, url)
+        assert documents.status_code == 200
+        assert documents.data == raw.data
+
+    @pytest.mark.parametrize("path", ["/auth/me/sales", "/auth/me/sales?view=summary"])
+    def test_sales_identical(self, client, auth_headers, marketplace, path):
+        documents, raw = _get_both(client, path, headers=auth_headers)
+        assert documents.json["total"] == 1
+        assert documents.data == raw.data
+
+    @pytest.mark.parametrize("path", ["/auth/me/purchases", "/auth/me/favorites", "/auth/me/favorites?fields=thumbnail"])
+    def test_buyer_lists_identical(self, client, second_user_headers, marketplace, path):
+        documents, raw = _get_both(client, path, headers=second_user_headers)
+        assert documents.status_code == 200
+        assert documents.data == raw.data
+
+    def test_rows_are_not_documents(self, app, marketplace):
+        rows = [ProductRow(row) for row in Product.objects.as_pymongo()]
+        users = load_related_users(rows)
+
+        assert len(rows) == 4
+        assert not hasattr(rows[0], "__dict__")
+        assert all(type(u).__name__ == "UserRow" for u in users.values())
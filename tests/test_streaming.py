@@ -0,0 +1,85 @@
+import json
+import pytest
+
+NDJSON = {"Accept": "application/x-ndjson"}
+
+
+def _sell_all(client, seller_headers, buyer_headers, ids):
+    for product_id in ids:
+        code = client.post(f"/products/{product_id}/generate-code", headers=seller_headers).json["confirmation_code"]
+        client.post("/products/confirm-with-code", json={"confirmation_code": code}, headers=buyer_headers)
+
+
+class TestStreamListProducts:
+    # GET /products em streaming (JSON em chunks e NDJSON)
+
+    def test_stream_matches_regular_response(self, client, auth_headers, create_products):
+        create_products(auth_headers, 3)
+
+        regular = client.get("/products")
+        streamed = client.get("/products?stream=true")
+
+        assert streamed.status_code == 200
+        assert streamed.is_streamed
+        assert streamed.mimetype == "application/json"
+        assert json.loads(streamed.data) == regular.json
+
+    def test_stream_paginates(self, client, auth_headers, create_products):
+        create_products(auth_headers, 3)
+
+        first = json.loads(client.get("/products?stream=true&limit=2").data)
+        second = json.loads(client.get(f"/products?stream=true&limit=2&cursor={first['next_cursor']}").data)
+
+        assert len(first["products"]) == 2
+        assert len(second["products"]) == 1
+        assert second["next_cursor"] is None
+
+    def test_ndjson(self, client, auth_headers, create_products):
+        create_products(auth_headers, 3)
+
+        response = client.get("/products?limit=2", headers=NDJSON)
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+
+        assert response.mimetype == "application/x-ndjson"
+        assert len(lines) == 3
+        assert all("title" in line for line in lines[:2])
+        assert lines[-1]["next_cursor"]
+
+    def test_stream_invalid_cursor(self, client):
+        assert client.get("/products?stream=true&cursor=xyz").status_code == 400
+
+
+class TestStreamMyLists:
+    # /auth/me/sales e /auth/me/purchases em streaming
+
+    @pytest.mark.parametrize("raw", [False, True])
+    def test_stream_sales_matches_regular(self, client, auth_headers, second_user_headers, raw, create_products):
+        if raw:
+            client.application.config["RAW_READ_ENDPOINTS"] = "auth.my_sales"
+        _sell_all(client, auth_headers, second_user_headers, create_products(auth_headers, 3))
+
+        regular = client.get("/auth/me/sales", headers=auth_headers)
+        streamed = client.get("/auth/me/sales?stream=1", headers=auth_headers)
+
+        assert json.loads(streamed.data) == regular.json
+
+    def test_stream_purchases_ndjson(self, client, auth_headers, second_user_headers, create_products):
+        _sell_all(client, auth_headers, second_user_headers, create_products(auth_headers, 2))
+
+        response = client.get("/auth/me/purchases", headers={**second_user_headers, **NDJSON})
+        lines = [json.loads(line) for line in response.data.decode().splitlines()]
+
+        assert [line["purchase_info"]["seller"]["email"] for line in lines[:-1]] == ["test@example.com"] * 2
+        assert lines[-1] == {"total": 2}
+
+    def test_stream_loads_users_per_batch(self, client, auth_headers, second_user_headers, collection_reads, create_products):
+        # uma consulta de usuários por lote, independente do total de itens
+        client.application.config["STREAM_BATCH_SIZE"] = 2
+        _sell_all(client, auth_headers, second_user_headers, create_products(auth_headers, 5))
+
+        collection_reads.clear()
+        response = client.get("/auth/me/sales?stream=true", headers=auth_headers)
+
+        assert json.loads(response.data)["total"] == 5
+        # 3 lotes (2 + 2 + 1); o usuário autenticado vem do cache de identidade
+        assert collection_reads["users"] == 3